@@ -1,16 +1,71 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import (Flask, abort, jsonify, render_template, request, redirect, url_for, flash, Response,
+                   stream_with_context, session,
+                   g, has_request_context, before_render_template, template_rendered)
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from datetime import datetime, timedelta
-from apscheduler.schedulers.background import BackgroundScheduler
-from twilio.rest import Client
+from datetime import date, datetime, timedelta, timezone
 import os
 from dotenv import load_dotenv
 from flask_wtf.csrf import CSRFProtect
-from flask_migrate import Migrate
+from flask_migrate import Migrate, stamp
+import click
+import base64
+import csv
+import io
+import json
+import logging
+import sys
+import atexit
+import random
+import re
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict, namedtuple
+from contextlib import contextmanager
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, wait
+from sqlalchemy.engine import Engine
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+from alembic.script import ScriptDirectory
 
 load_dotenv()
 
+# Structured logging: LOG_FORMAT=json emits one JSON object per line,
+# otherwise events are written as "event key=value ..." text
+class StructuredFormatter(logging.Formatter):
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def __init__(self, as_json=False):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record):
+        fields = {key: value for key, value in vars(record).items() if key not in self.RESERVED}
+        if self.as_json:
+            payload = {'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), 'level': record.levelname,
+                       'logger': record.name, 'event': record.getMessage(), **fields}
+            if record.exc_info:
+                payload['exc'] = self.formatException(record.exc_info)
+            return json.dumps(payload, default=str)
+        line = f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} {record.levelname} {record.getMessage()}"
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+logger = logging.getLogger('gym')
+_log_handler = logging.StreamHandler(sys.stderr)
+_log_handler.setFormatter(StructuredFormatter(as_json=os.getenv('LOG_FORMAT') == 'json'))
+logger.addHandler(_log_handler)
+logger.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+logger.propagate = False
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', os.urandom(24))
 
@@ -24,20 +79,362 @@ if DATABASE_URL and DATABASE_URL.startswith("postgres://"):
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URL or 'sqlite:///gym.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Print database URL for debugging (without sensitive information)
+# Log database URL for debugging (without sensitive information)
 if DATABASE_URL:
     masked_url = DATABASE_URL.split('@')[0] + '@*****' if '@' in DATABASE_URL else '*****'
-    print(f"Using database: {masked_url}")
+    logger.info("database configured", extra={'url': masked_url})
 else:
-    print("Using SQLite database: gym.db")
+    logger.info("database configured", extra={'url': 'sqlite:///gym.db'})
+
+# Engine tuning profile: 'tuned' sizes the Postgres pool for the number of
+# gunicorn workers and runs SQLite in WAL mode; 'default' keeps SQLAlchemy's
+# stock engine settings
+app.config['DB_ENGINE_PROFILE'] = os.getenv('DB_ENGINE_PROFILE', 'tuned')
+app.config['WEB_CONCURRENCY'] = int(os.getenv('WEB_CONCURRENCY', 4))
+# Connections the database allows this service across all workers (Postgres)
+app.config['DB_MAX_CONNECTIONS'] = int(os.getenv('DB_MAX_CONNECTIONS', 20))
+app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', 0))  # 0: what fits DB_MAX_CONNECTIONS, see below
+app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', 2))
+app.config['DB_POOL_RECYCLE_SECONDS'] = int(os.getenv('DB_POOL_RECYCLE_SECONDS', 1800))
+app.config['DB_POOL_TIMEOUT_SECONDS'] = int(os.getenv('DB_POOL_TIMEOUT_SECONDS', 10))
+# Bounds statements run for web requests; CLI commands, migrations and jobs are not limited
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))  # 0 disables
+# SQLite: how long a writer waits for the lock, and per-connection memory map and page cache
+app.config['DB_BUSY_TIMEOUT_MS'] = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+app.config['SQLITE_MMAP_MB'] = int(os.getenv('SQLITE_MMAP_MB', 128))
+app.config['SQLITE_CACHE_MB'] = int(os.getenv('SQLITE_CACHE_MB', 16))
+
+def engine_options(url, config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured engine profile"""
+    if config['DB_ENGINE_PROFILE'] != 'tuned':
+        return {}
+    if url.startswith('sqlite'):
+        # Python-level wait for the write lock; PRAGMAs are set per connection below
+        return {'connect_args': {'timeout': config['DB_BUSY_TIMEOUT_MS'] / 1000}}
+    # Every worker may open pool_size + max_overflow connections; one more is
+    # left for the scheduler when it runs as its own process
+    per_worker = (config['DB_MAX_CONNECTIONS'] - 1) // max(config['WEB_CONCURRENCY'], 1)
+    pool_size, max_overflow = config['DB_POOL_SIZE'], config['DB_MAX_OVERFLOW']
+    if not pool_size:
+        pool_size = max(1, per_worker - max_overflow)
+        max_overflow = max(0, min(max_overflow, per_worker - pool_size))
+    options = {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': config['DB_POOL_RECYCLE_SECONDS'],
+        'pool_timeout': config['DB_POOL_TIMEOUT_SECONDS'],
+        'pool_pre_ping': True,
+    }
+    return options
+
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], app.config)
+
+# Optional read replica. Only endpoints and jobs listed in REPLICA_ROUTES read
+# from it, each with the replica lag (seconds) it tolerates; a user's requests
+# stay on the primary for REPLICA_STICKY_SECONDS after they write something.
+DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+    DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+if DATABASE_REPLICA_URL:
+    app.config['SQLALCHEMY_BINDS'] = {
+        'replica': {'url': DATABASE_REPLICA_URL, **engine_options(DATABASE_REPLICA_URL, app.config)}
+    }
+app.config['REPLICA_ROUTES'] = {
+    'view_customers': 10,
+    'view_customer': 5,
+    'customer_summary': 5,
+    'export_csv': 60,
+    'check_expiring_memberships': 60,
+    'analytics': 300,
+}
+# e.g. REPLICA_ROUTES="view_customers=30,export_csv=300"; a lag of -1 keeps that route on the primary
+for _route in filter(None, os.getenv('REPLICA_ROUTES', '').split(',')):
+    _name, _, _lag = _route.partition('=')
+    app.config['REPLICA_ROUTES'][_name.strip()] = float(_lag)
+app.config['REPLICA_STICKY_SECONDS'] = float(os.getenv('REPLICA_STICKY_SECONDS', 10))
+app.config['REPLICA_LAG_CHECK_SECONDS'] = float(os.getenv('REPLICA_LAG_CHECK_SECONDS', 5))
+
+class RoutingSession(FlaskSession):
+    """Session that sends lag-tolerant reads to the 'replica' bind.
+
+    A SELECT goes to the replica only while info['replica_max_lag'] is set
+    (per request from REPLICA_ROUTES, or by replica_reads() in jobs), the
+    measured lag is within it and the current transaction has not written.
+    Writes, locking reads, session.connection() and reads inside
+    primary_reads() always use the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and clause is not None:
+            if getattr(clause, 'is_dml', False):
+                self.info['in_write'] = self.info['wrote'] = True
+            elif (self.info.get('replica_max_lag', -1) >= 0 and not self.info.get('in_write')
+                  and 'replica' in self._db.engines and getattr(clause, 'is_select', False)
+                  and getattr(clause, '_for_update_arg', None) is None):
+                lag = replica_lag()
+                if lag is not None and lag <= self.info['replica_max_lag']:
+                    REPLICA_READS_TOTAL.inc(endpoint=current_endpoint())
+                    return self._db.engines['replica']
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
 
 # Initialize database
-db = SQLAlchemy(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+
+@db.event.listens_for(Engine, 'connect')
+def _tune_sqlite_connection(dbapi_connection, connection_record):
+    if app.config['DB_ENGINE_PROFILE'] != 'tuned' or not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    # WAL lets readers run alongside the single writer; NORMAL only syncs at checkpoints
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA busy_timeout={app.config['DB_BUSY_TIMEOUT_MS']}")
+    cursor.execute(f"PRAGMA mmap_size={app.config['SQLITE_MMAP_MB'] * 1024 * 1024}")
+    cursor.execute(f"PRAGMA cache_size=-{app.config['SQLITE_CACHE_MB'] * 1024}")
+    cursor.close()
+
+@db.event.listens_for(Engine, 'checkout')
+def _set_statement_timeout(dbapi_connection, connection_record, connection_proxy):
+    # Postgres only. A connection keeps the last timeout it was given, so it is
+    # only re-set when it moves between request and non-request work
+    if (app.config['DB_ENGINE_PROFILE'] != 'tuned' or app.config['DB_STATEMENT_TIMEOUT_MS'] <= 0
+            or isinstance(dbapi_connection, sqlite3.Connection)):
+        return
+    timeout = app.config['DB_STATEMENT_TIMEOUT_MS'] if has_request_context() else 0
+    if connection_record.info.get('statement_timeout', 0) == timeout:
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"SET statement_timeout = {timeout}")
+    cursor.close()
+    dbapi_connection.commit()
+    connection_record.info['statement_timeout'] = timeout
+
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
 # Initialize Flask-Migrate for database migrations
-migrate = Migrate(app, db)
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+migrate = Migrate(app, db, directory=MIGRATIONS_DIR)
+
+# Performance instrumentation
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 200))
+app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class Histogram:
+    """Thread-safe Prometheus histogram, one series per combination of label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = defaultdict(lambda: [[0] * len(self.buckets), 0.0, 0])
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            counts, _, _ = series = self._series[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} histogram'
+        with self._lock:
+            snapshot = [(key, list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        for key, counts, total, count in sorted(snapshot):
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, key))
+            prefix = labels + ',' if labels else ''
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield f'{self.name}_bucket{{{prefix}le="{bound}"}} {bucket_count}'
+            yield f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}'
+            yield f'{self.name}_sum{{{labels}}} {total}'
+            yield f'{self.name}_count{{{labels}}} {count}'
+
+class Counter:
+    """Thread-safe Prometheus counter keyed by label values"""
+
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        with self._lock:
+            self._values[key] += amount
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help_text}'
+        yield f'# TYPE {self.name} counter'
+        with self._lock:
+            snapshot = sorted(self._values.items())
+        for key, value in snapshot:
+            labels = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, key))
+            yield f'{self.name}{{{labels}}} {value}'
+
+REQUEST_SECONDS = Histogram('gym_request_duration_seconds', 'Wall time per request.', ('endpoint', 'method'))
+REQUESTS_TOTAL = Counter('gym_requests_total', 'Requests by endpoint and status.', ('endpoint', 'method', 'status'))
+REQUEST_SQL_STATEMENTS = Histogram('gym_request_sql_statements', 'SQL statements per request.',
+                                   ('endpoint',), COUNT_BUCKETS)
+REQUEST_SQL_SECONDS = Histogram('gym_request_sql_duration_seconds', 'Time spent in SQL per request.', ('endpoint',))
+TEMPLATE_SECONDS = Histogram('gym_template_render_seconds', 'Template render time.', ('template',))
+SMS_SEND_SECONDS = Histogram('gym_sms_send_seconds', 'Outbound SMS provider latency.', ('outcome',))
+SLOW_QUERIES_TOTAL = Counter('gym_slow_queries_total', 'Statements slower than SLOW_QUERY_MS.', ('endpoint',))
+CHECKINS_TOTAL = Counter('gym_checkins_total', 'Door scans by outcome.', ('result',))
+REPLICA_READS_TOTAL = Counter('gym_replica_reads_total', 'Statements routed to the read replica.', ('endpoint',))
+USER_CACHE_TOTAL = Counter('gym_user_cache_total', 'Logged-in user lookups by cache result.', ('result',))
+METRICS = (REQUEST_SECONDS, REQUESTS_TOTAL, REQUEST_SQL_STATEMENTS, REQUEST_SQL_SECONDS,
+           TEMPLATE_SECONDS, SMS_SEND_SECONDS, SLOW_QUERIES_TOTAL, CHECKINS_TOTAL, USER_CACHE_TOTAL,
+           REPLICA_READS_TOTAL)
+
+def current_endpoint():
+    if has_request_context() and request.url_rule is not None:
+        return request.url_rule.endpoint
+    return 'background' if not has_request_context() else 'unmatched'
+
+@db.event.listens_for(Engine, 'before_cursor_execute')
+def _start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the execution context, which is dropped with a failed statement,
+    # rather than on the pooled connection, which would outlive it
+    if context is not None:
+        context.statement_started = time.perf_counter()
+
+@db.event.listens_for(Engine, 'after_cursor_execute')
+def _record_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'statement_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    if has_request_context() and 'sql_count' in g:
+        g.sql_count += 1
+        g.sql_seconds += elapsed
+    if elapsed * 1000 >= app.config['SLOW_QUERY_MS']:
+        endpoint = current_endpoint()
+        SLOW_QUERIES_TOTAL.inc(endpoint=endpoint)
+        logger.warning("slow query", extra={'endpoint': endpoint, 'duration_ms': round(elapsed * 1000, 1),
+                                            'statement': ' '.join(statement.split())[:500]})
+
+@before_render_template.connect_via(app)
+def _start_template_timer(sender, template, context, **extra):
+    g.setdefault('template_started', []).append(time.perf_counter())
+
+@template_rendered.connect_via(app)
+def _record_template(sender, template, context, **extra):
+    started = g.get('template_started')
+    if started:
+        TEMPLATE_SECONDS.observe(time.perf_counter() - started.pop(), template=template.name)
+
+@app.before_request
+def _start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_count = 0
+    g.sql_seconds = 0.0
+
+@app.after_request
+def _record_request_metrics(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    endpoint = current_endpoint()
+    REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method)
+    REQUESTS_TOTAL.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    REQUEST_SQL_STATEMENTS.observe(g.sql_count, endpoint=endpoint)
+    REQUEST_SQL_SECONDS.observe(g.sql_seconds, endpoint=endpoint)
+    if endpoint != 'metrics':
+        logger.info("request", extra={
+            'method': request.method, 'path': request.path, 'endpoint': endpoint,
+            'status': response.status_code, 'duration_ms': round(elapsed * 1000, 1),
+            'sql_count': g.sql_count, 'sql_ms': round(g.sql_seconds * 1000, 1)})
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this worker's metrics"""
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    lines = [line for metric in METRICS for line in metric.render()]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+# Read replica routing
+REPLICA_LAG_SQL = {
+    # Zero when the replica has replayed everything it received, even if the primary is idle
+    'postgresql': "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                  "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END",
+}
+_replica_state = {'lag': None, 'checked_at': float('-inf')}
+
+def replica_lag():
+    """Seconds the replica is behind, or None when unreachable; measured every REPLICA_LAG_CHECK_SECONDS"""
+    state = _replica_state
+    if time.monotonic() - state['checked_at'] >= app.config['REPLICA_LAG_CHECK_SECONDS']:
+        engine = db.engines['replica']
+        try:
+            with engine.connect() as connection:
+                lag = connection.execute(db.text(REPLICA_LAG_SQL.get(engine.dialect.name, 'SELECT 0'))).scalar()
+            state['lag'] = float(lag or 0)
+        except OperationalError:
+            logger.warning("read replica unreachable, reading from the primary")
+            state['lag'] = None
+        state['checked_at'] = time.monotonic()
+    return state['lag']
+
+@contextmanager
+def replica_reads(name):
+    """Let reads in this block use the replica within REPLICA_ROUTES[name] seconds of lag"""
+    info = db.session.info
+    previous = info.get('replica_max_lag', -1)
+    info['replica_max_lag'] = app.config['REPLICA_ROUTES'].get(name, -1)
+    try:
+        yield
+    finally:
+        info['replica_max_lag'] = previous
+
+@contextmanager
+def primary_reads():
+    """Keep reads in this block on the primary, even inside a replica route.
+
+    For cache versions and the rows cached against them: a lagging replica
+    would hide an invalidation until the next bump.
+    """
+    info = db.session.info
+    previous = info.get('replica_max_lag', -1)
+    info['replica_max_lag'] = -1
+    try:
+        yield
+    finally:
+        info['replica_max_lag'] = previous
+
+@db.event.listens_for(db.session, 'after_flush')
+def _note_write(session, flush_context):
+    session.info['in_write'] = session.info['wrote'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+@db.event.listens_for(db.session, 'after_rollback')
+def _end_write(session):
+    session.info.pop('in_write', None)
+
+@app.before_request
+def _route_reads_to_replica():
+    if DATABASE_REPLICA_URL and session.get('primary_until', 0) < time.time():
+        db.session.info['replica_max_lag'] = app.config['REPLICA_ROUTES'].get(request.endpoint, -1)
+
+@app.after_request
+def _stick_to_primary_after_write(response):
+    # Read-your-writes: this user's next requests skip the replica until it has caught up
+    if DATABASE_REPLICA_URL and db.session.info.get('wrote'):
+        session['primary_until'] = time.time() + app.config['REPLICA_STICKY_SECONDS']
+    return response
 
 @app.cli.command("reset-db")
 def reset_db():
@@ -49,7 +446,8 @@ def reset_db():
         db.create_all()
         print("Database has been reset!")
 
-# Package Prices and Details
+# Default price catalog. The live prices are in the package_price table (seeded
+# with these values as catalog version 1) and are served by the pricing engine.
 PACKAGES = {
     'basic': {
         'name': 'BASIC PACKAGE',
@@ -101,34 +499,348 @@ PERSONAL_TRAINING = {
     }
 }
 
+# Per-month renewal charge of each package, and the treadmill add-on per month
+EXTENSION_MONTHLY_RATES = {'basic': 1500, 'standard': 2000, 'premium': 2500, 'ultimate': 3000}
+TREADMILL_MONTHLY_FEE = 500
+
+# How often a worker checks for a newly published price catalog
+app.config['CATALOG_CHECK_SECONDS'] = float(os.getenv('CATALOG_CHECK_SECONDS', 5))
+app.config['QUOTE_MAX_ITEMS'] = int(os.getenv('QUOTE_MAX_ITEMS', 10000))
+
+class CatalogItem(namedtuple('CatalogItem', 'kind code name duration fees discount admission_fee monthly_rate')):
+    """One priced catalog entry: a 'package', a personal 'training' plan or an 'addon'"""
+    __slots__ = ()
+
+    @property
+    def total(self):
+        return self.fees + self.admission_fee - self.discount
+
+DEFAULT_CATALOG = (
+    [CatalogItem('package', code, package['name'], package['duration'], package['fees'], package['discount'],
+                 package['admission_fee'], EXTENSION_MONTHLY_RATES[code]) for code, package in PACKAGES.items()]
+    # Training renews at its full discounted price per month, as it always has
+    + [CatalogItem('training', code, plan['name'], plan['duration'], plan['fees'], plan['discount'], 0,
+                   plan['fees'] - plan['discount']) for code, plan in PERSONAL_TRAINING.items()]
+    + [CatalogItem('addon', 'treadmill', 'TREADMILL ACCESS', 1, 0, 0, 0, TREADMILL_MONTHLY_FEE)]
+)
+
+class PriceBook:
+    """Price tables compiled from one catalog version; never modified after construction.
+
+    Every (package, training, treadmill) combination is precomputed, so a
+    registration or renewal quote is a dictionary lookup and a multiply.
+    Unknown package or training types raise KeyError.
+    """
+
+    def __init__(self, version, items):
+        self.version = version
+        self.items = tuple(items)
+        self.packages = MappingProxyType({item.code: item for item in items if item.kind == 'package'})
+        self.training = MappingProxyType({item.code: item for item in items if item.kind == 'training'})
+        treadmill = next((item for item in items if item.kind == 'addon' and item.code == 'treadmill'), None)
+        self.treadmill_monthly = treadmill.monthly_rate if treadmill else 0
+        training_options = [(None, 0, 0)] + [
+            (code, plan.fees - plan.discount, plan.monthly_rate) for code, plan in self.training.items()]
+        self._signup = MappingProxyType({
+            (code, training): package.total + signup
+            for code, package in self.packages.items() for training, signup, _ in training_options
+        })
+        self._monthly = MappingProxyType({
+            (code, training, treadmill_access): package.monthly_rate + monthly
+                                                + (self.treadmill_monthly if treadmill_access else 0)
+            for code, package in self.packages.items() for training, _, monthly in training_options
+            for treadmill_access in (False, True)
+        })
+
+    def registration(self, package_type, duration_months, personal_training_type=None, treadmill_access=False):
+        """Fee breakdown of a new membership, as Customer column values"""
+        package = self.packages[package_type]
+        total_amount = self._signup[package_type, personal_training_type or None]
+        if treadmill_access:
+            total_amount += self.treadmill_monthly * duration_months
+        return {
+            'admission_fee': package.admission_fee,
+            'package_fee': package.fees,
+            'discount': package.discount,
+            'total_amount': total_amount,
+        }
+
+    def renewal(self, package_type, months, personal_training_type=None, treadmill_access=False):
+        """Charge for extending a membership by months"""
+        return self._monthly[package_type, personal_training_type or None, bool(treadmill_access)] * months
+
+def whole_rupees(amount):
+    """Show catalog amounts as 750 rather than 750.0 when they have no paise"""
+    return int(amount) if float(amount).is_integer() else amount
+
+class PricingEngine:
+    """Serves the PriceBook of the live (highest) catalog version.
+
+    The version is re-read at most every CATALOG_CHECK_SECONDS, so a price
+    change published from any worker or the CLI reaches every worker without
+    a redeploy. Until a catalog is published the defaults above apply.
+    """
+
+    def __init__(self):
+        self._book = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+
+    def current(self):
+        if self._book is None or time.monotonic() - self._checked_at >= app.config['CATALOG_CHECK_SECONDS']:
+            self.refresh()
+        return self._book
+
+    def refresh(self):
+        with self._lock:
+            version = db.session.execute(db.select(db.func.max(PackagePrice.catalog_version))).scalar() or 0
+            if self._book is None or self._book.version != version:
+                items = DEFAULT_CATALOG if not version else [
+                    CatalogItem(row.kind, row.code, row.name, row.duration_months, *map(
+                        whole_rupees, (row.fees, row.discount, row.admission_fee, row.monthly_rate)))
+                    for row in db.session.execute(
+                        db.select(PackagePrice).where(PackagePrice.catalog_version == version)
+                        .order_by(PackagePrice.id)
+                    ).scalars()
+                ]
+                self._book = PriceBook(version, items)
+                logger.info("price catalog loaded", extra={'version': version, 'items': len(items)})
+            self._checked_at = time.monotonic()
+        return self._book
+
+pricing = PricingEngine()
+
+def publish_catalog(items):
+    """Store items as the next catalog version, which every worker then switches to"""
+    version = (db.session.execute(db.select(db.func.max(PackagePrice.catalog_version))).scalar() or 0) + 1
+    now = datetime.utcnow()
+    db.session.execute(PackagePrice.__table__.insert(), [
+        {'catalog_version': version, 'kind': item.kind, 'code': item.code, 'name': item.name,
+         'duration_months': item.duration, 'fees': item.fees, 'discount': item.discount,
+         'admission_fee': item.admission_fee, 'monthly_rate': item.monthly_rate, 'created_at': now}
+        for item in items
+    ])
+    db.session.commit()
+    pricing.refresh()
+    return version
+
+@app.cli.command("price-catalog")
+def price_catalog_command():
+    """Show the live price catalog"""
+    price_book = pricing.refresh()
+    print(f"Catalog version {price_book.version or 'default (none published)'}")
+    print(f"{'kind':<10}{'code':<12}{'name':<20}{'months':>7}{'fees':>9}{'discount':>10}{'admission':>11}{'monthly':>9}")
+    for item in price_book.items:
+        print(f"{item.kind:<10}{item.code:<12}{item.name:<20}{item.duration:>7}{item.fees:>9}{item.discount:>10}"
+              f"{item.admission_fee:>11}{item.monthly_rate:>9}")
+
+@app.cli.command("set-price")
+@click.argument('kind', type=click.Choice(['package', 'training', 'addon']))
+@click.argument('code')
+@click.option('--name', help='Display name (new items default to the upper-cased code).')
+@click.option('--duration', type=click.IntRange(min=1), help='Months included in the signup price.')
+@click.option('--fees', type=float)
+@click.option('--discount', type=float)
+@click.option('--admission-fee', type=float)
+@click.option('--monthly-rate', type=float, help='Renewal charge per month.')
+def set_price(kind, code, **changes):
+    """Publish a new catalog version with one item added or changed"""
+    price_book = pricing.refresh()
+    items = list(price_book.items)
+    index = next((i for i, item in enumerate(items) if item.kind == kind and item.code == code), None)
+    if index is None:
+        items.append(CatalogItem(kind, code, code.upper(), 1, 0, 0, 0, 0))
+        index = len(items) - 1
+    items[index] = items[index]._replace(**{field: value for field, value in changes.items() if value is not None})
+    version = publish_catalog(items)
+    print(f"Published catalog version {version}: {items[index]}")
+
 # Twilio configuration
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
 TWILIO_PHONE_NUMBER = os.getenv('TWILIO_PHONE_NUMBER')
 ADMIN_PHONE_NUMBER = os.getenv('ADMIN_PHONE_NUMBER')
 
-# Print Twilio configuration for debugging
-print(f"Twilio Account SID: {TWILIO_ACCOUNT_SID}")
-print(f"Twilio Auth Token: {'*' * len(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else 'Not set'}")
-print(f"Twilio Phone Number: {TWILIO_PHONE_NUMBER}")
-print(f"Admin Phone Number: {ADMIN_PHONE_NUMBER}")
+# SMS outbox dispatcher settings
+app.config['SMS_TRANSPORT'] = os.getenv('SMS_TRANSPORT', 'twilio')  # 'twilio' or 'fake'
+app.config['SMS_DISPATCHER'] = os.getenv('SMS_DISPATCHER', 'thread')  # 'thread' or 'off'
+app.config['SMS_WORKERS'] = int(os.getenv('SMS_WORKERS', 4))
+app.config['SMS_BATCH_SIZE'] = int(os.getenv('SMS_BATCH_SIZE', 50))
+app.config['SMS_MAX_ATTEMPTS'] = int(os.getenv('SMS_MAX_ATTEMPTS', 5))
+app.config['SMS_RETRY_BASE_SECONDS'] = int(os.getenv('SMS_RETRY_BASE_SECONDS', 30))
+app.config['SMS_RETRY_MAX_SECONDS'] = int(os.getenv('SMS_RETRY_MAX_SECONDS', 3600))
+app.config['SMS_POLL_INTERVAL'] = float(os.getenv('SMS_POLL_INTERVAL', 5))
+app.config['SMS_CLAIM_TIMEOUT'] = int(os.getenv('SMS_CLAIM_TIMEOUT', 300))
 
-# Initialize Twilio client
-twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN) if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN else None
-if twilio_client:
-    print("Twilio client initialized successfully")
-else:
-    print("Failed to initialize Twilio client. Check your credentials.")
+# Admin alerts are collected and sent as one digest every ADMIN_DIGEST_MINUTES
+# (0 sends each alert on its own), in at most ADMIN_DIGEST_MAX_MESSAGES SMS of
+# ADMIN_DIGEST_MAX_SEGMENTS segments each
+app.config['ADMIN_DIGEST_MINUTES'] = int(os.getenv('ADMIN_DIGEST_MINUTES', 15))
+app.config['ADMIN_DIGEST_MAX_SEGMENTS'] = int(os.getenv('ADMIN_DIGEST_MAX_SEGMENTS', 4))
+app.config['ADMIN_DIGEST_MAX_MESSAGES'] = int(os.getenv('ADMIN_DIGEST_MAX_MESSAGES', 3))
+# A manual reminder to the same customer is sent at most once per window
+app.config['REMINDER_DEDUP_MINUTES'] = int(os.getenv('REMINDER_DEDUP_MINUTES', 10))
+
+# Expiry notification job settings
+app.config['EXPIRY_JOB_CHUNK_SIZE'] = int(os.getenv('EXPIRY_JOB_CHUNK_SIZE', 500))
+
+# Scheduler settings. 'embedded' runs the scheduler inside every web worker
+# (the job lock keeps runs unique); 'off' leaves it to `flask run-scheduler`.
+app.config['SCHEDULER_MODE'] = os.getenv('SCHEDULER_MODE', 'embedded')
+app.config['EXPIRY_JOB_INTERVAL_MINUTES'] = int(os.getenv('EXPIRY_JOB_INTERVAL_MINUTES', 60))
+app.config['SCHEDULER_MISFIRE_GRACE_SECONDS'] = int(os.getenv('SCHEDULER_MISFIRE_GRACE_SECONDS', 300))
+app.config['SCHEDULER_JITTER_SECONDS'] = int(os.getenv('SCHEDULER_JITTER_SECONDS', 30))
+app.config['SCHEDULER_LOCK_TTL_SECONDS'] = int(os.getenv('SCHEDULER_LOCK_TTL_SECONDS', 900))
+
+# How long a worker trusts its cached admin check before re-reading the users cache version
+app.config['ADMIN_CACHE_TTL'] = float(os.getenv('ADMIN_CACHE_TTL', 30))
+# Logged-in staff identities kept per worker, and how often the cache re-reads the users cache version
+app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 256))
+app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 30))
+
+# Bulk customer import settings
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 5000))
+app.config['IMPORT_SMS_PER_SECOND'] = float(os.getenv('IMPORT_SMS_PER_SECOND', 1))
+
+# Rows fetched per round-trip (server-side cursor batch) when streaming exports
+app.config['EXPORT_YIELD_PER'] = int(os.getenv('EXPORT_YIELD_PER', 1000))
+
+# Door check-in. Each branch's scanners authenticate with that branch's token from
+# CHECKIN_TOKENS (CHECKIN_TOKEN is the main branch's); attendance rows are written
+# every CHECKIN_FLUSH_SECONDS or once CHECKIN_FLUSH_SIZE scans are queued, and other
+# workers' membership changes are picked up within CHECKIN_INDEX_TTL
+app.config['CHECKIN_TOKENS'] = {os.getenv('CHECKIN_TOKEN'): 'main'} if os.getenv('CHECKIN_TOKEN') else {}
+# e.g. CHECKIN_TOKENS="main=long_random_string,north=another_one"; maps token to branch code
+for _scanner in filter(None, os.getenv('CHECKIN_TOKENS', '').split(',')):
+    _code, _, _token = _scanner.partition('=')
+    app.config['CHECKIN_TOKENS'][_token.strip()] = _code.strip()
+app.config['CHECKIN_FLUSH_SECONDS'] = float(os.getenv('CHECKIN_FLUSH_SECONDS', 2))
+app.config['CHECKIN_FLUSH_SIZE'] = int(os.getenv('CHECKIN_FLUSH_SIZE', 200))
+app.config['CHECKIN_INDEX_TTL'] = float(os.getenv('CHECKIN_INDEX_TTL', 5))
+
+class SmsDeliveryError(Exception):
+    """Raised by an SMS transport when a message could not be handed to the provider"""
+
+class TwilioTransport:
+    """Sends messages through one shared Twilio client.
+
+    The client keeps its HTTP session (and so its connection pool) for the
+    life of the process instead of being rebuilt for every message.
+    """
+
+    def __init__(self, account_sid, auth_token, from_number):
+        # Imported here so processes that never send SMS do not pay for the Twilio SDK
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+        self.from_number = from_number
+
+    def send(self, to_number, body):
+        message = self.client.messages.create(body=body, from_=self.from_number, to=to_number)
+        return message.sid
+
+class FakeTwilioTransport:
+    """In-memory stand-in for Twilio that records every message it is given.
+
+    fail_times makes the next N sends raise SmsDeliveryError, and latency adds
+    a per-message delay, so retry and concurrency behaviour can be exercised
+    without network access.
+    """
+
+    def __init__(self, fail_times=0, latency=0.0):
+        self.sent = []
+        self.fail_times = fail_times
+        self.latency = latency
+        self._lock = threading.Lock()
+
+    def send(self, to_number, body):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            if self.fail_times > 0:
+                self.fail_times -= 1
+                raise SmsDeliveryError('Simulated delivery failure')
+            sid = f'SMfake{len(self.sent) + 1:08d}'
+            self.sent.append({'sid': sid, 'to': to_number, 'body': body})
+        return sid
+
+def build_sms_transport():
+    """Create the process-wide SMS transport from configuration"""
+    if app.config['SMS_TRANSPORT'] == 'fake':
+        return FakeTwilioTransport()
+    # Log Twilio configuration for debugging
+    logger.info("twilio configured", extra={
+        'account_sid': TWILIO_ACCOUNT_SID,
+        'auth_token': '*' * len(TWILIO_AUTH_TOKEN) if TWILIO_AUTH_TOKEN else 'Not set',
+        'from_number': TWILIO_PHONE_NUMBER,
+        'admin_number': ADMIN_PHONE_NUMBER,
+    })
+    if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER:
+        return TwilioTransport(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER)
+    return None
+
+# The shared SMS transport is built on first send, so web workers and CLI
+# commands that never send a message skip the Twilio client entirely
+sms_transport = None
+_sms_transport_built = False
+_sms_transport_lock = threading.Lock()
+
+def get_sms_transport():
+    """Return the process-wide SMS transport, creating it on first use"""
+    global sms_transport, _sms_transport_built
+    if sms_transport is None and not _sms_transport_built:
+        with _sms_transport_lock:
+            if not _sms_transport_built:
+                sms_transport = build_sms_transport()
+                _sms_transport_built = True
+                if sms_transport:
+                    logger.info("sms transport initialized", extra={'transport': type(sms_transport).__name__})
+                else:
+                    logger.warning("sms transport not initialized, check your Twilio credentials")
+    return sms_transport
+
+# Branches
+# One deployment serves every branch. Members, payments, attendance and the
+# revenue rollup carry a branch_id; while the session is scoped to a branch
+# (every signed-in request, or branch_scope() in jobs and commands) ORM
+# statements on those models are filtered to it and new rows default to it.
+DEFAULT_BRANCH_ID = 1  # the branch created with the schema; unscoped inserts land here
+
+def current_branch_id():
+    """Branch the session is scoped to, or the default branch when unscoped"""
+    branch_id = db.session.info.get('branch_id')
+    return DEFAULT_BRANCH_ID if branch_id is None else branch_id
+
+class BranchScoped:
+    """Mixin for models whose rows belong to one branch (see _scope_to_branch)"""
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), nullable=False,
+                          default=current_branch_id, server_default=str(DEFAULT_BRANCH_ID))
 
 # Models
+class Branch(db.Model):
+    """A gym location; staff bound to a branch only ever see its members"""
+    id = db.Column(db.Integer, primary_key=True)
+    code = db.Column(db.String(20), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# A fresh schema starts with the default branch; the tenancy migration adds it to existing ones
+db.event.listen(Branch.__table__, 'after_create', db.DDL(
+    "INSERT INTO branch (code, name, created_at) VALUES ('main', 'Main', CURRENT_TIMESTAMP)"))
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password = db.Column(db.String(120), nullable=False)
     is_admin = db.Column(db.Boolean, default=False)
     join_date = db.Column(db.DateTime, default=datetime.utcnow)
+    # Staff work in this branch only; NULL marks head office, who switch between branches
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'))
+
+    __table_args__ = (
+        db.Index('ix_user_is_admin', 'is_admin'),
+    )
 
-class Customer(db.Model):
+class Customer(BranchScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     email = db.Column(db.String(120))
@@ -147,8 +859,97 @@ class Customer(db.Model):
     notification_sent = db.Column(db.Boolean, default=False)
     treadmill_access = db.Column(db.Boolean, default=False)
     pending_amount = db.Column(db.Float, default=0.0)
+    # Digits-only copy of phone, kept in sync by _set_phone_digits for prefix search
+    phone_digits = db.Column(db.String(20))
+    # Lifetime payments (hot and archived), kept in step with every fee insert by
+    # apply_customer_payments; `flask reconcile-customer-totals` checks them
+    total_paid = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    last_payment_at = db.Column(db.DateTime)
+
+    # Every index leads with branch_id, which every scoped query pins.
+    # Composite keys used by the keyset-paginated customer list
+    __table_args__ = (
+        db.Index('ix_customer_branch_id_membership_end_id', 'branch_id', 'membership_end', 'id'),
+        db.Index('ix_customer_branch_id_name_id', 'branch_id', 'name', 'id'),
+        # Expiry job: notification_sent equality, then a membership_end range
+        db.Index('ix_customer_branch_id_notification_sent_membership_end',
+                 'branch_id', 'notification_sent', 'membership_end'),
+        db.Index('ix_customer_branch_id_phone_digits', 'branch_id', 'phone_digits'),
+    )
+
+def normalize_phone(phone):
+    """Reduce a phone number to its digits, dropping the +91 country code"""
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    return digits
+
+@db.event.listens_for(Customer, 'before_insert')
+@db.event.listens_for(Customer, 'before_update')
+def _set_phone_digits(mapper, connection, target):
+    target.phone_digits = normalize_phone(target.phone)
+
+# Substring search indexes over customer name/email. SQLite gets an FTS5
+# trigram table kept in sync by triggers, PostgreSQL gets pg_trgm GIN indexes
+# that serve ILIKE '%q%' directly. The same DDL lives in the search migration.
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5("
+    "name, email, content='customer', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_ai AFTER INSERT ON customer BEGIN "
+    "INSERT INTO customer_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_ad AFTER DELETE ON customer BEGIN "
+    "INSERT INTO customer_search(customer_search, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_au AFTER UPDATE OF name, email ON customer BEGIN "
+    "INSERT INTO customer_search(customer_search, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO customer_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+]
+POSTGRES_SEARCH_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_customer_name_trgm ON customer USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_email_trgm ON customer USING gin (email gin_trgm_ops)",
+]
 
-class Fee(db.Model):
+db.event.listen(Customer.__table__, 'before_create',
+                db.DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql'))
+for statement in SQLITE_SEARCH_DDL:
+    db.event.listen(Customer.__table__, 'after_create', db.DDL(statement).execute_if(dialect='sqlite'))
+for statement in POSTGRES_SEARCH_DDL:
+    db.event.listen(Customer.__table__, 'after_create', db.DDL(statement).execute_if(dialect='postgresql'))
+db.event.listen(Customer.__table__, 'after_drop',
+                db.DDL("DROP TABLE IF EXISTS customer_search").execute_if(dialect='sqlite'))
+
+class SmsOutbox(db.Model):
+    __tablename__ = 'sms_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    to_number = db.Column(db.String(20), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim_token = db.Column(db.String(32))
+    claimed_at = db.Column(db.DateTime)
+    provider_sid = db.Column(db.String(64))
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_sms_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),
+        db.Index('ix_sms_outbox_claim_token', 'claim_token'),
+    )
+
+class SchedulerLock(db.Model):
+    """Lease row guarding a scheduled job so it runs once per cycle cluster-wide"""
+    __tablename__ = 'scheduler_lock'
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime, nullable=False)
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))
+
+class Fee(BranchScoped, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
@@ -157,104 +958,1236 @@ class Fee(db.Model):
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
     collected_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    __table_args__ = (
+        # Per-customer payment history, newest first
+        db.Index('ix_fee_branch_id_customer_id_payment_date', 'branch_id', 'customer_id', 'payment_date'),
+        # Never reuse an id: archived payments keep theirs in fee_archive
+        {'sqlite_autoincrement': True},
+    )
+
+class FeeArchive(BranchScoped, db.Model):
+    """Payments from closed months moved out of the hot fee table by `flask archive-fees`"""
+    __tablename__ = 'fee_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    amount = db.Column(db.Float, nullable=False)
+    payment_type = db.Column(db.String(20), nullable=False)
+    description = db.Column(db.String(200))
+    payment_date = db.Column(db.DateTime)
+    collected_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_fee_archive_branch_id_customer_id_payment_date',
+                 'branch_id', 'customer_id', 'payment_date'),
+    )
+
+class AdminAlert(db.Model):
+    """Admin notification waiting to be rolled into the next digest SMS"""
+    __tablename__ = 'admin_alert'
+    id = db.Column(db.Integer, primary_key=True)
+    body = db.Column(db.String(500), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class IdempotencyKey(db.Model):
+    """Claimed operation keys; a key can be claimed again once it expires"""
+    __tablename__ = 'idempotency_key'
+    key = db.Column(db.String(100), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class PackagePrice(db.Model):
+    """One item of a price catalog version; the highest version is the live catalog"""
+    __tablename__ = 'package_price'
+    id = db.Column(db.Integer, primary_key=True)
+    catalog_version = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # package, training, addon
+    code = db.Column(db.String(20), nullable=False)
+    name = db.Column(db.String(50), nullable=False)
+    duration_months = db.Column(db.Integer, nullable=False, default=1)
+    fees = db.Column(db.Float, nullable=False, default=0.0)
+    discount = db.Column(db.Float, nullable=False, default=0.0)
+    admission_fee = db.Column(db.Float, nullable=False, default=0.0)
+    monthly_rate = db.Column(db.Float, nullable=False, default=0.0)  # renewal charge per month
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('catalog_version', 'kind', 'code', name='uq_package_price_version_kind_code'),
+    )
+
+class CacheVersion(db.Model):
+    """Counters bumped on writes so each worker can tell when its local caches are stale"""
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class Attendance(BranchScoped, db.Model):
+    """One door scan; denied scans of lapsed members are kept too"""
+    id = db.Column(db.Integer, primary_key=True)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
+    checked_in_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    granted = db.Column(db.Boolean, nullable=False)
+    scanner = db.Column(db.String(40))
+
+    __table_args__ = (
+        db.Index('ix_attendance_branch_id_customer_id_checked_in_at', 'branch_id', 'customer_id', 'checked_in_at'),
+    )
+
+class DailyRevenue(BranchScoped, db.Model):
+    """Fee totals per branch, day, payment type and collector, maintained as fees are inserted"""
+    __tablename__ = 'daily_revenue'
+    branch_id = db.Column(db.Integer, db.ForeignKey('branch.id'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    payment_type = db.Column(db.String(20), primary_key=True)
+    collected_by = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+
+@db.event.listens_for(db.session, 'do_orm_execute')
+def _scope_to_branch(execute_state):
+    # Adds "branch_id = :branch" for every BranchScoped model in the statement,
+    # including subqueries and ORM UPDATE/DELETE; Core table statements are untouched
+    branch_id = execute_state.session.info.get('branch_id')
+    if branch_id is None or execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    execute_state.statement = execute_state.statement.options(branch_criteria(branch_id))
+
+def branch_criteria(branch_id):
+    """Statement option limiting every BranchScoped model in it to one branch"""
+    return db.with_loader_criteria(BranchScoped, lambda cls: cls.branch_id == branch_id, include_aliases=True)
+
+@contextmanager
+def branch_scope(branch_id):
+    """Scope ORM statements in this block to one branch; None lifts the scope for cross-branch work"""
+    info = db.session.info
+    previous = info.get('branch_id')
+    info['branch_id'] = branch_id
+    try:
+        yield
+    finally:
+        info['branch_id'] = previous
+
+def apply_revenue_deltas(connection, deltas):
+    """Add per-(branch, day, payment_type, collector) amounts and counts to daily_revenue.
+
+    deltas maps (branch_id, day, payment_type, collected_by) to (amount,
+    count); negative values remove revenue. Rows are upserted in a single
+    executemany.
+    """
+    if not deltas:
+        return
+    table = DailyRevenue.__table__
+    rows = [{'branch_id': branch_id, 'day': day, 'payment_type': payment_type, 'collected_by': collected_by,
+             'amount': amount, 'payment_count': count}
+            for (branch_id, day, payment_type, collected_by), (amount, count) in deltas.items()]
+
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.branch_id, table.c.day, table.c.payment_type, table.c.collected_by],
+            set_={'amount': table.c.amount + stmt.excluded.amount,
+                  'payment_count': table.c.payment_count + stmt.excluded.payment_count}
+        )
+        connection.execute(stmt, rows)
+    else:
+        for row in rows:
+            result = connection.execute(
+                table.update()
+                .where(table.c.branch_id == row['branch_id'], table.c.day == row['day'],
+                       table.c.payment_type == row['payment_type'], table.c.collected_by == row['collected_by'])
+                .values(amount=table.c.amount + row['amount'],
+                        payment_count=table.c.payment_count + row['payment_count'])
+            )
+            if result.rowcount == 0:
+                connection.execute(table.insert(), row)
+
+def add_revenue_delta(deltas, branch_id, payment_date, payment_type, collected_by, amount, count=1):
+    key = (branch_id, payment_date.date(), payment_type, collected_by)
+    total, payments = deltas.get(key, (0.0, 0))
+    deltas[key] = (total + amount, payments + count)
+
+def apply_customer_payments(connection, payments):
+    """Add new payments to customer.total_paid and advance last_payment_at.
+
+    payments maps customer_id to (amount, latest payment_date). Each
+    customer is changed by an increment computed in the database, in a
+    single executemany, so concurrent payments cannot overwrite each other.
+    """
+    if not payments:
+        return
+    table = Customer.__table__
+    paid_at = db.bindparam('b_paid_at', type_=db.DateTime)
+    connection.execute(
+        table.update().where(table.c.id == db.bindparam('b_id')).values(
+            total_paid=db.func.coalesce(table.c.total_paid, 0) + db.bindparam('b_amount', type_=db.Float),
+            last_payment_at=db.case(
+                (db.or_(table.c.last_payment_at.is_(None), table.c.last_payment_at < paid_at), paid_at),
+                else_=table.c.last_payment_at)
+        ),
+        [{'b_id': customer_id, 'b_amount': amount, 'b_paid_at': paid_at_value}
+         for customer_id, (amount, paid_at_value) in payments.items()]
+    )
+
+def add_customer_payment(payments, customer_id, payment_date, amount):
+    total, latest = payments.get(customer_id, (0.0, payment_date))
+    payments[customer_id] = (total + amount, max(latest, payment_date))
+
+@db.event.listens_for(db.session, 'after_flush')
+def _roll_up_new_fees(session, flush_context):
+    # Every ORM insert of a Fee (add_fee, register_customer, extend_membership)
+    # lands in the rollup and the customer's totals within the same transaction
+    deltas, payments = {}, {}
+    for obj in session.new:
+        if isinstance(obj, Fee):
+            payment_date = obj.payment_date or datetime.utcnow()
+            add_revenue_delta(deltas, obj.branch_id, payment_date, obj.payment_type, obj.collected_by, obj.amount)
+            add_customer_payment(payments, obj.customer_id, payment_date, obj.amount)
+    apply_revenue_deltas(session.connection(), deltas)
+    apply_customer_payments(session.connection(), payments)
+
+def remove_customer_revenue(customer_id):
+    """Subtract a customer's hot and archived fees from the rollup before their ledger rows are deleted"""
+    rows = db.session.execute(ledger_revenue_query(customer_id=customer_id)).all()
+    deltas = {}
+    for branch_id, payment_day, payment_type, collected_by, amount, count in rows:
+        if isinstance(payment_day, str):
+            payment_day = datetime.strptime(payment_day, '%Y-%m-%d').date()
+        deltas[(branch_id, payment_day, payment_type, collected_by)] = (-amount, -count)
+    apply_revenue_deltas(db.session.connection(), deltas)
+    db.session.execute(db.delete(DailyRevenue).where(DailyRevenue.payment_count <= 0))
+
+def revenue_totals(today=None):
+    """Return (total collected, collected today) from the daily rollup"""
+    total, today_total = db.session.execute(revenue_totals_query(today or datetime.utcnow().date())).one()
+    return total, today_total
+
+def revenue_totals_query(today):
+    return db.select(
+        db.func.coalesce(db.func.sum(DailyRevenue.amount), 0),
+        db.func.coalesce(db.func.sum(
+            db.case((DailyRevenue.day == today, DailyRevenue.amount), else_=0)), 0)
+    )
+
+FEE_LEDGER_COLUMNS = ('id', 'branch_id', 'customer_id', 'amount', 'payment_type', 'description', 'payment_date',
+                      'collected_by')
+
+def fee_ledger(*, customer_id=None, start=None, end=None):
+    """Hot and archived payments as one subquery; start/end are datetimes, end exclusive.
+
+    The filters are applied to each table, so both use their
+    (branch_id, customer_id, payment_date) index and Postgres skips
+    partitions outside the range. Both halves select ORM columns, so a
+    branch-scoped session only reads its own branch's payments.
+    """
+    selects = []
+    for model in (Fee, FeeArchive):
+        query = db.select(*(getattr(model, name) for name in FEE_LEDGER_COLUMNS))
+        if customer_id is not None:
+            query = query.where(model.customer_id == customer_id)
+        if start is not None:
+            query = query.where(model.payment_date >= start)
+        if end is not None:
+            query = query.where(model.payment_date < end)
+        selects.append(query)
+    return db.union_all(*selects).subquery('ledger')
+
+def ledger_revenue_query(*, customer_id=None, start=None, end=None):
+    """Fee ledger grouped the same way as daily_revenue; without a customer or range it scans the whole ledger"""
+    ledger = fee_ledger(customer_id=customer_id, start=start, end=end)
+    day = db.func.date(ledger.c.payment_date)
+    return db.select(
+        ledger.c.branch_id, day.label('day'), ledger.c.payment_type, ledger.c.collected_by,
+        db.func.sum(ledger.c.amount).label('amount'), db.func.count().label('payment_count')
+    ).group_by(ledger.c.branch_id, day, ledger.c.payment_type, ledger.c.collected_by)
+
+def roll_up_ledger(start=None, end=None):
+    """Replace the daily_revenue rows of [start, end) with totals recomputed from the ledger"""
+    stale = db.delete(DailyRevenue)
+    if start is not None:
+        stale = stale.where(DailyRevenue.day >= start.date())
+    if end is not None:
+        stale = stale.where(DailyRevenue.day < end.date())
+    db.session.execute(stale)
+    return db.session.execute(
+        db.insert(DailyRevenue).from_select(
+            ['branch_id', 'day', 'payment_type', 'collected_by', 'amount', 'payment_count'],
+            ledger_revenue_query(start=start, end=end)
+        )
+    ).rowcount
+
+@app.cli.command("rebuild-revenue")
+def rebuild_revenue():
+    """Recompute the daily_revenue rollup from the fee ledger"""
+    roll_up_ledger()
+    db.session.commit()
+    print(f"Rebuilt daily_revenue: {DailyRevenue.query.count()} row(s)")
+
+@app.cli.command("verify-revenue")
+def verify_revenue():
+    """Compare the daily_revenue rollup against the fee ledger"""
+    def keyed(rows):
+        return {(row.branch_id, str(row.day), row.payment_type, row.collected_by):
+                (round(row.amount, 2), row.payment_count) for row in rows}
+
+    ledger = keyed(db.session.execute(ledger_revenue_query()).all())
+    rollup = keyed(db.session.execute(
+        db.select(DailyRevenue.branch_id, DailyRevenue.day, DailyRevenue.payment_type, DailyRevenue.collected_by,
+                  DailyRevenue.amount, DailyRevenue.payment_count)
+    ).all())
+    mismatches = [(key, ledger.get(key), rollup.get(key))
+                  for key in sorted(set(ledger) | set(rollup), key=str)
+                  if ledger.get(key) != rollup.get(key)]
+    for key, expected, actual in mismatches:
+        print(f"Mismatch {key}: ledger={expected} rollup={actual}")
+    if mismatches:
+        print(f"daily_revenue is out of date ({len(mismatches)} mismatch(es)). Run `flask rebuild-revenue`.")
+        raise SystemExit(1)
+    print(f"daily_revenue matches the fee ledger ({len(ledger)} row(s))")
+
+def customer_totals_mismatches():
+    """Customers whose total_paid or last_payment_at differ from their hot and archived fees"""
+    ledger = fee_ledger()
+    paid = db.select(
+        ledger.c.customer_id, db.func.sum(ledger.c.amount).label('total_paid'),
+        db.func.max(ledger.c.payment_date).label('last_payment_at')
+    ).group_by(ledger.c.customer_id).subquery('paid')
+    expected_total = db.func.coalesce(paid.c.total_paid, 0)
+    return db.session.execute(
+        db.select(Customer.id, Customer.total_paid, Customer.last_payment_at,
+                  expected_total.label('expected_total'), paid.c.last_payment_at.label('expected_last'))
+        .outerjoin(paid, paid.c.customer_id == Customer.id)
+        .where(db.or_(db.func.abs(db.func.coalesce(Customer.total_paid, 0) - expected_total) > 0.005,
+                      Customer.last_payment_at.is_distinct_from(paid.c.last_payment_at)))
+        .order_by(Customer.id)
+    ).all()
+
+@app.cli.command("reconcile-customer-totals")
+@click.option('--fix', is_flag=True, help='Rewrite the mismatched totals from the ledger.')
+def reconcile_customer_totals(fix):
+    """Compare customer.total_paid and last_payment_at against the fee ledger"""
+    mismatches = customer_totals_mismatches()
+    for row in mismatches[:20]:
+        print(f"Mismatch customer {row.id}: ledger=({round(row.expected_total, 2)}, {row.expected_last}) "
+              f"customer=({row.total_paid}, {row.last_payment_at})")
+    if not mismatches:
+        print("Customer payment totals match the fee ledger")
+        return
+    if not fix:
+        print(f"{len(mismatches)} customer(s) out of date. Run `flask reconcile-customer-totals --fix`.")
+        raise SystemExit(1)
+
+    # Only rows still holding the values read above are rewritten, so a payment
+    # posted in the meantime is never lost; such customers show up on the next run
+    table = Customer.__table__
+    db.session.execute(
+        table.update().where(
+            table.c.id == db.bindparam('b_id'),
+            table.c.total_paid.is_not_distinct_from(db.bindparam('b_seen_total', type_=db.Float)),
+            table.c.last_payment_at.is_not_distinct_from(db.bindparam('b_seen_last', type_=db.DateTime))
+        ).values(total_paid=db.bindparam('b_total', type_=db.Float),
+                 last_payment_at=db.bindparam('b_last', type_=db.DateTime)),
+        [{'b_id': row.id, 'b_seen_total': row.total_paid, 'b_seen_last': row.last_payment_at,
+          'b_total': row.expected_total, 'b_last': row.expected_last} for row in mismatches]
+    )
+    db.session.commit()
+    remaining = len(customer_totals_mismatches())
+    print(f"Fixed {len(mismatches) - remaining} customer(s)"
+          + (f"; {remaining} changed meanwhile, run again" if remaining else ""))
+
+# Fee ledger partitions and archival
+# On Postgres the migrations turn fee into a table range-partitioned by month
+# (fee_pYYYYMM, with fee_pdefault catching anything outside them); archiving a
+# month detaches its partition and attaches it to fee_archive, without copying
+# rows. Elsewhere (SQLite, or a Postgres schema made by create_all) the rows of
+# each month are copied into fee_archive and deleted from fee. Either way the
+# hot table and its indexes only hold the months not yet archived.
+app.config['FEE_PARTITION_MONTHS_AHEAD'] = int(os.getenv('FEE_PARTITION_MONTHS_AHEAD', 3))
+
+FEE_PARTITION_RE = re.compile(r'^fee_p(\d{4})(\d{2})$')
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def fee_table_partitioned(connection):
+    """Whether fee is a range-partitioned Postgres table"""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return connection.execute(db.text(
+        "SELECT count(*) FROM pg_partitioned_table WHERE partrelid = 'fee'::regclass"
+    )).scalar() > 0
+
+def fee_partitions(connection, parent='fee'):
+    """Names of the partitions currently attached to a partitioned table"""
+    return set(connection.execute(db.text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = CAST(:parent AS regclass)"
+    ), {'parent': parent}).scalars())
+
+def partition_bounds(month):
+    return f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{next_month(month):%Y-%m-%d}')"
+
+def ensure_fee_partitions(months_ahead=None):
+    """Create the fee partitions for this month and FEE_PARTITION_MONTHS_AHEAD more.
+
+    A no-op unless fee is partitioned. Payments already sitting in
+    fee_pdefault for a new month are moved into its partition. Returns how
+    many partitions were created.
+    """
+    if months_ahead is None:
+        months_ahead = app.config['FEE_PARTITION_MONTHS_AHEAD']
+    with app.app_context():
+        connection = db.session.connection()
+        if not fee_table_partitioned(connection):
+            db.session.rollback()
+            return 0
+        existing = fee_partitions(connection)
+        month, created = month_start(datetime.utcnow()), 0
+        for _ in range(months_ahead + 1):
+            name = f"fee_p{month:%Y%m}"
+            if name not in existing:
+                connection.execute(db.text(f"CREATE TABLE {name} (LIKE fee INCLUDING DEFAULTS)"))
+                connection.execute(db.text(
+                    f"WITH moved AS (DELETE FROM fee_pdefault WHERE payment_date >= :start AND payment_date < :end "
+                    f"RETURNING {', '.join(FEE_LEDGER_COLUMNS)}) "
+                    f"INSERT INTO {name} ({', '.join(FEE_LEDGER_COLUMNS)}) SELECT * FROM moved"
+                ), {'start': month, 'end': next_month(month)})
+                connection.execute(db.text(f"ALTER TABLE fee ATTACH PARTITION {name} {partition_bounds(month)}"))
+                created += 1
+            month = next_month(month)
+        db.session.commit()
+        if created:
+            logger.info("fee partitions created", extra={'partitions': created})
+        return created
+
+def archive_fee_partitions(connection, cutoff):
+    """Move whole monthly partitions ending on or before cutoff into fee_archive"""
+    archived = fee_partitions(connection, 'fee_archive')
+    moved = 0
+    for name in sorted(fee_partitions(connection)):
+        match = FEE_PARTITION_RE.match(name)
+        if match is None:
+            continue
+        month = date(int(match.group(1)), int(match.group(2)), 1)
+        if next_month(month) > cutoff.date():
+            continue
+        connection.execute(db.text(f"ALTER TABLE fee DETACH PARTITION {name}"))
+        archive_name = f"fee_archive_p{month:%Y%m}"
+        if archive_name in archived:
+            # Stray rows of this month were archived before; add these to them
+            connection.execute(db.text(f"INSERT INTO {archive_name} SELECT * FROM {name}"))
+            connection.execute(db.text(f"DROP TABLE {name}"))
+        else:
+            connection.execute(db.text(f"ALTER TABLE {name} RENAME TO {archive_name}"))
+            connection.execute(db.text(
+                f"ALTER TABLE fee_archive ATTACH PARTITION {archive_name} {partition_bounds(month)}"))
+        moved += 1
+    return moved
+
+def archive_fee_rows(connection, start, end):
+    """Copy the payments of [start, end) into fee_archive and delete them from fee; returns the row count"""
+    fee, archive = Fee.__table__, FeeArchive.__table__
+    in_range = (fee.c.payment_date >= start, fee.c.payment_date < end)
+    if fee_table_partitioned(connection):
+        # Stray rows in fee_pdefault; fee_archive has no default partition
+        for month in connection.execute(db.select(
+                db.distinct(db.func.date_trunc('month', fee.c.payment_date))).where(*in_range)).scalars():
+            month = month_start(month)
+            connection.execute(db.text(
+                f"CREATE TABLE IF NOT EXISTS fee_archive_p{month:%Y%m} PARTITION OF fee_archive "
+                f"{partition_bounds(month)}"))
+    columns = [fee.c[name] for name in FEE_LEDGER_COLUMNS]
+    connection.execute(archive.insert().from_select(list(FEE_LEDGER_COLUMNS), db.select(*columns).where(*in_range)))
+    return connection.execute(fee.delete().where(*in_range)).rowcount
+
+def archive_fees(before):
+    """Archive every payment made before the first day of the month `before`.
+
+    The daily_revenue rows of the affected days are recomputed from the
+    ledger first, so revenue reports stay exact once the rows have moved.
+    Rows then move one month per transaction. Returns counts of what was
+    archived.
+    """
+    cutoff = datetime.combine(month_start(before), datetime.min.time())
+    stats = {'payments': 0, 'partitions': 0, 'revenue_rows': 0}
+    first = db.session.execute(
+        db.select(db.func.min(Fee.payment_date)).where(Fee.payment_date < cutoff)).scalar()
+    if first is None:
+        db.session.rollback()
+        return stats
+    first = datetime.combine(month_start(first), datetime.min.time())
+    stats['revenue_rows'] = roll_up_ledger(first, cutoff)
+    db.session.commit()
+
+    connection = db.session.connection()
+    if fee_table_partitioned(connection):
+        stats['partitions'] = archive_fee_partitions(connection, cutoff)
+        db.session.commit()
+        connection = db.session.connection()
+    month = first
+    while month < cutoff:
+        month_end = min(datetime.combine(next_month(month.date()), datetime.min.time()), cutoff)
+        stats['payments'] += archive_fee_rows(connection, month, month_end)
+        db.session.commit()
+        connection = db.session.connection()
+        month = month_end
+    db.session.commit()
+    logger.info("fees archived", extra={'before': cutoff.date().isoformat(), **stats})
+    return stats
+
+@app.cli.command("archive-fees")
+@click.option('--before', required=True, type=click.DateTime(formats=['%Y-%m']),
+              help='Archive payments made before the first day of this month (YYYY-MM).')
+def archive_fees_command(before):
+    """Move payments of closed months from the fee table into fee_archive"""
+    if before.date() > month_start(datetime.utcnow()):
+        raise click.ClickException('Only closed months can be archived; --before must not be after this month.')
+    ensure_fee_partitions()
+    stats = archive_fees(before)
+    print(f"Archived {stats['payments']} payment(s) and {stats['partitions']} partition(s) before "
+          f"{before:%Y-%m}; rebuilt {stats['revenue_rows']} daily_revenue row(s)")
+
+def format_phone_number(to_number):
+    """Normalise a stored phone number to E.164 for Twilio"""
+    if not to_number.startswith('+'):
+        # If it's an Indian number without country code
+        if len(to_number) == 10:
+            return '+91' + to_number
+        return '+' + to_number
+    return to_number
+
+def timed_sms_send(to_number, body):
+    """Hand one message to the transport, recording provider latency"""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        sid = get_sms_transport().send(to_number, body)
+        outcome = 'sent'
+        return sid
+    finally:
+        SMS_SEND_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
 def send_sms(to_number, message):
-    """Send SMS using Twilio"""
+    """Send an SMS immediately through the shared transport.
+
+    Request handlers should use enqueue_sms instead so they never wait on the
+    provider; this is kept for the admin test page and the outbox workers.
+    """
+    if get_sms_transport() is None:
+        logger.warning("sms skipped, Twilio credentials not configured")
+        return False
+
+    to_number = format_phone_number(to_number)
+    try:
+        sid = timed_sms_send(to_number, message)
+        logger.info("sms sent", extra={'to': to_number, 'sid': sid})
+        return True
+    except Exception as e:
+        logger.error("sms failed", extra={'to': to_number, 'error': str(e),
+                                          'twilio_code': getattr(e, 'code', None),
+                                          'twilio_msg': getattr(e, 'msg', None)})
+        return False
+
+def enqueue_sms(to_number, message):
+    """Queue an SMS in the outbox as part of the current transaction.
+
+    Nothing is sent until the caller commits; the dispatcher is woken up
+    once the commit succeeds.
+    """
+    entry = SmsOutbox(to_number=format_phone_number(to_number), body=message)
+    db.session.add(entry)
+    db.session.info['sms_enqueued'] = True
+    return entry
+
+def enqueue_sms_batch(messages, per_second=None, start_at=None):
+    """Queue many (to_number, message) pairs with a single bulk INSERT.
+
+    Like enqueue_sms, delivery starts once the caller commits. per_second
+    spaces the messages' first attempts out from start_at so a large batch
+    is released at a bounded rate.
+    """
+    if not messages:
+        return
+    now = datetime.utcnow()
+    start_at = start_at or now
+    db.session.execute(SmsOutbox.__table__.insert(), [
+        {'to_number': format_phone_number(to_number), 'body': message,
+         'status': 'pending', 'attempts': 0, 'created_at': now,
+         'next_attempt_at': start_at + timedelta(seconds=i / per_second) if per_second else start_at}
+        for i, (to_number, message) in enumerate(messages)
+    ])
+    db.session.info['sms_enqueued'] = True
+
+def sms_retry_delay(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts"""
+    delay = min(app.config['SMS_RETRY_BASE_SECONDS'] * 2 ** (attempts - 1),
+                app.config['SMS_RETRY_MAX_SECONDS'])
+    return delay * random.uniform(0.8, 1.2)
+
+def claimable_sms(now):
+    """Outbox messages that are due, or whose claim went stale past SMS_CLAIM_TIMEOUT"""
+    stale = now - timedelta(seconds=app.config['SMS_CLAIM_TIMEOUT'])
+    return db.or_(
+        db.and_(SmsOutbox.status == 'pending', SmsOutbox.next_attempt_at <= now),
+        db.and_(SmsOutbox.status == 'sending', SmsOutbox.claimed_at < stale)
+    )
+
+def due_sms_query(now, limit):
+    return db.select(SmsOutbox.id).where(claimable_sms(now)).order_by(SmsOutbox.next_attempt_at).limit(limit)
+
+def claim_sms_batch(limit):
+    """Atomically claim up to `limit` due outbox messages for this process.
+
+    Rows are claimed with a conditional UPDATE keyed on a fresh token, so
+    several dispatchers (threads, workers or hosts) never pick up the same
+    message. Messages stuck in 'sending' past SMS_CLAIM_TIMEOUT are reclaimed.
+    """
+    now = datetime.utcnow()
+    claimable = claimable_sms(now)
+    ids = db.session.execute(due_sms_query(now, limit)).scalars().all()
+    if not ids:
+        db.session.rollback()
+        return []
+
+    token = uuid.uuid4().hex
+    db.session.execute(
+        db.update(SmsOutbox)
+        .where(SmsOutbox.id.in_(ids), claimable)
+        .values(status='sending', claim_token=token, claimed_at=now)
+    )
+    db.session.commit()
+    return db.session.execute(
+        db.select(SmsOutbox.id, SmsOutbox.to_number, SmsOutbox.body, SmsOutbox.attempts)
+        .where(SmsOutbox.claim_token == token)
+    ).all()
+
+def record_sms_result(message_id, attempts, sid=None, error=None):
+    """Store the outcome of one delivery attempt and schedule a retry if needed"""
+    values = {'attempts': attempts, 'claim_token': None}
+    if error is None:
+        values.update(status='sent', provider_sid=sid, sent_at=datetime.utcnow(), last_error=None)
+    elif attempts < app.config['SMS_MAX_ATTEMPTS']:
+        values.update(status='pending', last_error=error[:500],
+                      next_attempt_at=datetime.utcnow() + timedelta(seconds=sms_retry_delay(attempts)))
+    else:
+        values.update(status='failed', last_error=error[:500])
+    db.session.execute(db.update(SmsOutbox).where(SmsOutbox.id == message_id).values(**values))
+    db.session.commit()
+
+class SmsDispatcher:
+    """Delivers queued outbox messages on a bounded pool of worker threads.
+
+    In the web process it runs as a daemon thread started on first use; it
+    can also run in the foreground through `flask sms-dispatch`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pool = None
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.app.config['SMS_WORKERS'],
+                                            thread_name_prefix='sms-worker')
+        return self._pool
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._ensure_pool()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name='sms-dispatcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def wake(self):
+        """Signal that new messages were committed to the outbox"""
+        if self.app.config['SMS_DISPATCHER'] == 'thread':
+            self.start()
+        self._wake.set()
+
+    def run_forever(self):
+        while not self._stop.is_set():
+            try:
+                delivered = self.dispatch_once()
+            except Exception:
+                logger.exception("sms dispatcher error")
+                delivered = 0
+            # A full batch means there is probably more waiting; otherwise idle until woken
+            if delivered < self.app.config['SMS_BATCH_SIZE']:
+                self._wake.wait(self.app.config['SMS_POLL_INTERVAL'])
+                self._wake.clear()
+
+    def dispatch_once(self):
+        """Claim one batch of due messages and deliver it; returns the batch size"""
+        with self.app.app_context():
+            batch = claim_sms_batch(self.app.config['SMS_BATCH_SIZE'])
+        if batch:
+            pool = self._ensure_pool()
+            wait([pool.submit(self._deliver, *message) for message in batch])
+        return len(batch)
+
+    def _deliver(self, message_id, to_number, body, attempts):
+        sid = error = None
+        if get_sms_transport() is None:
+            error = 'Twilio credentials not configured'
+            attempts = self.app.config['SMS_MAX_ATTEMPTS'] - 1
+        else:
+            try:
+                sid = timed_sms_send(to_number, body)
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                logger.warning("sms delivery failed", extra={
+                    'message_id': message_id, 'to': to_number, 'attempt': attempts + 1, 'error': error})
+        with self.app.app_context():
+            record_sms_result(message_id, attempts + 1, sid=sid, error=error)
+
+sms_dispatcher = SmsDispatcher(app)
+
+@db.event.listens_for(db.session, 'after_commit')
+def _wake_sms_dispatcher(session):
+    if session.info.pop('sms_enqueued', False):
+        sms_dispatcher.wake()
+
+@app.cli.command("sms-dispatch")
+@click.option('--once', is_flag=True, help='Drain the due messages and exit.')
+def sms_dispatch(once):
+    """Run the SMS outbox dispatcher in the foreground"""
+    if once:
+        total = 0
+        while True:
+            delivered = sms_dispatcher.dispatch_once()
+            total += delivered
+            if not delivered:
+                break
+        print(f"Dispatched {total} message(s)")
+    else:
+        print("SMS dispatcher running. Press Ctrl+C to stop.")
+        sms_dispatcher.run_forever()
+
+@app.cli.command("sms-status")
+def sms_status():
+    """Show SMS outbox delivery counts and the most recent failures"""
+    counts = db.session.execute(
+        db.select(SmsOutbox.status, db.func.count()).group_by(SmsOutbox.status)
+    ).all()
+    for status, count in counts:
+        print(f"{status:<10}{count}")
+    failures = SmsOutbox.query.filter_by(status='failed').order_by(SmsOutbox.id.desc()).limit(10).all()
+    for entry in failures:
+        print(f"#{entry.id} to {entry.to_number} after {entry.attempts} attempt(s): {entry.last_error}")
+
+# Admin alert digests
+# GSM 03.38 basic characters count as one unit, the extension table as two;
+# anything else forces UCS-2 encoding with shorter segments
+GSM7_BASIC = set("@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+                 "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà")
+GSM7_EXTENDED = set("^{}\\[~]|€")
+
+def sms_segments(text):
+    """Number of SMS segments a message body is billed as"""
+    if all(char in GSM7_BASIC or char in GSM7_EXTENDED for char in text):
+        units = len(text) + sum(char in GSM7_EXTENDED for char in text)
+        single, multipart = 160, 153
+    else:
+        units = len(text.encode('utf-16-le')) // 2
+        single, multipart = 70, 67
+    return 1 if units <= single else -(-units // multipart)
+
+def build_digest(alerts, max_segments, max_messages):
+    """Pack alert lines into at most max_messages bodies of max_segments segments each.
+
+    Messages are numbered "(1/3) ..." when there is more than one; alerts that
+    do not fit are summarised as "+N more" at the end of the last message.
+    """
+    def fits(lines):
+        return sms_segments('(99/99) ' + '\n'.join(lines)) <= max_segments
+
+    def shorten(line, lines):
+        line = line[:160 * max_segments]
+        while len(line) > 3 and not fits(lines + [line]):
+            line = line[:-4] + '...'
+        return line
+
+    messages, current = [], [f"The Fitness Zone: {len(alerts)} alert(s)"]
+    for index, alert in enumerate(alerts):
+        if fits(current + [alert]):
+            current.append(alert)
+        elif not messages and len(current) == 1:
+            # An alert too long for a message on its own is cut short
+            current.append(shorten(alert, current))
+        elif len(messages) + 1 < max_messages:
+            messages.append(current)
+            current = [shorten(alert, [])]
+        else:
+            dropped = len(alerts) - index
+            while current and not fits(current + [f"+{dropped} more"]):
+                current.pop()
+                dropped += 1
+            current.append(f"+{dropped} more")
+            break
+    messages.append(current)
+    if len(messages) == 1:
+        return ['\n'.join(messages[0])]
+    return [f"({number}/{len(messages)}) " + '\n'.join(lines) for number, lines in enumerate(messages, start=1)]
+
+def notify_admin(*alerts):
+    """Queue admin alerts in the current transaction.
+
+    With ADMIN_DIGEST_MINUTES set they are held for the next digest;
+    otherwise each one is queued as its own SMS.
+    """
+    if not ADMIN_PHONE_NUMBER or not alerts:
+        return
+    if app.config['ADMIN_DIGEST_MINUTES'] <= 0:
+        enqueue_sms_batch([(ADMIN_PHONE_NUMBER, alert) for alert in alerts])
+        return
+    now = datetime.utcnow()
+    db.session.execute(AdminAlert.__table__.insert(),
+                       [{'body': alert[:500], 'created_at': now} for alert in alerts])
+
+def send_admin_digest():
+    """Roll every pending admin alert into digest SMS; returns the number of alerts sent"""
     with app.app_context():
-        if not TWILIO_ACCOUNT_SID or not TWILIO_AUTH_TOKEN or not TWILIO_PHONE_NUMBER:
-            print("Twilio credentials not configured. Skipping SMS.")
-            return False
+        alerts = db.session.execute(db.select(AdminAlert.id, AdminAlert.body).order_by(AdminAlert.id)).all()
+        # Housekeeping for the reminder de-duplication keys rides along
+        db.session.execute(db.delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.utcnow()))
+        if alerts and ADMIN_PHONE_NUMBER:
+            digest = build_digest([alert.body for alert in alerts], app.config['ADMIN_DIGEST_MAX_SEGMENTS'],
+                                  app.config['ADMIN_DIGEST_MAX_MESSAGES'])
+            enqueue_sms_batch([(ADMIN_PHONE_NUMBER, body) for body in digest])
+            logger.info("admin digest queued", extra={'alerts': len(alerts), 'messages': len(digest)})
+        if alerts:
+            # By id, not by range: alerts committed meanwhile wait for the next digest
+            db.session.execute(db.delete(AdminAlert).where(AdminAlert.id.in_([alert.id for alert in alerts])))
+        db.session.commit()
+        return len(alerts)
 
-        try:
-            # Format the phone number
-            if not to_number.startswith('+'):
-                # If it's an Indian number without country code
-                if len(to_number) == 10:
-                    to_number = '+91' + to_number
-                else:
-                    to_number = '+' + to_number
+@app.cli.command("send-admin-digest")
+def send_admin_digest_command():
+    """Send the pending admin alerts now as one digest"""
+    print(f"Sent {send_admin_digest()} alert(s) to the admin")
 
-            print(f"Attempting to send SMS to {to_number}")
-            
-            # Initialize Twilio client
-            client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            
-            # Send message
-            message = client.messages.create(
-                body=message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=to_number
-            )
-            print(f"SMS sent successfully. SID: {message.sid}")
-            return True
-        except Exception as e:
-            print(f"Error sending SMS: {str(e)}")
-            if hasattr(e, 'code'):
-                print(f"Twilio error code: {e.code}")
-            if hasattr(e, 'msg'):
-                print(f"Twilio error message: {e.msg}")
-            return False
+def claim_idempotency_key(key, ttl_seconds):
+    """Claim key for ttl_seconds in the current transaction; False if it is already held.
+
+    A single upsert that only overwrites an expired claim, so two workers
+    handling the same double-click cannot both succeed.
+    """
+    now = datetime.utcnow()
+    table = IdempotencyKey.__table__
+    values = {'key': key, 'expires_at': now + timedelta(seconds=ttl_seconds)}
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        return connection.execute(
+            insert(table).values(**values).on_conflict_do_update(
+                index_elements=[table.c.key], set_={'expires_at': values['expires_at']},
+                where=table.c.expires_at < now)
+        ).rowcount == 1
+    connection.execute(table.delete().where(table.c.key == key, table.c.expires_at < now))
+    try:
+        with db.session.begin_nested():
+            db.session.connection().execute(table.insert().values(**values))
+        return True
+    except IntegrityError:
+        return False
+
+def expiring_chunk_query(now, after_id, limit):
+    """Un-notified memberships expiring in the next 7 days, the chunk after customer id after_id"""
+    return db.select(
+        Customer.id, Customer.name, Customer.phone, Customer.package_type, Customer.membership_end
+    ).where(
+        Customer.membership_end <= now + timedelta(days=7),
+        Customer.membership_end > now,
+        Customer.notification_sent == False,
+        Customer.id > after_id
+    ).order_by(Customer.id).limit(limit)
+
+def reset_expired_flags_statement(now):
+    """Clear notification_sent on expired memberships so a renewal is reminded again"""
+    return (db.update(Customer)
+            .where(Customer.membership_end < now, Customer.notification_sent == True)
+            .values(notification_sent=False)
+            .execution_options(synchronize_session=False))
 
 def check_expiring_memberships():
-    """Check for memberships that are expiring soon and send notifications"""
+    """Check for memberships that are expiring soon and send notifications.
+
+    Branches are processed one at a time under branch_scope, so every
+    statement below is limited to one branch and served by the branch-led
+    indexes. Candidates are streamed in id-ordered chunks of
+    EXPIRY_JOB_CHUNK_SIZE. Each chunk queues its reminders in one bulk outbox
+    insert and marks the customers with one UPDATE ... WHERE id IN (...), in a
+    single transaction. Returns the run statistics.
+    """
     with app.app_context():
-        # Get memberships expiring in the next 7 days
-        expiring_soon = Customer.query.filter(
-            Customer.membership_end <= datetime.utcnow() + timedelta(days=7),
-            Customer.membership_end > datetime.utcnow(),
-            Customer.notification_sent == False
-        ).all()
-
-        for customer in expiring_soon:
-            # Calculate days until expiration
-            days_left = (customer.membership_end - datetime.utcnow()).days
-            
-            # Send notification to customer
-            customer_message = (
-                f"Dear {customer.name}, your {customer.package_type} membership at The Fitness Zone "
-                f"will expire in {days_left} days. Please renew to continue enjoying our services!"
-            )
-            print(f"Attempting to send expiration reminder to customer: {customer.phone}")
-            customer_sms_sent = send_sms(customer.phone, customer_message)
-            if customer_sms_sent:
-                print(f"Expiration reminder sent successfully to {customer.phone}")
-            else:
-                print(f"Failed to send expiration reminder to {customer.phone}")
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        chunk_size = app.config['EXPIRY_JOB_CHUNK_SIZE']
+        stats = {'branches': 0, 'chunks': 0, 'notified': 0, 'messages': 0, 'admin_alerts': 0, 'reset': 0}
 
-            # Send notification to admin
-            admin_message = (
-                f"ALERT: Customer {customer.name}'s {customer.package_type} membership at The Fitness Zone "
-                f"will expire in {days_left} days. Contact: {customer.phone}"
-            )
-            if ADMIN_PHONE_NUMBER:
-                print(f"Attempting to send admin notification to: {ADMIN_PHONE_NUMBER}")
-                admin_sms_sent = send_sms(ADMIN_PHONE_NUMBER, admin_message)
-                if admin_sms_sent:
-                    print(f"Admin notification sent successfully to {ADMIN_PHONE_NUMBER}")
-                else:
-                    print(f"Failed to send admin notification to {ADMIN_PHONE_NUMBER}")
+        branch_ids = db.session.execute(db.select(Branch.id).order_by(Branch.id)).scalars().all()
+        for branch_id in branch_ids:
+            with branch_scope(branch_id):
+                last_id = 0
+                while True:
+                    # Keyset paging never revisits a chunk, so a lagging replica cannot re-notify anyone
+                    with replica_reads('check_expiring_memberships'):
+                        chunk = db.session.execute(expiring_chunk_query(now, last_id, chunk_size)).all()
+                    if not chunk:
+                        break
+                    last_id = chunk[-1].id
 
-            # Mark notification as sent
-            customer.notification_sent = True
-            db.session.commit()
-            
-        # Reset notification_sent flag for expired memberships to allow re-notification
-        expired = Customer.query.filter(
-            Customer.membership_end < datetime.utcnow(),
-            Customer.notification_sent == True
-        ).all()
-        
-        for customer in expired:
-            customer.notification_sent = False
-            db.session.commit()
+                    messages, alerts = [], []
+                    for customer in chunk:
+                        # Calculate days until expiration
+                        days_left = (customer.membership_end - now).days
+                        messages.append((customer.phone, (
+                            f"Dear {customer.name}, your {customer.package_type} membership at The Fitness Zone "
+                            f"will expire in {days_left} days. Please renew to continue enjoying our services!"
+                        )))
+                        alerts.append(f"Expiring in {days_left}d: {customer.name} ({customer.package_type}), "
+                                      f"{customer.phone}")
+                    enqueue_sms_batch(messages)
+                    notify_admin(*alerts)
+
+                    # Mark notification as sent for the whole chunk
+                    db.session.execute(
+                        db.update(Customer)
+                        .where(Customer.id.in_([customer.id for customer in chunk]))
+                        .values(notification_sent=True)
+                        .execution_options(synchronize_session=False)
+                    )
+                    db.session.commit()
+
+                    stats['chunks'] += 1
+                    stats['notified'] += len(chunk)
+                    stats['messages'] += len(messages)
+                    stats['admin_alerts'] += len(alerts) if ADMIN_PHONE_NUMBER else 0
+
+                # Reset notification_sent flag for expired memberships to allow re-notification
+                result = db.session.execute(reset_expired_flags_statement(now))
+                db.session.commit()
+                stats['reset'] += result.rowcount
+            stats['branches'] += 1
+
+        stats['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info("expiry check finished", extra=stats)
+        return stats
+
+@app.cli.command("check-expiring")
+def check_expiring():
+    """Run the membership expiry notification job once"""
+    check_expiring_memberships()
+
+# Scheduler
+scheduler = None
+
+def scheduler_holder():
+    """Identify this process in lease rows; evaluated per call so forked workers differ"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def acquire_job_lock(name, ttl_seconds, min_interval_seconds):
+    """Take the lease for a job, returning True if this process may run it.
+
+    The lease is granted only when nobody holds it and the job has not been
+    started within min_interval_seconds, so workers whose triggers fire a few
+    seconds apart do not repeat the same cycle.
+    """
+    now = datetime.utcnow()
+    values = {'holder': scheduler_holder(), 'locked_until': now + timedelta(seconds=ttl_seconds),
+              'last_started_at': now}
+    result = db.session.execute(
+        db.update(SchedulerLock)
+        .where(
+            SchedulerLock.name == name,
+            SchedulerLock.locked_until < now,
+            db.or_(SchedulerLock.last_started_at.is_(None),
+                   SchedulerLock.last_started_at <= now - timedelta(seconds=min_interval_seconds))
+        )
+        .values(**values)
+    )
+    if result.rowcount == 1:
+        db.session.commit()
+        return True
+    db.session.rollback()
+
+    if db.session.get(SchedulerLock, name) is not None:
+        return False
+    try:
+        db.session.add(SchedulerLock(name=name, **values))
+        db.session.commit()
+        return True
+    except IntegrityError:
+        # Another process created the row first and owns this cycle
+        db.session.rollback()
+        return False
+
+def release_job_lock(name, status):
+    """Give up the lease once the job finished, recording its outcome"""
+    now = datetime.utcnow()
+    db.session.execute(
+        db.update(SchedulerLock)
+        .where(SchedulerLock.name == name, SchedulerLock.holder == scheduler_holder())
+        .values(locked_until=now, last_finished_at=now, last_status=status)
+    )
+    db.session.commit()
+
+def run_locked_job(name, func, interval_seconds):
+    """Run a scheduled job if this process wins its lease for the current cycle"""
+    with app.app_context():
+        if not acquire_job_lock(name, app.config['SCHEDULER_LOCK_TTL_SECONDS'], interval_seconds / 2):
+            return False
+    status = 'ok'
+    try:
+        func()
+    except Exception:
+        status = 'error'
+        logger.exception("scheduled job failed", extra={'job': name})
+    finally:
+        with app.app_context():
+            release_job_lock(name, status)
+    return True
+
+def build_scheduler(scheduler_class=None):
+    """Create a scheduler with every periodic job registered"""
+    if scheduler_class is None:
+        from apscheduler.schedulers.background import BackgroundScheduler as scheduler_class
+    new_scheduler = scheduler_class(timezone='UTC', job_defaults={
+        'coalesce': True,
+        'max_instances': 1,
+        'misfire_grace_time': app.config['SCHEDULER_MISFIRE_GRACE_SECONDS'],
+    })
+    interval = app.config['EXPIRY_JOB_INTERVAL_MINUTES'] * 60
+    new_scheduler.add_job(
+        run_locked_job, 'interval', seconds=interval,
+        jitter=app.config['SCHEDULER_JITTER_SECONDS'],
+        args=['check_expiring_memberships', check_expiring_memberships, interval],
+        id='check_expiring_memberships', replace_existing=True,
+        next_run_time=datetime.utcnow().replace(tzinfo=timezone.utc)
+    )
+    digest_interval = app.config['ADMIN_DIGEST_MINUTES'] * 60
+    if digest_interval > 0:
+        new_scheduler.add_job(
+            run_locked_job, 'interval', seconds=digest_interval,
+            args=['admin_digest', send_admin_digest, digest_interval],
+            id='admin_digest', replace_existing=True
+        )
+    # Keeps the next months' fee partitions ready; a no-op unless fee is partitioned
+    new_scheduler.add_job(
+        run_locked_job, 'interval', hours=24,
+        args=['fee_partitions', ensure_fee_partitions, 24 * 3600],
+        id='fee_partitions', replace_existing=True,
+        next_run_time=datetime.utcnow().replace(tzinfo=timezone.utc)
+    )
+    return new_scheduler
+
+def start_scheduler():
+    """Start the embedded background scheduler once per process.
+
+    Called from gunicorn's post_worker_init hook so the thread is created
+    after fork, never in the preloading master.
+    """
+    global scheduler
+    if app.config['SCHEDULER_MODE'] != 'embedded' or scheduler is not None:
+        return scheduler
+    scheduler = build_scheduler()
+    scheduler.start()
+    atexit.register(lambda: scheduler.shutdown(wait=False))
+    logger.info("scheduler started", extra={'holder': scheduler_holder()})
+    return scheduler
+
+@app.cli.command("run-scheduler")
+def run_scheduler():
+    """Run the periodic jobs in the foreground (use with SCHEDULER_MODE=off)"""
+    print(f"Scheduler running in {scheduler_holder()}. Press Ctrl+C to stop.")
+    from apscheduler.schedulers.blocking import BlockingScheduler
+    try:
+        build_scheduler(BlockingScheduler).start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+class StaffIdentity(UserMixin):
+    """Session-independent copy of the User fields requests read through current_user"""
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.is_admin = bool(user.is_admin)
+        self.branch_id = user.branch_id
+
+class UserCache:
+    """Bounded LRU of staff identities for the user_loader.
+
+    Commits in this process that touch User clear it through
+    invalidate_user_caches(); other workers' changes bump the 'users' cache
+    version, which is re-read at most every USER_CACHE_TTL seconds.
+    """
+
+    def __init__(self):
+        self._users = OrderedDict()
+        self._version = None
+        self._checked_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        if time.monotonic() - self._checked_at >= app.config['USER_CACHE_TTL']:
+            self._check_version()
+        with self._lock:
+            identity = self._users.get(user_id)
+            if identity is not None:
+                self._users.move_to_end(user_id)
+            generation = self._generation
+        USER_CACHE_TOTAL.inc(result='hit' if identity is not None else 'miss')
+        if identity is not None:
+            return identity
+        with primary_reads():
+            user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        identity = StaffIdentity(user)
+        with self._lock:
+            # Skip caching a row read before a concurrent invalidation
+            if generation == self._generation:
+                self._users[user_id] = identity
+                while len(self._users) > app.config['USER_CACHE_SIZE']:
+                    self._users.popitem(last=False)
+        return identity
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+            self._generation += 1
+
+    def _check_version(self):
+        version = read_cache_version('users')
+        with self._lock:
+            if version != self._version:
+                self._users.clear()
+                self._generation += 1
+                self._version = version
+            self._checked_at = time.monotonic()
+
+user_cache = UserCache()
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
+
+@app.before_request
+def _scope_request_to_branch():
+    # Staff are pinned to their branch; head office work in the branch picked with switch_branch
+    if current_user.is_authenticated:
+        branch_id = current_user.branch_id
+        if branch_id is None:
+            branch_id = session.get('branch_id', DEFAULT_BRANCH_ID)
+        db.session.info['branch_id'] = branch_id
+
+# Process-local caches keyed to cache_version rows
+_admin_exists_cache = {'value': False, 'version': None, 'checked_at': 0.0}
+
+def bump_cache_version(connection, name):
+    """Increment a cache_version counter inside the current transaction; returns the new version"""
+    table = CacheVersion.__table__
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        connection.execute(
+            insert(table).values(name=name, version=1)
+            .on_conflict_do_update(index_elements=[table.c.name], set_={'version': table.c.version + 1})
+        )
+    elif connection.execute(
+        table.update().where(table.c.name == name).values(version=table.c.version + 1)
+    ).rowcount == 0:
+        connection.execute(table.insert().values(name=name, version=1))
+    return connection.execute(db.select(table.c.version).where(table.c.name == name)).scalar()
+
+def read_cache_version(name):
+    with primary_reads():
+        return db.session.execute(
+            db.select(CacheVersion.version).where(CacheVersion.name == name)
+        ).scalar() or 0
+
+def invalidate_user_caches():
+    """Drop every process-local cache derived from the User table"""
+    _admin_exists_cache['value'] = False
+    user_cache.clear()
+
+@db.event.listens_for(db.session, 'after_flush')
+def _bump_users_version(session, flush_context):
+    if any(isinstance(obj, User) for obj in (*session.new, *session.dirty, *session.deleted)):
+        bump_cache_version(session.connection(), 'users')
+        session.info['users_changed'] = True
+
+@db.event.listens_for(db.session, 'after_commit')
+def _invalidate_local_user_caches(session):
+    if session.info.pop('users_changed', False):
+        invalidate_user_caches()
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _forget_user_changes(session):
+    session.info.pop('users_changed', None)
+
+def admin_user_query():
+    return User.query.filter_by(is_admin=True)
 
 def admin_exists():
-    """Check if an admin user exists in the database"""
+    """Check if an admin user exists in the database.
+
+    Once an admin exists the answer is cached in this process. Commits that
+    touch User here clear it immediately; other workers' writes show up
+    through the 'users' cache version, re-read at most every ADMIN_CACHE_TTL
+    seconds, so the common case costs no database round-trip.
+    """
+    cache = _admin_exists_cache
+    if cache['value'] and time.monotonic() - cache['checked_at'] < app.config['ADMIN_CACHE_TTL']:
+        return True
     with app.app_context():
-        return User.query.filter_by(is_admin=True).first() is not None
+        version = read_cache_version('users')
+        if cache['value'] and cache['version'] == version:
+            cache['checked_at'] = time.monotonic()
+            return True
+        with primary_reads():
+            exists = admin_user_query().first() is not None
+        cache.update(value=exists, version=version, checked_at=time.monotonic())
+        return exists
+
+_branch_names_cache = {'names': None, 'version': None, 'checked_at': 0.0}
+
+def branch_names():
+    """Map of branch id to name, cached per process and re-read when the 'branches' version moves"""
+    cache = _branch_names_cache
+    if cache['names'] is not None and time.monotonic() - cache['checked_at'] < app.config['USER_CACHE_TTL']:
+        return cache['names']
+    version = read_cache_version('branches')
+    if cache['names'] is None or cache['version'] != version:
+        with primary_reads():
+            names = dict(db.session.execute(db.select(Branch.id, Branch.name).order_by(Branch.id)).all())
+        cache.update(names=names, version=version)
+    cache['checked_at'] = time.monotonic()
+    return cache['names']
+
+@app.context_processor
+def inject_branch():
+    # The navbar shows the current branch; head office also get a switcher
+    if not current_user.is_authenticated:
+        return {}
+    names, branch_id = branch_names(), current_branch_id()
+    return {'current_branch_id': branch_id, 'branch_name': names.get(branch_id),
+            'switch_branches': names if current_user.branch_id is None and len(names) > 1 else {}}
 
 # Routes
 @app.route('/')
@@ -311,27 +2244,25 @@ def register_customer():
             return redirect(url_for('register_customer'))
         
         # Get package details
-        package = PACKAGES.get(package_type)
-        if not package:
+        price_book = pricing.current()
+        if package_type not in price_book.packages:
             flash('Invalid package type.', 'error')
             return redirect(url_for('register_customer'))
+        if has_personal_training and personal_training_type not in price_book.training:
+            flash('Invalid personal training type.', 'error')
+            return redirect(url_for('register_customer'))
         
         # Calculate membership end date
         join_date = datetime.utcnow()
         end_date = join_date + timedelta(days=30 * duration_months)
         
         # Calculate total amount
-        total_amount = package['total']
-        discount = package['discount']
-        
-        # Add personal training fees if selected
-        if has_personal_training and personal_training_type:
-            pt_package = PERSONAL_TRAINING[personal_training_type]
-            total_amount += pt_package['fees'] - pt_package['discount']
-            
-        # Add treadmill fee if selected (₹500 per month)
-        if treadmill_access:
-            total_amount += 500 * duration_months
+        fees = price_book.registration(
+            package_type, duration_months,
+            personal_training_type if has_personal_training else None,
+            treadmill_access
+        )
+        total_amount = fees['total_amount']
         
         customer = Customer(
             name=name,
@@ -343,11 +2274,8 @@ def register_customer():
             has_personal_training=has_personal_training,
             personal_training_type=personal_training_type if has_personal_training else None,
             trainer_id=current_user.id if has_personal_training else None,
-            admission_fee=package.get('admission_fee', 0),
-            package_fee=package['fees'],
-            discount=discount,
-            total_amount=total_amount,
-            treadmill_access=treadmill_access
+            treadmill_access=treadmill_access,
+            **fees
         )
         
         # Add initial payment record
@@ -355,127 +2283,285 @@ def register_customer():
         customer.pending_amount = total_amount - initial_payment
         
         db.session.add(customer)
+        db.session.flush()
+        membership_changed(customer.id, customer.membership_end, customer.name)
+
+        if initial_payment > 0:
+            fee = Fee(
+                customer_id=customer.id,
+                amount=initial_payment,
+                payment_type='registration',
+                description='Initial registration payment',
+                collected_by=current_user.id
+            )
+            db.session.add(fee)
+
+        # Queue welcome SMS to customer
+        welcome_message = (
+            f"Welcome to The Fitness Zone, {customer.name}! Your {customer.package_type} membership "
+            f"has been activated. Your membership will expire on {customer.membership_end.strftime('%d-%m-%Y')}. "
+            f"Thank you for choosing us!"
+        )
+        enqueue_sms(customer.phone, welcome_message)
+
+        # Notify admin in the next digest
+        notify_admin(
+            f"New customer: {customer.name}, {customer.package_type}, "
+            f"{customer.phone}, expires {customer.membership_end.strftime('%d-%m-%Y')}"
+        )
+
+        # Customer, initial payment and notifications are committed together
         db.session.commit()
 
-        if initial_payment > 0:
-            fee = Fee(
-                customer_id=customer.id,
-                amount=initial_payment,
-                payment_type='registration',
-                description='Initial registration payment',
-                collected_by=current_user.id
-            )
-            db.session.add(fee)
-            db.session.commit()
+        flash('Customer registered successfully!', 'success')
+        return redirect(url_for('view_customers'))
+    
+    price_book = pricing.current()
+    return render_template('register_customer.html', packages=price_book.packages,
+                           personal_training=price_book.training, treadmill_monthly=price_book.treadmill_monthly)
+
+# Customer list pagination
+# Each sort is keyed on (column, id) so pages can be fetched with a seek
+# condition on the composite index instead of OFFSET scans.
+CUSTOMER_SORTS = {
+    'expiry': ('membership_end', False),
+    'expiry_desc': ('membership_end', True),
+    'name': ('name', False),
+    'name_desc': ('name', True),
+}
+PAGE_SIZES = (25, 50, 100, 200)
+DEFAULT_PAGE_SIZE = 50
+
+def encode_cursor(row, column):
+    """Encode the sort key of a customer (or fee) row as an opaque URL-safe cursor"""
+    value = getattr(row, column)
+    if isinstance(value, datetime):
+        value = value.isoformat()
+    raw = json.dumps([value, row.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor, column):
+    """Decode a cursor produced by encode_cursor, returning None if it is invalid"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        decoded = json.loads(raw)
+        # Every sort key is a name or an ISO timestamp, followed by the row id
+        if not isinstance(decoded, list) or len(decoded) != 2:
+            return None
+        value, row_id = decoded
+        if not isinstance(value, str) or not isinstance(row_id, int) or isinstance(row_id, bool):
+            return None
+        if column in ('membership_end', 'payment_date'):
+            value = datetime.fromisoformat(value)
+        return value, row_id
+    except (ValueError, TypeError):
+        return None
+
+def request_cursor(after, before, column):
+    """Decode the after/before cursor of a page request into (cursor, backwards); a malformed one is a 400"""
+    if not (before or after):
+        return None, False
+    cursor = decode_cursor(before or after, column)
+    if cursor is None:
+        abort(400, description='Invalid page cursor.')
+    return cursor, bool(before)
+
+def page_cursors(rows, column, per_page, cursor, backwards):
+    """Trim a page fetched with one extra row and work out its (rows, next, prev) cursors"""
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        first = encode_cursor(rows[0], column)
+        last = encode_cursor(rows[-1], column)
+        if backwards:
+            next_cursor = last
+            prev_cursor = first if has_more else None
+        else:
+            next_cursor = last if has_more else None
+            prev_cursor = first if cursor is not None else None
+    return rows, next_cursor, prev_cursor
+
+def paginate_customers(query, sort, per_page, after=None, before=None):
+    """Fetch one page of customers using keyset (seek) pagination.
+
+    Returns (customers, next_cursor, prev_cursor). Cursors are None when there
+    is no page in that direction.
+    """
+    column_name = CUSTOMER_SORTS[sort][0]
+    cursor, backwards = request_cursor(after, before, column_name)
+    rows = customer_page_query(query, sort, per_page, cursor, backwards).all()
+    return page_cursors(rows, column_name, per_page, cursor, backwards)
+
+def customer_page_query(query, sort, per_page, cursor=None, backwards=False):
+    """Seek past cursor in sort order (reversed when walking backwards), one row more than a page"""
+    column_name, descending = CUSTOMER_SORTS[sort]
+    column = getattr(Customer, column_name)
+    key = db.tuple_(column, Customer.id)
+
+    # Walking backwards flips the scan direction; page_cursors reverses the rows
+    reverse = descending != backwards
+    if cursor is not None:
+        query = query.filter(key < cursor if reverse else key > cursor)
+    if reverse:
+        query = query.order_by(column.desc(), Customer.id.desc())
+    else:
+        query = query.order_by(column.asc(), Customer.id.asc())
+
+    # One extra row tells whether another page exists
+    return query.limit(per_page + 1)
+
+FEE_HISTORY_PAGE_SIZE = 25
+
+def paginate_fees(customer_id, per_page, after=None, before=None, archived=False):
+    """Fetch one page of a customer's payments, newest first, by keyset on (payment_date, id).
+
+    Reads the hot fee table through its (branch_id, customer_id,
+    payment_date) index, or hot and archived payments when archived is set.
+    Returns (fees, next_cursor, prev_cursor) like paginate_customers; next is
+    older.
+    """
+    cursor, backwards = request_cursor(after, before, 'payment_date')
+    fees = db.session.execute(fee_page_query(customer_id, per_page, cursor, backwards, archived)).all()
+    return page_cursors(fees, 'payment_date', per_page, cursor, backwards)
+
+def fee_page_query(customer_id, per_page, cursor=None, backwards=False, archived=False):
+    """Seek past cursor through a customer's payments, newest first (oldest first backwards), one row more than a page"""
+    if archived:
+        source = fee_ledger(customer_id=customer_id)
+        query = db.select(source)
+    else:
+        # ORM columns, so the session's branch scope applies
+        source = Fee.__table__
+        query = db.select(*(getattr(Fee, name) for name in FEE_LEDGER_COLUMNS)).where(Fee.customer_id == customer_id)
+    key = db.tuple_(source.c.payment_date, source.c.id)
+
+    if cursor is not None:
+        query = query.where(key > cursor if backwards else key < cursor)
+    if backwards:
+        query = query.order_by(source.c.payment_date.asc(), source.c.id.asc())
+    else:
+        query = query.order_by(source.c.payment_date.desc(), source.c.id.desc())
+    return query.limit(per_page + 1)
+
+def archived_payment_count_query(customer_id):
+    return db.select(db.func.count()).select_from(FeeArchive).where(FeeArchive.customer_id == customer_id)
 
-        # Send welcome SMS to customer
-        welcome_message = (
-            f"Welcome to The Fitness Zone, {customer.name}! Your {customer.package_type} membership "
-            f"has been activated. Your membership will expire on {customer.membership_end.strftime('%d-%m-%Y')}. "
-            f"Thank you for choosing us!"
-        )
-        print(f"Attempting to send welcome SMS to customer: {customer.phone}")
-        customer_sms_sent = send_sms(customer.phone, welcome_message)
-        if customer_sms_sent:
-            print(f"Welcome SMS sent successfully to {customer.phone}")
-        else:
-            print(f"Failed to send welcome SMS to {customer.phone}")
+PHONE_SEARCH_RE = re.compile(r'^\+?[\d\s-]+$')
+PHONE_SEARCH_MIN_DIGITS = 3
 
-        # Send notification to admin
-        admin_notification = (
-            f"New customer registered: {customer.name}, {customer.package_type} package, "
-            f"Phone: {customer.phone}, Expiry: {customer.membership_end.strftime('%d-%m-%Y')}"
-        )
-        if ADMIN_PHONE_NUMBER:
-            print(f"Attempting to send admin notification to: {ADMIN_PHONE_NUMBER}")
-            admin_sms_sent = send_sms(ADMIN_PHONE_NUMBER, admin_notification)
-            if admin_sms_sent:
-                print(f"Admin notification sent successfully to {ADMIN_PHONE_NUMBER}")
-            else:
-                print(f"Failed to send admin notification to {ADMIN_PHONE_NUMBER}")
+def customer_search_filter(search_query):
+    """Build the WHERE clause for the customer search box.
 
-        flash('Customer registered successfully!', 'success')
-        return redirect(url_for('view_customers'))
-    
-    return render_template('register_customer.html', packages=PACKAGES, personal_training=PERSONAL_TRAINING)
+    Name and email are matched as substrings through the dialect's search
+    index; text that looks like a phone number is also matched as a prefix
+    of the digits-only column.
+    """
+    text = search_query.strip()
+    clauses = []
+
+    digits = normalize_phone(text) if PHONE_SEARCH_RE.match(text) else ''
+    if len(digits) >= PHONE_SEARCH_MIN_DIGITS:
+        # Range form of LIKE 'digits%' that every dialect can serve from a b-tree
+        clauses.append(db.and_(Customer.phone_digits >= digits,
+                               Customer.phone_digits < digits + ':'))
+
+    if db.engine.dialect.name == 'sqlite' and len(text) >= 3:
+        # Quoted so FTS5 treats the input as a literal substring, not query syntax
+        match = '"' + text.replace('"', '""') + '"'
+        clauses.append(Customer.id.in_(
+            db.text("SELECT rowid FROM customer_search WHERE customer_search MATCH :match")
+            .bindparams(match=match)
+            .columns(db.column('rowid'))
+        ))
+    else:
+        # Served by the pg_trgm indexes on PostgreSQL; terms shorter than a
+        # trigram fall back to a scan bounded by the page LIMIT
+        clauses.append(Customer.name.ilike(f'%{text}%'))
+        clauses.append(Customer.email.ilike(f'%{text}%'))
+    return db.or_(*clauses)
+
+def customer_list_query(search_query=''):
+    """Customers shown on the list, narrowed by the search box"""
+    query = Customer.query
+    if search_query:
+        query = query.filter(customer_search_filter(search_query))
+    return query
 
 @app.route('/view_customers')
 @login_required
 def view_customers():
     search_query = request.args.get('search', '')
+    sort = request.args.get('sort', 'expiry')
+    if sort not in CUSTOMER_SORTS:
+        sort = 'expiry'
+    per_page = request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int)
+    if per_page not in PAGE_SIZES:
+        per_page = DEFAULT_PAGE_SIZE
     
-    if search_query:
-        # Search in name, email, and phone
-        customers = Customer.query.filter(
-            db.or_(
-                Customer.name.ilike(f'%{search_query}%'),
-                Customer.email.ilike(f'%{search_query}%'),
-                Customer.phone.ilike(f'%{search_query}%')
-            )
-        ).all()
-    else:
-        customers = Customer.query.all()
+    customers, next_cursor, prev_cursor = paginate_customers(
+        customer_list_query(search_query), sort, per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
     
-    total_fees = db.session.query(db.func.sum(Fee.amount)).scalar() or 0
-    today_fees = db.session.query(db.func.sum(Fee.amount)).filter(
-        db.func.date(Fee.payment_date) == datetime.utcnow().date()
-    ).scalar() or 0
+    total_fees, today_fees = revenue_totals()
     
     return render_template('view_customers.html', 
                          customers=customers, 
                          now=datetime.utcnow(),
                          total_fees=total_fees,
                          today_fees=today_fees,
-                         search_query=search_query)
+                         search_query=search_query,
+                         sort=sort,
+                         per_page=per_page,
+                         page_sizes=PAGE_SIZES,
+                         next_cursor=next_cursor,
+                         prev_cursor=prev_cursor)
 
 @app.route('/send_reminder/<int:customer_id>', methods=['POST'])
 @login_required
 def send_reminder(customer_id):
     customer = Customer.query.get_or_404(customer_id)
-    
+
+    # A double-click or a second desk re-sending within the window is dropped
+    window = app.config['REMINDER_DEDUP_MINUTES']
+    if window > 0 and not claim_idempotency_key(f"reminder:{customer.id}", window * 60):
+        db.session.rollback()
+        flash(f'A reminder was already sent to {customer.name} in the last {window} minutes.', 'info')
+        return redirect(url_for('view_customers'))
+
     # Calculate days until expiration
     days_left = (customer.membership_end - datetime.utcnow()).days
     
-    # Send notification to customer
+    # Queue notification to customer
     customer_message = (
         f"Dear {customer.name}, your {customer.package_type} membership at The Fitness Zone "
         f"will expire in {days_left} days. Please renew to continue enjoying our services!"
     )
-    print(f"Attempting to send reminder SMS to customer: {customer.phone}")
-    customer_sms_sent = send_sms(customer.phone, customer_message)
-    if customer_sms_sent:
-        print(f"Reminder SMS sent successfully to {customer.phone}")
-    else:
-        print(f"Failed to send reminder SMS to {customer.phone}")
+    enqueue_sms(customer.phone, customer_message)
 
-    # Send notification to admin
-    admin_message = (
-        f"ALERT: Customer {customer.name}'s {customer.package_type} membership at The Fitness Zone "
-        f"will expire in {days_left} days. Contact: {customer.phone}"
-    )
-    admin_sms_sent = False
-    if ADMIN_PHONE_NUMBER:
-        print(f"Attempting to send admin notification to: {ADMIN_PHONE_NUMBER}")
-        admin_sms_sent = send_sms(ADMIN_PHONE_NUMBER, admin_message)
-        if admin_sms_sent:
-            print(f"Admin notification sent successfully to {ADMIN_PHONE_NUMBER}")
-        else:
-            print(f"Failed to send admin notification to {ADMIN_PHONE_NUMBER}")
-    
-    if customer_sms_sent:
-        flash(f'Reminder sent to {customer.name}.', 'success')
-    else:
-        flash(f'Failed to send reminder to {customer.name}.', 'error')
+    # Notify admin in the next digest
+    notify_admin(f"Reminder sent, expiring in {days_left}d: {customer.name} ({customer.package_type}), {customer.phone}")
+
+    db.session.commit()
+    flash(f'Reminder queued for {customer.name}.', 'success')
         
     return redirect(url_for('view_customers'))
 
+def user_by_username_query(username):
+    return User.query.filter_by(username=username)
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         
-        user = User.query.filter_by(username=username).first()
+        user = user_by_username_query(username).first()
         
         if user and user.password == password:
             login_user(user)
@@ -490,16 +2576,38 @@ def login():
 @login_required
 def logout():
     logout_user()
+    session.pop('branch_id', None)
     flash('Logged out successfully.', 'success')
     return redirect(url_for('login'))
 
+@app.route('/switch_branch', methods=['POST'])
+@login_required
+def switch_branch():
+    """Head office: choose the branch the following requests work in"""
+    if current_user.branch_id is not None:
+        flash('Your account belongs to one branch.', 'error')
+        return redirect(url_for('index'))
+    branch_id = request.form.get('branch_id', type=int)
+    if branch_id not in branch_names():
+        flash('Unknown branch.', 'error')
+        return redirect(url_for('index'))
+    session['branch_id'] = branch_id
+    flash(f'Now working in {branch_names()[branch_id]}.', 'success')
+    return redirect(url_for('view_customers'))
+
 @app.route('/delete_customer/<int:customer_id>', methods=['POST'])
 @login_required
 def delete_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
+    # Write queued scans first (in their own transaction) so they are deleted too
+    checkin_worker.flush()
     
-    # Delete all fees associated with this customer
+    # Delete all fees and attendance associated with this customer
+    remove_customer_revenue(customer_id)
     Fee.query.filter_by(customer_id=customer_id).delete()
+    FeeArchive.query.filter_by(customer_id=customer_id).delete()
+    Attendance.query.filter_by(customer_id=customer_id).delete()
+    membership_changed(customer_id, None)
     
     # Delete the customer
     db.session.delete(customer)
@@ -508,10 +2616,44 @@ def delete_customer(customer_id):
     flash(f'Customer {customer.name} has been deleted.', 'success')
     return redirect(url_for('view_customers'))
 
+# Payment posting
+# Balances are changed by a single UPDATE computed in the database rather than
+# read into Python and written back, so payments and extensions posted at the
+# same time from different terminals cannot overwrite each other.
+def pending_after(charge=0, payment=0):
+    """SQL expression for the pending balance after a charge and a payment.
+
+    An overpayment leaves a negative balance: credit that the next charge uses up.
+    """
+    return db.func.coalesce(Customer.pending_amount, 0) + charge - payment
+
+def post_payment(customer_id, amount, payment_type, description, collected_by):
+    """Reduce a customer's balance and record the payment in the current transaction.
+
+    Returns the new pending amount, or None when the customer does not exist.
+    The caller commits.
+    """
+    pending = db.session.execute(
+        db.update(Customer)
+        .where(Customer.id == customer_id)
+        .values(pending_amount=pending_after(payment=amount))
+        .returning(Customer.pending_amount)
+        .execution_options(synchronize_session='fetch')
+    ).scalar()
+    if pending is None:
+        return None
+    db.session.add(Fee(
+        customer_id=customer_id,
+        amount=amount,
+        payment_type=payment_type,
+        description=description,
+        collected_by=collected_by
+    ))
+    return pending
+
 @app.route('/add_fee/<int:customer_id>', methods=['POST'])
 @login_required
 def add_fee(customer_id):
-    customer = Customer.query.get_or_404(customer_id)
     amount = float(request.form.get('amount', 0))
     payment_type = request.form.get('payment_type', 'monthly')
     description = request.form.get('description', '')
@@ -520,27 +2662,20 @@ def add_fee(customer_id):
         flash('Amount must be greater than zero.', 'error')
         return redirect(url_for('view_customers'))
     
-    fee = Fee(
-        customer_id=customer_id,
-        amount=amount,
-        payment_type=payment_type,
-        description=description,
-        collected_by=current_user.id
-    )
-
-    # Update pending amount
-    if customer.pending_amount >= amount:
-        customer.pending_amount -= amount
-    
     try:
-        db.session.add(fee)
+        pending = post_payment(customer_id, amount, payment_type, description, current_user.id)
         db.session.commit()
-        flash(f'Payment of ₹{amount} has been recorded successfully.', 'success')
-    except Exception as e:
+    except Exception:
         db.session.rollback()
         flash('An error occurred while recording the payment.', 'error')
-        print(f"Error recording payment: {str(e)}")
+        logger.exception("payment recording failed", extra={'customer_id': customer_id})
+        return redirect(url_for('view_customers'))
 
+    if pending is None:
+        abort(404)
+    flash(f'Payment of ₹{amount} has been recorded successfully.', 'success')
+    if pending < 0:
+        flash(f'₹{-pending:.2f} was paid in advance and is kept as credit.', 'info')
     return redirect(url_for('view_customers'))
 
 @app.route('/test_sms')
@@ -581,27 +2716,33 @@ def extend_membership(customer_id):
         current_end_date = customer.membership_end
         new_end_date = current_end_date + timedelta(days=30 * extension_period)
         
-        # Calculate extension fee
-        extension_fee = 0
-        if customer.package_type == 'basic':
-            extension_fee = 1500 * extension_period
-        elif customer.package_type == 'standard':
-            extension_fee = 2000 * extension_period
-        elif customer.package_type == 'premium':
-            extension_fee = 2500 * extension_period
-        
-        # Add treadmill fee if applicable
-        if customer.treadmill_access:
-            extension_fee += 500 * extension_period
-        
-        # Add personal training fee if applicable
-        if customer.has_personal_training and customer.personal_training_type:
-            pt_package = PERSONAL_TRAINING[customer.personal_training_type]
-            extension_fee += (pt_package['fees'] - pt_package['discount']) * extension_period
+        # Calculate extension fee (package, personal training and treadmill per month)
+        try:
+            extension_fee = pricing.current().renewal(
+                customer.package_type, extension_period,
+                customer.personal_training_type if customer.has_personal_training else None,
+                customer.treadmill_access
+            )
+        except KeyError:
+            flash(f'No renewal price for the {customer.package_type} package in the price catalog.', 'error')
+            return redirect(url_for('extend_membership', customer_id=customer_id))
         
-        # Update customer details
-        customer.membership_end = new_end_date
-        customer.pending_amount = extension_fee - initial_payment
+        # Add the extension fee to any existing arrears and move the expiry, in one
+        # statement; the membership_end guard turns a concurrent extension of the
+        # same member into a conflict instead of a lost update
+        extended = db.session.execute(
+            db.update(Customer)
+            .where(Customer.id == customer.id, Customer.membership_end == current_end_date)
+            .values(membership_end=new_end_date,
+                    pending_amount=pending_after(charge=extension_fee, payment=initial_payment))
+            .returning(Customer.pending_amount)
+            .execution_options(synchronize_session='fetch')
+        ).scalar()
+        if extended is None:
+            db.session.rollback()
+            flash('This membership was just changed at another desk. Please review it and try again.', 'error')
+            return redirect(url_for('extend_membership', customer_id=customer_id))
+        membership_changed(customer.id, new_end_date, customer.name)
         
         # Add payment record if initial payment is provided
         if initial_payment > 0:
@@ -614,34 +2755,116 @@ def extend_membership(customer_id):
             )
             db.session.add(fee)
         
-        db.session.commit()
-        
-        # Send SMS notification to customer
+        # Queue SMS notification to customer
         customer_message = (
             f"Dear {customer.name}, your {customer.package_type} membership at The Fitness Zone "
             f"has been extended by {extension_period} month(s). Your new expiry date is "
             f"{new_end_date.strftime('%d-%m-%Y')}. Thank you for choosing us!"
         )
-        customer_sms_sent = send_sms(customer.phone, customer_message)
+        enqueue_sms(customer.phone, customer_message)
         
-        # Send notification to admin
-        admin_message = (
-            f"Membership extended: {customer.name}, {customer.package_type} package, "
-            f"Extended by: {extension_period} month(s), New expiry: {new_end_date.strftime('%d-%m-%Y')}"
+        # Notify admin in the next digest
+        notify_admin(
+            f"Extended: {customer.name}, {customer.package_type}, +{extension_period} month(s), "
+            f"expires {new_end_date.strftime('%d-%m-%Y')}"
         )
-        admin_sms_sent = send_sms(ADMIN_PHONE_NUMBER, admin_message) if ADMIN_PHONE_NUMBER else False
+        
+        db.session.commit()
         
         flash('Membership extended successfully!', 'success')
         return redirect(url_for('view_customers'))
     
     return render_template('extend_membership.html', customer=customer)
 
+@app.route('/api/quotes', methods=['POST'])
+@csrf.exempt
+@login_required
+def quote_renewals():
+    """Price renewals in bulk from the live catalog; nothing is written.
+
+    Body: {"renewals": [{"customer_id": 12, "months": 3},
+                        {"package_type": "basic", "months": 1, "personal_training_type": null,
+                         "treadmill_access": true}, ...]}
+    Each quote carries its amount, or an error for an unknown customer or package.
+    """
+    renewals = (request.get_json(silent=True) or {}).get('renewals')
+    if not isinstance(renewals, list) or not all(isinstance(item, dict) for item in renewals):
+        return jsonify(error='Expected {"renewals": [...]}.'), 400
+    if len(renewals) > app.config['QUOTE_MAX_ITEMS']:
+        return jsonify(error=f"At most {app.config['QUOTE_MAX_ITEMS']} renewals per request."), 413
+    for item in renewals:
+        if not isinstance(item.get('months'), int) or isinstance(item['months'], bool) or item['months'] < 1:
+            return jsonify(error='Every renewal needs a whole number of months of at least 1.'), 400
+
+    # Customers' current plans, fetched in chunks of one IN (...) query each
+    customer_ids = list({item['customer_id'] for item in renewals if isinstance(item.get('customer_id'), int)})
+    plans = {}
+    for start in range(0, len(customer_ids), 1000):
+        plans.update((row.id, row) for row in db.session.execute(
+            db.select(Customer.id, Customer.package_type, Customer.has_personal_training,
+                      Customer.personal_training_type, Customer.treadmill_access)
+            .where(Customer.id.in_(customer_ids[start:start + 1000]))
+        ))
+
+    price_book = pricing.current()
+    quotes, total = [], 0
+    for item in renewals:
+        quote = {key: item[key] for key in ('customer_id', 'package_type', 'months') if key in item}
+        if 'customer_id' in item:
+            plan = plans.get(item['customer_id'])
+            if plan is None:
+                quotes.append({**quote, 'error': 'unknown customer'})
+                continue
+            plan = (plan.package_type, plan.personal_training_type if plan.has_personal_training else None,
+                    plan.treadmill_access)
+        else:
+            plan = (item.get('package_type'), item.get('personal_training_type'), item.get('treadmill_access', False))
+        try:
+            amount = price_book.renewal(plan[0], item['months'], plan[1], plan[2])
+        except (KeyError, TypeError):
+            quotes.append({**quote, 'error': 'unknown package or training type'})
+            continue
+        quotes.append({**quote, 'amount': amount})
+        total += amount
+    return jsonify(catalog_version=price_book.version, quotes=quotes, total=total)
+
 @app.route('/view_customer/<int:customer_id>')
 @login_required
 def view_customer(customer_id):
     customer = Customer.query.get_or_404(customer_id)
-    fees = Fee.query.filter_by(customer_id=customer_id).order_by(Fee.payment_date.desc()).all()
-    return render_template('view_customer.html', customer=customer, fees=fees)
+    # Archived payments are only read when asked for (?archived=1)
+    show_archived = request.args.get('archived') == '1'
+    fees, next_cursor, prev_cursor = paginate_fees(
+        customer_id, FEE_HISTORY_PAGE_SIZE, after=request.args.get('after'),
+        before=request.args.get('before'), archived=show_archived)
+    archived_count = db.session.execute(archived_payment_count_query(customer_id)).scalar()
+    return render_template('view_customer.html', customer=customer, fees=fees,
+                           next_cursor=next_cursor, prev_cursor=prev_cursor,
+                           show_archived=show_archived, archived_count=archived_count)
+
+@app.route('/api/customers/<int:customer_id>/summary')
+@login_required
+def customer_summary(customer_id):
+    """Fields the shared payment and delete dialogs on the customer list need"""
+    customer = db.session.execute(
+        db.select(Customer.id, Customer.name, Customer.package_type, Customer.phone,
+                  Customer.pending_amount, Customer.membership_end)
+        .where(Customer.id == customer_id)
+    ).first()
+    if customer is None:
+        abort(404)
+    response = jsonify(
+        id=customer.id, name=customer.name, package_type=customer.package_type, phone=customer.phone,
+        pending_amount=round(customer.pending_amount or 0, 2),
+        membership_end=customer.membership_end.strftime('%Y-%m-%d'),
+        add_fee_url=url_for('add_fee', customer_id=customer.id),
+        delete_url=url_for('delete_customer', customer_id=customer.id),
+    )
+    # Browsers revalidate on every open and get a bodiless 304 while nothing changed
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/edit_customer/<int:customer_id>', methods=['GET', 'POST'])
 @login_required
@@ -650,9 +2873,13 @@ def edit_customer(customer_id):
     
     if request.method == 'POST':
         # Update customer details
+        old_name = customer.name
         customer.name = request.form.get('name', customer.name)
         customer.email = request.form.get('email', customer.email)
         customer.phone = request.form.get('phone', customer.phone)
+        if customer.name != old_name:
+            # The door display shows the member's name
+            membership_changed(customer.id, customer.membership_end, customer.name)
         
         db.session.commit()
         flash('Customer details updated successfully!', 'success')
@@ -660,9 +2887,1113 @@ def edit_customer(customer_id):
     
     return render_template('edit_customer.html', customer=customer)
 
+# Door check-in
+# Scans are answered from an in-process index of memberships so the hot path
+# never waits on the database; attendance rows are queued and written in batches.
+CHECKIN_RECENT_EXPIRY_DAYS = 30  # lapsed members kept in the index so the door can say why
+
+class ActiveMembershipIndex:
+    """Map of (branch_id, customer_id) to (membership_end, name) for current and recently lapsed members.
+
+    It covers every branch; a door only finds the members of its own branch.
+
+    Built from the customer table on first use and patched after every commit
+    in this process that changes a membership (see membership_changed). Every
+    change bumps the 'memberships' cache version; the patch also adopts this
+    process's own bumps, so refresh() only rebuilds the map for other
+    workers' changes.
+    """
+
+    def __init__(self):
+        self._members = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        # Changes applied while refresh() reads the table, replayed onto its result
+        self._pending = None
+
+    def lookup(self, branch_id, customer_id):
+        if self._members is None:
+            self.refresh()
+        return self._members.get((branch_id, customer_id))
+
+    def apply(self, changes, versions=()):
+        """Patch in (customer_id, membership_end, name, branch_id) changes; a None end removes the member.
+
+        versions are the 'memberships' versions the committing transaction
+        bumped to. When they directly follow the map's version, nobody else
+        changed a membership in between and the map is current with them.
+        """
+        with self._lock:
+            if self._pending is not None:
+                self._pending.extend(changes)
+            if self._members is None:
+                return
+            self._patch(changes)
+            if versions and list(versions) == list(range(self._version + 1, self._version + 1 + len(versions))):
+                self._version = versions[-1]
+
+    def _patch(self, changes):
+        for customer_id, membership_end, name, branch_id in changes:
+            if membership_end is None:
+                self._members.pop((branch_id, customer_id), None)
+            else:
+                self._members[(branch_id, customer_id)] = (membership_end, name)
+
+    def refresh(self):
+        """Rebuild from the database unless the 'memberships' version is unchanged.
+
+        The table is read without holding the lock, so check-ins and local
+        patches carry on meanwhile.
+        """
+        with self._refresh_lock, app.app_context():
+            version = read_cache_version('memberships')
+            if self._members is not None and version == self._version:
+                return False
+            with self._lock:
+                self._pending = []
+            try:
+                rows = db.session.execute(active_membership_query(datetime.utcnow())).all()
+                members = {(branch_id, customer_id): (membership_end, name)
+                           for customer_id, membership_end, name, branch_id in rows}
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                self._members = members
+                self._patch(self._pending)
+                self._pending = None
+                self._version = version
+        logger.info("checkin index rebuilt", extra={'members': len(rows), 'version': version})
+        return True
+
+active_members = ActiveMembershipIndex()
+
+def active_membership_query(now):
+    """Current and recently lapsed members of every branch, read branch by branch through the expiry index"""
+    return (db.select(Customer.id, Customer.membership_end, Customer.name, Customer.branch_id)
+            .where(Customer.branch_id.in_(db.select(Branch.id)),
+                   Customer.membership_end >= now - timedelta(days=CHECKIN_RECENT_EXPIRY_DAYS)))
+
+def membership_changed(customer_id, membership_end, name=None):
+    """Note a changed (or, with membership_end=None, deleted) membership in the current transaction.
+
+    The customer belongs to the branch the session is scoped to.
+    """
+    version = bump_cache_version(db.session.connection(), 'memberships')
+    db.session.info.setdefault('membership_versions', []).append(version)
+    db.session.info.setdefault('membership_changes', []).append(
+        (customer_id, membership_end, name, current_branch_id()))
+
+@db.event.listens_for(db.session, 'after_commit')
+def _apply_membership_changes(session):
+    changes = session.info.pop('membership_changes', None)
+    versions = session.info.pop('membership_versions', ())
+    if changes:
+        active_members.apply(changes, versions)
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _forget_membership_changes(session):
+    session.info.pop('membership_changes', None)
+    session.info.pop('membership_versions', None)
+
+class CheckinWorker:
+    """Buffers attendance rows and writes them in batches from a background thread.
+
+    The same thread refreshes the membership index every CHECKIN_INDEX_TTL
+    seconds. Queued rows are flushed at exit; a crash loses at most the last
+    CHECKIN_FLUSH_SECONDS of attendance, never a door decision.
+    """
+
+    def __init__(self, app, index):
+        self.app = app
+        self.index = index
+        self._rows = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='checkin-writer', daemon=True)
+            self._thread.start()
+        atexit.register(self.flush)
+
+    def record(self, customer_id, branch_id, granted, scanner):
+        with self._lock:
+            self._rows.append({'customer_id': customer_id, 'branch_id': branch_id, 'checked_in_at': datetime.utcnow(),
+                               'granted': granted, 'scanner': scanner})
+            full = len(self._rows) >= self.app.config['CHECKIN_FLUSH_SIZE']
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if full:
+            self._wake.set()
+
+    def run_forever(self):
+        refreshed_at = time.monotonic()
+        while True:
+            self._wake.wait(self.app.config['CHECKIN_FLUSH_SECONDS'])
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("attendance flush failed")
+            if time.monotonic() - refreshed_at >= self.app.config['CHECKIN_INDEX_TTL']:
+                refreshed_at = time.monotonic()
+                try:
+                    self.index.refresh()
+                except Exception:
+                    logger.exception("checkin index refresh failed")
+
+    def flush(self):
+        """Write every queued attendance row in one multi-row insert; returns the row count"""
+        with self._lock:
+            rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+        with self.app.app_context():
+            try:
+                try:
+                    return self._insert_existing(rows)
+                except IntegrityError:
+                    # A member was deleted between the check and the insert
+                    db.session.rollback()
+                    return self._insert_existing(rows)
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    self._rows[:0] = rows
+                raise
+
+    @staticmethod
+    def _insert_existing(rows):
+        """Insert the rows of members that still exist; members deleted after scanning in are dropped.
+
+        SQLite does not enforce the foreign key, so the check cannot be left
+        to the insert.
+        """
+        existing = set(db.session.execute(
+            db.select(Customer.id).where(Customer.id.in_({row['customer_id'] for row in rows}))
+        ).scalars())
+        rows = [row for row in rows if row['customer_id'] in existing]
+        if rows:
+            db.session.execute(Attendance.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+
+checkin_worker = CheckinWorker(app, active_members)
+
+_scanner_branch_ids = {}  # branch code -> id, for CHECKIN_TOKENS
+
+def scanner_branch_id(token):
+    """Branch whose door scanners present this token, or None for an unknown token"""
+    code = app.config['CHECKIN_TOKENS'].get(token)
+    if code is None:
+        return None
+    if code not in _scanner_branch_ids:
+        branch_id = db.session.execute(db.select(Branch.id).where(Branch.code == code)).scalar()
+        if branch_id is None:
+            logger.warning("CHECKIN_TOKENS names an unknown branch", extra={'branch': code})
+            return None
+        _scanner_branch_ids[code] = branch_id
+    return _scanner_branch_ids[code]
+
+@app.route('/api/checkin', methods=['POST'])
+@csrf.exempt
+def checkin():
+    """Door scanner endpoint; expects {"code": <customer id>, "scanner": <name>}"""
+    authorization = request.headers.get('Authorization', '')
+    branch_id = scanner_branch_id(authorization[len('Bearer '):]) if authorization.startswith('Bearer ') else None
+    if branch_id is None:
+        return jsonify(granted=False, reason='unauthorized'), 401
+
+    payload = request.get_json(silent=True) or request.form
+    code = str(payload.get('code', '')).strip()
+    scanner = str(payload.get('scanner') or '')[:40] or None
+    member = active_members.lookup(branch_id, int(code)) if code.isdigit() else None
+    if member is None:
+        # Unknown card, a member of another branch, or a membership that lapsed
+        # before CHECKIN_RECENT_EXPIRY_DAYS
+        CHECKINS_TOTAL.inc(result='inactive')
+        return jsonify(granted=False, reason='inactive'), 404
+
+    membership_end, name = member
+    granted = membership_end >= datetime.utcnow()
+    checkin_worker.record(int(code), branch_id, granted, scanner)
+    CHECKINS_TOTAL.inc(result='granted' if granted else 'expired')
+    return jsonify(granted=granted, reason=None if granted else 'expired', customer_id=int(code),
+                   name=name, membership_end=membership_end.isoformat())
+
+# Bulk customer import
+IMPORT_TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+MAX_REPORTED_IMPORT_ERRORS = 100
+
+class ImportRowError(ValueError):
+    """A CSV row that cannot be imported; the message is shown to the operator"""
+
+def parse_import_row(row, price_book):
+    """Validate one CSV row and turn it into Customer column values priced from price_book"""
+    def flag(field):
+        return (row.get(field) or '').strip().lower() in IMPORT_TRUE_VALUES
+
+    name = (row.get('name') or '').strip()
+    phone = (row.get('phone') or '').strip()
+    package_type = (row.get('package_type') or '').strip().lower()
+    if not name or not phone or not package_type:
+        raise ImportRowError('Name, phone, and package type are required.')
+    if package_type not in price_book.packages:
+        raise ImportRowError(f'Invalid package type: {package_type}')
+
+    personal_training_type = (row.get('personal_training_type') or '').strip().lower() or None
+    if personal_training_type and personal_training_type not in price_book.training:
+        raise ImportRowError(f'Invalid personal training type: {personal_training_type}')
+
+    try:
+        duration_months = int(row.get('duration_months') or 1)
+    except ValueError:
+        raise ImportRowError(f"Invalid duration_months: {row.get('duration_months')}")
+    try:
+        initial_payment = float(row.get('initial_payment') or 0)
+    except ValueError:
+        raise ImportRowError(f"Invalid initial_payment: {row.get('initial_payment')}")
+    try:
+        join_date = (datetime.fromisoformat(row['join_date'].strip())
+                     if (row.get('join_date') or '').strip() else datetime.utcnow())
+    except ValueError:
+        raise ImportRowError(f"Invalid join_date: {row.get('join_date')}")
+    if duration_months < 1:
+        raise ImportRowError('Duration must be at least one month.')
+    if initial_payment < 0:
+        raise ImportRowError('Initial payment cannot be negative.')
+
+    treadmill_access = flag('treadmill_access')
+    fees = price_book.registration(package_type, duration_months, personal_training_type, treadmill_access)
+    return {
+        'name': name,
+        'email': (row.get('email') or '').strip() or None,
+        'phone': phone,
+        'phone_digits': normalize_phone(phone),
+        'package_type': package_type,
+        'join_date': join_date,
+        'membership_end': join_date + timedelta(days=30 * duration_months),
+        'has_cardio': flag('has_cardio'),
+        'has_personal_training': personal_training_type is not None,
+        'personal_training_type': personal_training_type,
+        'treadmill_access': treadmill_access,
+        'notification_sent': False,
+        'pending_amount': fees['total_amount'] - initial_payment,
+        'initial_payment': initial_payment,
+        **fees
+    }
+
+def insert_import_batch(rows, collected_by, send_welcome, sms_start_at):
+    """Insert one batch of parsed rows, their initial fees and optional welcome SMS into the session's branch"""
+    payments = [row.pop('initial_payment') for row in rows]
+    branch_id = current_branch_id()
+    for row in rows:
+        row['branch_id'] = branch_id
+    # Core (not ORM) executemany: ids come back in parameter order without per-row overhead
+    customers = Customer.__table__
+    ids = db.session.execute(
+        customers.insert().returning(customers.c.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+
+    fees, deltas, totals = [], {}, {}
+    for customer_id, row, amount in zip(ids, rows, payments):
+        if amount > 0:
+            fees.append({'branch_id': branch_id, 'customer_id': customer_id, 'amount': amount,
+                         'payment_type': 'registration', 'description': 'Initial registration payment (import)',
+                         'payment_date': row['join_date'], 'collected_by': collected_by})
+            add_revenue_delta(deltas, branch_id, row['join_date'], 'registration', collected_by, amount)
+            add_customer_payment(totals, customer_id, row['join_date'], amount)
+    if fees:
+        db.session.execute(Fee.__table__.insert(), fees)
+    # Core inserts bypass the flush hook, so the rollup and totals are updated explicitly
+    apply_revenue_deltas(db.session.connection(), deltas)
+    apply_customer_payments(db.session.connection(), totals)
+    # Check-in indexes rebuild on their next refresh rather than per row
+    bump_cache_version(db.session.connection(), 'memberships')
+
+    if send_welcome:
+        enqueue_sms_batch([
+            (row['phone'], f"Welcome to The Fitness Zone, {row['name']}! Your {row['package_type']} membership "
+                           f"has been activated. Your membership will expire on "
+                           f"{row['membership_end'].strftime('%d-%m-%Y')}. Thank you for choosing us!")
+            for row in rows
+        ], per_second=app.config['IMPORT_SMS_PER_SECOND'], start_at=sms_start_at)
+    db.session.commit()
+
+def import_customers(stream, collected_by, send_welcome=False, batch_size=None):
+    """Stream customers from a CSV file into the database in batched transactions.
+
+    Expected columns: name, phone, package_type, and optionally email,
+    duration_months, personal_training_type, has_cardio, treadmill_access,
+    initial_payment and join_date (ISO format). Invalid rows are skipped and
+    reported. Welcome SMS, when requested, are queued at IMPORT_SMS_PER_SECOND.
+    """
+    started = time.perf_counter()
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    stats = {'imported': 0, 'skipped': 0, 'errors': []}
+    sms_start_at = datetime.utcnow()
+    # One catalog version prices the whole file
+    price_book = pricing.current()
+    batch = []
+
+    def flush_batch():
+        nonlocal sms_start_at
+        insert_import_batch(batch, collected_by, send_welcome, sms_start_at)
+        stats['imported'] += len(batch)
+        if send_welcome:
+            sms_start_at += timedelta(seconds=len(batch) / app.config['IMPORT_SMS_PER_SECOND'])
+        batch.clear()
+
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        try:
+            batch.append(parse_import_row(row, price_book))
+        except ImportRowError as e:
+            stats['skipped'] += 1
+            if len(stats['errors']) < MAX_REPORTED_IMPORT_ERRORS:
+                stats['errors'].append((line_number, str(e)))
+            continue
+        if len(batch) >= batch_size:
+            flush_batch()
+    if batch:
+        flush_batch()
+
+    if stats['imported']:
+        notify_admin(f"Customer import finished: {stats['imported']} imported, {stats['skipped']} skipped.")
+        db.session.commit()
+    stats['seconds'] = round(time.perf_counter() - started, 2)
+    return stats
+
+@app.cli.command("import-customers")
+@click.argument('csv_file', type=click.File('r', encoding='utf-8-sig'))
+@click.option('--collected-by', help='Username recorded as collector of initial payments (default: first admin).')
+@click.option('--send-welcome', is_flag=True, help='Queue a welcome SMS for every imported customer.')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+@click.option('--branch', help='Code of the branch the customers join (default: the main branch).')
+def import_customers_command(csv_file, collected_by, send_welcome, batch_size, branch):
+    """Import customers from a CSV file"""
+    branch_id = find_branch(branch) if branch else DEFAULT_BRANCH_ID
+    if collected_by:
+        user = User.query.filter_by(username=collected_by).first()
+    else:
+        user = User.query.filter_by(is_admin=True).order_by(User.id).first()
+    if user is None:
+        raise click.ClickException('No collecting user found. Create an admin or pass --collected-by.')
+
+    with branch_scope(branch_id):
+        stats = import_customers(csv_file, user.id, send_welcome=send_welcome, batch_size=batch_size)
+    for line_number, message in stats['errors']:
+        print(f"Line {line_number}: {message}")
+    print(f"Imported {stats['imported']} customer(s), skipped {stats['skipped']} in {stats['seconds']}s")
+
+@app.route('/import_customers', methods=['GET', 'POST'])
+@login_required
+def import_customers_upload():
+    if not current_user.is_admin:
+        flash('Only admins can access this page.', 'error')
+        return redirect(url_for('index'))
+
+    if request.method == 'POST':
+        upload = request.files.get('csv_file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV file to import.', 'error')
+            return redirect(url_for('import_customers_upload'))
+
+        stream = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        stats = import_customers(stream, current_user.id, send_welcome='send_welcome' in request.form)
+        flash(f"Imported {stats['imported']} customer(s), skipped {stats['skipped']} "
+              f"in {stats['seconds']}s.", 'success' if stats['imported'] else 'error')
+        return render_template('import_customers.html', errors=stats['errors'])
+
+    return render_template('import_customers.html', errors=[])
+
+# Synthetic data for benchmarks and load tests
+SYNTHETIC_FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna',
+                         'Ishaan', 'Ananya', 'Diya', 'Saanvi', 'Aadhya', 'Kavya', 'Priya', 'Meera',
+                         'Rahul', 'Karthik', 'Deepa', 'Lakshmi', 'Suresh', 'Ramesh', 'Divya', 'Nisha']
+SYNTHETIC_LAST_NAMES = ['Sharma', 'Verma', 'Iyer', 'Reddy', 'Nair', 'Menon', 'Rao', 'Gupta',
+                        'Patel', 'Kumar', 'Singh', 'Das', 'Joshi', 'Pillai', 'Shetty', 'Bhat']
+SYNTHETIC_EMAIL_DOMAINS = ['gmail.com', 'yahoo.in', 'outlook.com']
+# Share of members on each package; shorter packages are the most common
+SYNTHETIC_PACKAGE_WEIGHTS = {'basic': 45, 'standard': 30, 'premium': 17, 'ultimate': 8}
+
+def synthetic_customer(rng, index, now, price_book):
+    """One realistic customer row plus the registration payment made at signup"""
+    first, last = rng.choice(SYNTHETIC_FIRST_NAMES), rng.choice(SYNTHETIC_LAST_NAMES)
+    phone = f"9{rng.randint(100000000, 999999999)}"
+    package_type = rng.choices(list(SYNTHETIC_PACKAGE_WEIGHTS), weights=list(SYNTHETIC_PACKAGE_WEIGHTS.values()))[0]
+    duration_months = price_book.packages[package_type].duration
+    personal_training_type = rng.choice(list(price_book.training)) if rng.random() < 0.15 else None
+    treadmill_access = rng.random() < 0.2
+    fees = price_book.registration(package_type, duration_months, personal_training_type, treadmill_access)
+
+    # Joined within the last two years and renewed a few times; most short packages have since lapsed
+    join_date = now - timedelta(days=rng.randint(0, 730), minutes=rng.randint(0, 1439))
+    renewals = rng.choice([0, 0, 1, 2, 4])
+    membership_end = join_date + timedelta(days=30 * duration_months * (1 + renewals))
+    # Most pay in full at the counter, the rest leave a balance
+    initial_payment = fees['total_amount'] if rng.random() < 0.7 else round(fees['total_amount'] * 0.5)
+    return {
+        'name': f"{first} {last}",
+        'email': (f"{first.lower()}.{last.lower()}{index}@{rng.choice(SYNTHETIC_EMAIL_DOMAINS)}"
+                  if rng.random() < 0.8 else None),
+        'phone': phone,
+        'phone_digits': normalize_phone(phone),
+        'package_type': package_type,
+        'join_date': join_date,
+        'membership_end': membership_end,
+        'has_cardio': rng.random() < 0.5,
+        'has_personal_training': personal_training_type is not None,
+        'personal_training_type': personal_training_type,
+        'treadmill_access': treadmill_access,
+        'notification_sent': membership_end < now,
+        'pending_amount': fees['total_amount'] - initial_payment,
+        'initial_payment': initial_payment,
+        **fees
+    }
+
+def synthetic_fees(rng, customer_id, row, initial_payment, fees_per_customer, collected_by, now, price_book):
+    """Registration payment followed by monthly/additional payments up to today"""
+    if fees_per_customer < 1:
+        return []
+    fees = [{'customer_id': customer_id, 'amount': initial_payment, 'payment_type': 'registration',
+             'description': 'Initial registration payment', 'payment_date': row['join_date'],
+             'collected_by': collected_by}]
+    last_day = min(now, row['membership_end'])
+    span = max((last_day - row['join_date']).total_seconds(), 0)
+    monthly = row['package_fee'] / price_book.packages[row['package_type']].duration
+    for _ in range(fees_per_customer - 1):
+        payment_type = 'monthly' if rng.random() < 0.8 else rng.choice(['additional', 'other'])
+        amount = round(monthly if payment_type == 'monthly' else rng.choice([200, 300, 500, 1000]))
+        fees.append({'customer_id': customer_id, 'amount': amount, 'payment_type': payment_type,
+                     'description': '', 'payment_date': row['join_date'] + timedelta(seconds=rng.uniform(0, span)),
+                     'collected_by': collected_by})
+    return fees
+
+def seed_synthetic(customers, fees_per_customer, collected_by, seed=None, batch_size=None):
+    """Insert synthetic customers and their payments in batched transactions.
+
+    Uses the same Core insert path as bulk imports, keeps the revenue rollup
+    in step and queues no SMS. Rows go to the session's branch. A fixed seed
+    reproduces the same data set.
+    """
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    batch_size = batch_size or app.config['IMPORT_BATCH_SIZE']
+    now = datetime.utcnow()
+    branch_id = current_branch_id()
+    table = Customer.__table__
+    fee_count = 0
+    price_book = pricing.current()
+
+    for offset in range(0, customers, batch_size):
+        rows = [synthetic_customer(rng, index, now, price_book)
+                for index in range(offset, min(offset + batch_size, customers))]
+        payments = [row.pop('initial_payment') for row in rows]
+        for row in rows:
+            row['branch_id'] = branch_id
+            if fees_per_customer < 1:
+                row['pending_amount'] = row['total_amount']
+        ids = db.session.execute(
+            table.insert().returning(table.c.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+
+        fees, deltas, totals = [], {}, {}
+        for customer_id, row, amount in zip(ids, rows, payments):
+            for fee in synthetic_fees(rng, customer_id, row, amount, fees_per_customer, collected_by, now,
+                                      price_book):
+                if fee['amount'] > 0:
+                    fee['branch_id'] = branch_id
+                    fees.append(fee)
+                    add_revenue_delta(deltas, branch_id, fee['payment_date'], fee['payment_type'], collected_by,
+                                      fee['amount'])
+                    add_customer_payment(totals, customer_id, fee['payment_date'], fee['amount'])
+        if fees:
+            db.session.execute(Fee.__table__.insert(), fees)
+        apply_revenue_deltas(db.session.connection(), deltas)
+        apply_customer_payments(db.session.connection(), totals)
+        bump_cache_version(db.session.connection(), 'memberships')
+        db.session.commit()
+        fee_count += len(fees)
+
+    return {'customers': customers, 'fees': fee_count, 'seconds': round(time.perf_counter() - started, 2)}
+
+@app.cli.command("seed-synthetic")
+@click.option('--customers', type=int, default=1000, show_default=True, help='Number of customers to create.')
+@click.option('--fees-per-customer', type=int, default=3, show_default=True,
+              help='Payments per customer, including the registration payment (0 for none).')
+@click.option('--seed', type=int, help='Random seed for a reproducible data set.')
+@click.option('--collected-by', help='Username recorded as collector of the payments (default: first admin).')
+@click.option('--branch', help='Code of the branch to fill (default: the main branch).')
+def seed_synthetic_command(customers, fees_per_customer, seed, collected_by, branch):
+    """Fill the database with realistic synthetic customers and payments"""
+    branch_id = find_branch(branch) if branch else DEFAULT_BRANCH_ID
+    if collected_by:
+        user = User.query.filter_by(username=collected_by).first()
+    else:
+        user = User.query.filter_by(is_admin=True).order_by(User.id).first()
+    if user is None:
+        raise click.ClickException('No collecting user found. Create an admin or pass --collected-by.')
+
+    with branch_scope(branch_id):
+        stats = seed_synthetic(customers, fees_per_customer, user.id, seed=seed)
+    print(f"Created {stats['customers']} customer(s) and {stats['fees']} payment(s) in {stats['seconds']}s")
+
+# Streaming CSV export
+EXPORT_KINDS = ('customers', 'fees', 'revenue')
+
+def export_query(kind, start=None, end=None, package=None):
+    """Build the SELECT for an export; start/end are dates, end inclusive"""
+    start_at = datetime.combine(start, datetime.min.time()) if start else None
+    end_at = datetime.combine(end + timedelta(days=1), datetime.min.time()) if end else None
+    if kind == 'customers':
+        query = db.select(
+            Customer.id, Customer.name, Customer.email, Customer.phone, Customer.package_type,
+            Customer.join_date, Customer.membership_end, Customer.has_cardio,
+            Customer.has_personal_training, Customer.personal_training_type,
+            Customer.treadmill_access, Customer.total_amount, Customer.pending_amount
+        ).order_by(Customer.id)
+        date_column = Customer.join_date
+    elif kind == 'fees':
+        # Archived months included; the date range is applied inside the ledger union
+        ledger = fee_ledger(start=start_at, end=end_at)
+        query = db.select(
+            ledger.c.id, ledger.c.customer_id, Customer.name.label('customer_name'), Customer.package_type,
+            ledger.c.amount, ledger.c.payment_type, ledger.c.description, ledger.c.payment_date,
+            ledger.c.collected_by
+        ).join(Customer, Customer.id == ledger.c.customer_id).order_by(ledger.c.id)
+        date_column = None
+    elif kind == 'revenue':
+        query = db.select(
+            DailyRevenue.day, DailyRevenue.payment_type, DailyRevenue.collected_by,
+            DailyRevenue.amount, DailyRevenue.payment_count
+        ).order_by(DailyRevenue.day, DailyRevenue.payment_type, DailyRevenue.collected_by)
+        if start:
+            query = query.where(DailyRevenue.day >= start)
+        if end:
+            query = query.where(DailyRevenue.day <= end)
+        return query
+    else:
+        raise ValueError(f'Unknown export: {kind}')
+
+    if date_column is not None:
+        if start_at:
+            query = query.where(date_column >= start_at)
+        if end_at:
+            query = query.where(date_column < end_at)
+    if package:
+        query = query.where(Customer.package_type == package)
+    return query
+
+def export_csv_chunks(query, rows_per_chunk=500):
+    """Yield a CSV document in chunks while streaming rows from the database.
+
+    Rows come through a server-side cursor (stream_results/yield_per), so
+    memory stays constant however large the table is.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    result = db.session.execute(query.execution_options(
+        stream_results=True, yield_per=app.config['EXPORT_YIELD_PER']))
+    writer.writerow(result.keys())
+    for count, row in enumerate(result, start=1):
+        writer.writerow(row)
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def parse_export_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+@app.route('/export')
+@login_required
+def export():
+    if not current_user.is_admin:
+        flash('Only admins can access this page.', 'error')
+        return redirect(url_for('index'))
+    return render_template('export.html', kinds=EXPORT_KINDS, packages=pricing.current().packages)
+
+@app.route('/export/<kind>.csv')
+@login_required
+def export_csv(kind):
+    if not current_user.is_admin:
+        flash('Only admins can access this page.', 'error')
+        return redirect(url_for('index'))
+    if kind not in EXPORT_KINDS:
+        flash('Unknown export.', 'error')
+        return redirect(url_for('export'))
+    try:
+        start = parse_export_date(request.args.get('start'))
+        end = parse_export_date(request.args.get('end'))
+    except ValueError:
+        flash('Dates must be in YYYY-MM-DD format.', 'error')
+        return redirect(url_for('export'))
+    package = request.args.get('package') or None
+    if package and package not in pricing.current().packages:
+        flash('Unknown package.', 'error')
+        return redirect(url_for('export'))
+
+    query = export_query(kind, start, end, package)
+    filename = f"{kind}-{datetime.utcnow().strftime('%Y%m%d')}.csv"
+    return Response(
+        stream_with_context(export_csv_chunks(query)),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+@app.cli.command("export")
+@click.argument('kind', type=click.Choice(EXPORT_KINDS))
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='First date to include.')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Last date to include.')
+@click.option('--package', help='Only this package type (one of the live price catalog).')
+@click.option('-o', '--output', type=click.File('w', encoding='utf-8'), default='-', help='Output file (default: stdout).')
+@click.option('--branch', help='Only this branch (default: every branch).')
+def export_command(kind, start, end, package, output, branch):
+    """Stream customers, the fee ledger or revenue rollups as CSV"""
+    packages = pricing.refresh().packages
+    if package and package not in packages:
+        raise click.BadParameter(f"'{package}' is not one of {', '.join(packages)}.", param_hint="'--package'")
+    query = export_query(kind, start.date() if start else None, end.date() if end else None, package)
+    with branch_scope(find_branch(branch) if branch else None):
+        for chunk in export_csv_chunks(query):
+            output.write(chunk)
+
+# Branch administration
+def find_branch(code):
+    """Id of the branch with this code, for --branch options"""
+    branch_id = db.session.execute(db.select(Branch.id).where(Branch.code == code)).scalar()
+    if branch_id is None:
+        raise click.ClickException(f"No branch with code '{code}'. `flask branches` lists them.")
+    return branch_id
+
+def branch_rollup_query(now):
+    """One row per branch of member counts and collections.
+
+    Each figure is a correlated subquery pinned to one branch and answered
+    from the daily_revenue rollup or a branch-led customer index, so the
+    cost grows with the number of branches, not with members and payments.
+    """
+    today = now.date()
+
+    def members(*criteria):
+        return (db.select(db.func.count()).select_from(Customer)
+                .where(Customer.branch_id == Branch.id, *criteria).scalar_subquery())
+
+    def collected(*criteria):
+        return (db.select(db.func.coalesce(db.func.sum(DailyRevenue.amount), 0))
+                .where(DailyRevenue.branch_id == Branch.id, *criteria).scalar_subquery())
+
+    return db.select(
+        Branch.id, Branch.code, Branch.name,
+        members().label('members'),
+        members(Customer.membership_end >= now).label('active_members'),
+        collected(DailyRevenue.day == today).label('today'),
+        collected(DailyRevenue.day >= month_start(today)).label('month_to_date'),
+        collected().label('total'),
+    ).order_by(Branch.id)
+
+def branch_rollup(now=None):
+    """Members and collections of every branch as dicts, for head office"""
+    with branch_scope(None):
+        rows = db.session.execute(branch_rollup_query(now or datetime.utcnow())).all()
+    return [row._asdict() for row in rows]
+
+@app.route('/branches')
+@login_required
+def branches():
+    if not current_user.is_admin or current_user.branch_id is not None:
+        flash('Only head office admins can access this page.', 'error')
+        return redirect(url_for('index'))
+    rows = branch_rollup()
+    totals = {key: sum(row[key] for row in rows)
+              for key in ('members', 'active_members', 'today', 'month_to_date', 'total')}
+    return render_template('branches.html', branches=rows, totals=totals)
+
+@app.cli.command("branches")
+def branches_command():
+    """List branches with their members and collections"""
+    print(f"{'code':<12}{'name':<24}{'members':>9}{'active':>9}{'today':>12}{'this month':>14}{'total':>16}")
+    for row in branch_rollup():
+        print(f"{row['code']:<12}{row['name']:<24}{row['members']:>9}{row['active_members']:>9}"
+              f"{row['today']:>12,.2f}{row['month_to_date']:>14,.2f}{row['total']:>16,.2f}")
+
+@app.cli.command("create-branch")
+@click.argument('code')
+@click.argument('name')
+def create_branch(code, name):
+    """Add a branch; its staff and members are kept apart from every other branch"""
+    if db.session.execute(db.select(Branch.id).where(Branch.code == code)).scalar() is not None:
+        raise click.ClickException(f"Branch '{code}' already exists.")
+    branch = Branch(code=code, name=name)
+    db.session.add(branch)
+    db.session.flush()
+    bump_cache_version(db.session.connection(), 'branches')
+    db.session.commit()
+    print(f"Created branch {branch.id}: {code} ({name})")
+
+@app.cli.command("create-staff")
+@click.argument('username')
+@click.option('--branch', help='Code of the branch the account works in; omit for head office.')
+@click.option('--admin', is_flag=True, help='Give the account admin pages.')
+@click.password_option()
+def create_staff(username, branch, admin, password):
+    """Create a staff login bound to one branch (or head office, which sees every branch)"""
+    branch_id = find_branch(branch) if branch else None
+    if User.query.filter_by(username=username).first():
+        raise click.ClickException(f"User '{username}' already exists.")
+    db.session.add(User(username=username, password=password, is_admin=admin, branch_id=branch_id))
+    db.session.commit()
+    print(f"Created {'admin' if admin else 'staff'} {username} in {branch or 'head office'}")
+
+@app.cli.command("assign-branch")
+@click.argument('username')
+@click.option('--branch', help='Code of the branch the account works in.')
+@click.option('--head-office', is_flag=True, help='Unbind the account so it can switch between branches.')
+def assign_branch(username, branch, head_office):
+    """Move a staff account to a branch or to head office"""
+    if bool(branch) == head_office:
+        raise click.ClickException('Pass either --branch or --head-office.')
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise click.ClickException(f"No user '{username}'.")
+    user.branch_id = find_branch(branch) if branch else None
+    db.session.commit()
+    print(f"{username} now works in {branch or 'head office'}")
+
+# Analytics
+# The report reads a handful of columns of every customer and payment. Rows
+# are streamed ANALYTICS_CHUNK_ROWS at a time straight into NumPy arrays (no
+# ORM objects; dates arrive as epoch seconds, packages as integer codes) and
+# every metric is computed with array operations over those columns.
+app.config['ANALYTICS_CHUNK_ROWS'] = int(os.getenv('ANALYTICS_CHUNK_ROWS', 50000))
+app.config['ANALYTICS_CACHE_SECONDS'] = float(os.getenv('ANALYTICS_CACHE_SECONDS', 300))
+# Months of cohorts and of revenue history in the report
+ANALYTICS_COHORT_MONTHS = 12
+ANALYTICS_FORECAST_MONTHS = 3
+ANALYTICS_EXPIRY_DAYS = 90
+# Lower bound (days since the last payment) of each pending balance bucket
+PENDING_AGING_BUCKETS = ((0, '0-30 days'), (31, '31-60 days'), (61, '61-90 days'), (91, 'Over 90 days'))
+
+def epoch_seconds(column):
+    """A datetime column as whole seconds since 1970, computed by the database"""
+    return db.cast(db.extract('epoch', column), db.BigInteger)
+
+def fetch_columns(query, dtypes):
+    """Stream a SELECT into one NumPy array per column.
+
+    Only one chunk of row tuples is held at a time; dtypes gives the array
+    type of each selected column, in order.
+    """
+    import numpy as np
+    chunk_rows = app.config['ANALYTICS_CHUNK_ROWS']
+    parts = [[] for _ in dtypes]
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=chunk_rows))
+    for chunk in result.partitions():
+        for part, values, dtype in zip(parts, zip(*chunk), dtypes):
+            part.append(np.fromiter(values, dtype=dtype, count=len(chunk)))
+    return [np.concatenate(part) if part else np.empty(0, dtype=dtype) for part, dtype in zip(parts, dtypes)]
+
+def month_label(month):
+    """'YYYY-MM' for a count of months since January 1970"""
+    return f"{1970 + month // 12}-{month % 12 + 1:02d}"
+
+def analytics_report(now=None):
+    """Retention, renewals, upcoming expiries, receivables aging and revenue projection.
+
+    Returns plain dicts and lists, ready for a template or JSON.
+    """
+    import numpy as np
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    now_s = int(now.replace(tzinfo=timezone.utc).timestamp())
+    price_book = pricing.current()
+    codes = list(price_book.packages)
+    durations = np.array([price_book.packages[code].duration for code in codes])
+    monthly_rates = np.array([price_book.packages[code].monthly_rate for code in codes], dtype=np.float64)
+
+    # Cohorts and the revenue history span the same months, so older payments
+    # (and on Postgres their partitions) are never read
+    history_months = ANALYTICS_COHORT_MONTHS
+    first_month = now.year * 12 + now.month - 1 - history_months
+    history_from = datetime(first_month // 12, first_month % 12 + 1, 1)
+
+    joined = db.func.coalesce(Customer.join_date, Customer.membership_end)
+    with replica_reads('analytics'):
+        ids, package, join_s, end_s, pending, last_paid_s = fetch_columns(
+            db.select(
+                Customer.id,
+                db.case({code: index for index, code in enumerate(codes)}, value=Customer.package_type, else_=-1),
+                epoch_seconds(joined), epoch_seconds(Customer.membership_end),
+                db.func.coalesce(Customer.pending_amount, 0),
+                epoch_seconds(db.func.coalesce(Customer.last_payment_at, joined)),
+            ),
+            (np.int64, np.int16, np.int64, np.int64, np.float64, np.int64))
+        ledger = fee_ledger(start=history_from)
+        fee_customer, fee_amount, fee_s = fetch_columns(
+            db.select(ledger.c.customer_id, ledger.c.amount, epoch_seconds(ledger.c.payment_date)),
+            (np.int64, np.float64, np.int64))
+        db.session.rollback()
+
+    def months(seconds):
+        return seconds.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+
+    current_month = int(months(np.array([now_s]))[0])
+    join_month, end_month, fee_month = months(join_s), months(end_s), months(fee_s)
+
+    # Cohort retention: share of each join-month cohort whose membership still
+    # covered the k-th month after joining, for months that have started
+    cohorts, first_cohort = ANALYTICS_COHORT_MONTHS, current_month - ANALYTICS_COHORT_MONTHS + 1
+    cohort = join_month - first_cohort
+    in_cohort = (cohort >= 0) & (cohort < cohorts)
+    tenure = np.clip(end_month - join_month, 0, cohorts - 1)
+    counts = np.bincount(cohort[in_cohort] * cohorts + tenure[in_cohort],
+                         minlength=cohorts * cohorts).reshape(cohorts, cohorts)
+    retained = counts[:, ::-1].cumsum(axis=1)[:, ::-1]
+    sizes = retained[:, 0]
+    observable = np.arange(cohorts)[:, None] + np.arange(cohorts)[None, :] < cohorts
+
+    # Revenue per member of each cohort; all their payments fall inside the fetched window
+    cohort_of = np.full(int(max(ids.max(initial=0), fee_customer.max(initial=0))) + 1, -1, dtype=np.int64)
+    cohort_of[ids[in_cohort]] = cohort[in_cohort]
+    fee_cohort = cohort_of[fee_customer]
+    cohort_revenue = np.bincount(fee_cohort[fee_cohort >= 0], weights=fee_amount[fee_cohort >= 0],
+                                 minlength=cohorts)
+    retention = [{
+        'cohort': month_label(first_cohort + row),
+        'members': int(sizes[row]),
+        'revenue_per_member': round(float(cohort_revenue[row] / sizes[row]), 2) if sizes[row] else None,
+        'retained': [round(float(retained[row, k] / sizes[row]) * 100, 1) if sizes[row] else None
+                     for k in range(cohorts) if observable[row, k]],
+    } for row in range(cohorts)]
+
+    # Renewals: members whose first package term is over, and how many extended past it
+    known = package >= 0
+    first_term_end = join_s + np.where(known, durations[np.maximum(package, 0)], 0) * 30 * 86400
+    eligible = known & (first_term_end <= now_s)
+    renewed = eligible & (end_s > first_term_end)
+    eligible_count = np.bincount(package[eligible], minlength=len(codes))
+    renewed_count = np.bincount(package[renewed], minlength=len(codes))
+    renewal_rate = np.divide(renewed_count, eligible_count, out=np.zeros(len(codes)), where=eligible_count > 0)
+    renewals = [{'package': code, 'eligible': int(eligible_count[i]), 'renewed': int(renewed_count[i]),
+                 'rate': round(float(renewal_rate[i]) * 100, 1)} for i, code in enumerate(codes)]
+
+    # Memberships ending in each of the coming weeks
+    days_left = (end_s - now_s) // 86400
+    upcoming = (days_left >= 0) & (days_left < ANALYTICS_EXPIRY_DAYS)
+    weekly = np.bincount(days_left[upcoming] // 7, minlength=-(-ANALYTICS_EXPIRY_DAYS // 7))
+    expiries = [{'week_start': (now + timedelta(days=7 * week)).strftime('%Y-%m-%d'), 'members': int(count)}
+                for week, count in enumerate(weekly)]
+
+    # Outstanding balances by days since the member last paid
+    owing = pending > 0
+    age_days = (now_s - last_paid_s[owing]) // 86400
+    bucket = np.digitize(age_days, [low for low, _ in PENDING_AGING_BUCKETS[1:]])
+    bucket_members = np.bincount(bucket, minlength=len(PENDING_AGING_BUCKETS))
+    bucket_amount = np.bincount(bucket, weights=pending[owing], minlength=len(PENDING_AGING_BUCKETS))
+    aging = [{'bucket': label, 'members': int(bucket_members[i]), 'amount': round(float(bucket_amount[i]), 2)}
+             for i, (_, label) in enumerate(PENDING_AGING_BUCKETS)]
+
+    # Revenue: the last full months, a linear trend over them, and the
+    # renewals expected from members expiring soon at each package's renewal rate
+    history_start = current_month - history_months
+    in_history = fee_month < current_month
+    monthly = np.bincount(fee_month[in_history] - history_start, weights=fee_amount[in_history],
+                          minlength=history_months)
+    slope, intercept = np.polyfit(np.arange(history_months), monthly, 1)
+    ahead = np.arange(history_months, history_months + ANALYTICS_FORECAST_MONTHS)
+    forecast = np.maximum(slope * ahead + intercept, 0)
+    due = upcoming & known
+    expected_renewals = renewal_rate[package[due]]
+    revenue = {
+        'monthly': [{'month': month_label(history_start + i), 'amount': round(float(amount), 2)}
+                    for i, amount in enumerate(monthly)],
+        'month_to_date': round(float(fee_amount[fee_month == current_month].sum()), 2),
+        'forecast': [{'month': month_label(current_month + 1 + i), 'amount': round(float(amount), 2)}
+                     for i, amount in enumerate(forecast)],
+        'renewals_due': int(due.sum()),
+        'expected_renewals': round(float(expected_renewals.sum()), 1),
+        'expected_renewal_revenue': round(float((expected_renewals * monthly_rates[package[due]]).sum()), 2),
+    }
+
+    return {
+        'generated_at': now.strftime('%Y-%m-%d %H:%M'),
+        'customers': int(ids.size),
+        'recent_payments': int(fee_amount.size),
+        'retention': retention,
+        'renewals': renewals,
+        'expiries': expiries,
+        'aging': aging,
+        'revenue': revenue,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+_analytics_cache = {}
+
+def cached_analytics_report(refresh=False):
+    """The session's branch report, rebuilt at most every ANALYTICS_CACHE_SECONDS per worker"""
+    branch_id = db.session.info.get('branch_id')
+    built_at, report = _analytics_cache.get(branch_id, (0.0, None))
+    if refresh or report is None or time.monotonic() - built_at > app.config['ANALYTICS_CACHE_SECONDS']:
+        report = analytics_report()
+        _analytics_cache[branch_id] = (time.monotonic(), report)
+    return report
+
+@app.route('/analytics')
+@login_required
+def analytics():
+    if not current_user.is_admin:
+        flash('Only admins can access this page.', 'error')
+        return redirect(url_for('index'))
+    report = cached_analytics_report(refresh=request.args.get('refresh') == '1')
+    return render_template('analytics.html', report=report, cohort_months=ANALYTICS_COHORT_MONTHS)
+
+@app.cli.command("analytics")
+@click.option('--json', 'as_json', is_flag=True, help='Print the report as JSON.')
+@click.option('--branch', help='Only this branch (default: every branch).')
+def analytics_command(as_json, branch):
+    """Print retention, renewal, expiry, receivables and revenue analytics"""
+    with branch_scope(find_branch(branch) if branch else None):
+        report = analytics_report()
+    if as_json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{report['customers']} customer(s), {report['recent_payments']} payment(s) in the last "
+          f"{ANALYTICS_COHORT_MONTHS} months, built in {report['seconds']}s")
+    print("\nCohort retention (% still members N months after joining)")
+    for row in report['retention']:
+        retained = ' '.join(f"{value:>5}" for value in row['retained'])
+        print(f"  {row['cohort']}  {row['members']:>6}  {retained}")
+    print("\nRenewal rate by package")
+    for row in report['renewals']:
+        print(f"  {row['package']:<10}{row['renewed']:>7} of {row['eligible']:<7}{row['rate']:>6}%")
+    print(f"\nMemberships ending in the next {ANALYTICS_EXPIRY_DAYS} days, by week")
+    for row in report['expiries']:
+        print(f"  {row['week_start']}  {row['members']:>6}")
+    print("\nPending balances by days since last payment")
+    for row in report['aging']:
+        print(f"  {row['bucket']:<14}{row['members']:>7}  ₹{row['amount']:,.2f}")
+    revenue = report['revenue']
+    print("\nRevenue")
+    for row in revenue['monthly']:
+        print(f"  {row['month']}  ₹{row['amount']:,.2f}")
+    print(f"  month to date  ₹{revenue['month_to_date']:,.2f}")
+    for row in revenue['forecast']:
+        print(f"  {row['month']}  ₹{row['amount']:,.2f} (trend)")
+    print(f"  {revenue['renewals_due']} membership(s) due in {ANALYTICS_EXPIRY_DAYS} days; "
+          f"~{revenue['expected_renewals']} renewals worth ₹{revenue['expected_renewal_revenue']:,.2f}/month expected")
+
+def explained_queries():
+    """The statements each route and background job runs, built by the same helpers.
+
+    Arguments are realistic placeholders; only the shape of the plan matters.
+    Entries whose last element is True are expected to scan a small table.
+    Requests and the expiry job run scoped to one branch, so their statements
+    get the branch criteria _scope_to_branch adds at execution time.
+    """
+    now = datetime.utcnow()
+
+    def scoped(statement):
+        return statement.options(branch_criteria(DEFAULT_BRANCH_ID))
+
+    def page(sort, search='', cursor=None):
+        return scoped(customer_page_query(customer_list_query(search), sort, DEFAULT_PAGE_SIZE, cursor).statement)
+
+    return [
+        ('index, create_admin', 'admin_exists', admin_user_query().limit(1).statement),
+        ('login', 'user by username', user_by_username_query('admin').limit(1).statement),
+        ('view_customers', 'first page by expiry', page('expiry')),
+        ('view_customers', 'next page by expiry', page('expiry', cursor=(now, 1))),
+        ('view_customers', 'next page by name', page('name', cursor=('M', 1))),
+        ('view_customers', 'search by name', page('expiry', 'sharma')),
+        ('view_customers', 'search by phone', page('expiry', '98450')),
+        ('view_customers', 'revenue totals', scoped(revenue_totals_query(now.date()))),
+        ('view_customer', 'fee history page', scoped(fee_page_query(1, FEE_HISTORY_PAGE_SIZE, (now, 1)))),
+        ('view_customer', 'fee history page with archive',
+         scoped(fee_page_query(1, FEE_HISTORY_PAGE_SIZE, (now, 1), archived=True))),
+        ('view_customer', 'archived payment count', scoped(archived_payment_count_query(1))),
+        ('delete_customer', 'revenue to remove from the rollup', scoped(ledger_revenue_query(customer_id=1))),
+        ('check_expiring_memberships', 'expiring candidates',
+         scoped(expiring_chunk_query(now, 0, app.config['EXPIRY_JOB_CHUNK_SIZE']))),
+        ('check_expiring_memberships', 'reset expired flags', scoped(reset_expired_flags_statement(now))),
+        ('branches', 'per-branch rollup', branch_rollup_query(now), True),
+        ('sms dispatcher', 'claim due messages', due_sms_query(now, app.config['SMS_BATCH_SIZE'])),
+        ('checkin worker', 'membership index rebuild', active_membership_query(now)),
+    ]
+
+def explain_plan(statement):
+    """Return the database's plan for a statement as a list of lines"""
+    engine = db.engine
+    compiled = statement.compile(dialect=engine.dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + str(compiled), params).all()
+    # SQLite returns (id, parent, notused, detail); PostgreSQL one text column
+    return [row[-1] for row in rows]
+
+def is_sequential_scan(plan_line, subqueries=()):
+    if 'Seq Scan' in plan_line:
+        return True
+    # SQLite: "SCAN customer" is a full table scan, "SCAN customer USING INDEX ..." walks an index;
+    # scanning the rows a subquery (CO-ROUTINE) produced is not a table scan
+    match = re.search(r'\bSCAN (\w+)', plan_line)
+    return (bool(match) and match.group(1) not in subqueries
+            and 'USING' not in plan_line and 'VIRTUAL TABLE' not in plan_line)
+
+@app.cli.command("db-explain")
+@click.option('--fail-on-seq-scan', is_flag=True, help='Exit non-zero if any query scans a whole table.')
+def db_explain(fail_on_seq_scan):
+    """EXPLAIN each route's queries and flag sequential scans"""
+    flagged = 0
+    for route, label, statement, *expected_scan in explained_queries():
+        plan = explain_plan(statement)
+        subqueries = set(re.findall(r'CO-ROUTINE (\w+)', '\n'.join(plan)))
+        seq_scans = [line for line in plan if is_sequential_scan(line, subqueries)]
+        if seq_scans and expected_scan and expected_scan[0]:
+            status = 'expected'
+        elif seq_scans:
+            status = 'SEQ SCAN'
+            flagged += 1
+        else:
+            status = 'ok'
+        print(f"{status:<9}{route}: {label}")
+        for line in plan:
+            print(f"         {line}")
+    print(f"{flagged} quer{'y' if flagged == 1 else 'ies'} with sequential scans")
+    if fail_on_seq_scan and flagged:
+        raise SystemExit(1)
+
+def schema_head():
+    """Newest revision in the migrations directory"""
+    return ScriptDirectory(MIGRATIONS_DIR).get_current_head()
+
 def init_db():
-    """Initialize the database and create tables if they don't exist"""
+    """Create the schema on an empty database and check that an existing one is current.
+
+    When alembic_version already holds the migrations head this is a single
+    SELECT; the table inspection and admin check only run otherwise.
+    """
     with app.app_context():
+        head = schema_head()
+        try:
+            current = db.session.execute(db.text('SELECT version_num FROM alembic_version')).scalar()
+        except (OperationalError, ProgrammingError):
+            current = None
+        db.session.rollback()
+        if current == head:
+            logger.debug("database schema is current", extra={'revision': current})
+            return
+
         try:
             # Check if tables exist
             inspector = db.inspect(db.engine)
@@ -671,24 +4002,52 @@ def init_db():
             if not existing_tables:
                 # Create all tables only if they don't exist
                 db.create_all()
-                print("Database tables created successfully")
+                # Mark the fresh schema as current so `flask db upgrade` starts from here
+                stamp(directory=MIGRATIONS_DIR)
+                logger.info("database tables created")
+            elif current is None:
+                logger.warning("database schema is not under migration control, run "
+                               "`flask db stamp ec8ef3ea04b8` then `flask db upgrade`",
+                               extra={'tables': existing_tables})
             else:
-                print(f"Database tables already exist: {existing_tables}")
+                logger.warning("database schema is behind the migrations, run `flask db upgrade`",
+                               extra={'revision': current, 'head': head})
             
             # Check if admin exists, if not, redirect to create admin page
             if not admin_exists():
-                print("No admin user found. Please create an admin account.")
+                logger.warning("no admin user found, please create an admin account")
         except Exception as e:
-            print(f"Error initializing database: {str(e)}")
+            logger.error("database initialization failed", extra={'error': str(e)})
             # Try to create tables even if inspection fails
             try:
                 db.create_all()
-                print("Database tables created after error recovery")
+                logger.info("database tables created after error recovery")
             except Exception as e2:
-                print(f"Failed to create tables after error: {str(e2)}")
+                logger.error("table creation failed after error", extra={'error': str(e2)})
+
+_app_ready = False
+
+def create_app():
+    """Return the application after its one-time startup checks.
 
-# Initialize the database when the application starts
-init_db()
+    Routes, models and extensions are bound to the module-level app when it
+    is imported; importing stays free of database access, Twilio and the
+    scheduler, all of which are set up on first use. Serve with
+    `gunicorn 'app:create_app()'`. With preload_app the schema check runs
+    once in the master, which then closes its connections so forked workers
+    never share a socket.
+    """
+    global _app_ready
+    if not _app_ready:
+        init_db()
+        with app.app_context():
+            db.engine.dispose()
+        _app_ready = True
+    return app
 
 if __name__ == '__main__':
+    # With the reloader on, only start the scheduler in the serving child process
+    create_app()
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_scheduler()
     app.run(debug=True) 
\ No newline at end of file
@@ -0,0 +1,116 @@
+"""Benchmark door check-in latency and throughput under concurrent scanners.
+
+Seeds a throwaway database with synthetic members, then has several threads
+(one per door scanner) post scans of random members to /api/checkin through
+the Flask test client. Reports p50/p95/p99 scan latency, scans per second and
+how many SQL statements the scans issued, then flushes the attendance buffer
+and checks that every accepted scan was written.
+
+Runs against a throwaway SQLite database unless BENCH_DATABASE_URL is set;
+every table in it is dropped, so it must be SQLite or a database whose name
+contains 'bench' or 'test'.
+
+    python bench_checkin.py [--customers 10000] [--scanners 4] [--scans 2000]
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from bench_database import throwaway_database_url
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), 'gym_bench_checkin.db')
+
+
+def run_benchmark(customers, scanners, scans):
+    os.environ['DATABASE_URL'] = throwaway_database_url(BENCH_DB)
+    os.environ['SCHEDULER_MODE'] = 'off'
+    os.environ['SMS_DISPATCHER'] = 'off'
+    os.environ['CHECKIN_TOKEN'] = 'bench'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import app as gym
+    from sqlalchemy.engine import Engine
+    app, db = gym.app, gym.db
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = gym.User(username='bench', password='bench', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        print(f"Seeding {customers} customers...")
+        gym.seed_synthetic(customers, 0, admin.id, seed=42)
+        max_id = db.session.query(db.func.max(gym.Customer.id)).scalar()
+
+    statements = [0]
+
+    @db.event.listens_for(Engine, 'before_cursor_execute')
+    def count_statement(*args):
+        statements[0] += 1
+
+    # The first scan builds the membership index; time it separately
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer bench'}
+    started = time.perf_counter()
+    client.post('/api/checkin', json={'code': '1', 'scanner': 'warmup'}, headers=headers)
+    print(f"Index build on first scan: {(time.perf_counter() - started) * 1000:.1f}ms")
+    gym.checkin_worker.flush()
+
+    timings, outcomes = [], {}
+    lock = threading.Lock()
+    start = threading.Barrier(scanners)
+
+    def scanner(seed):
+        rng = random.Random(seed)
+        scanner_client = app.test_client()
+        local_timings, local_outcomes = [], {}
+        start.wait()
+        for _ in range(scans // scanners):
+            # A few percent of scans are of unknown cards
+            code = str(rng.randint(1, max_id) if rng.random() < 0.97 else max_id + rng.randint(1, 1000))
+            began = time.perf_counter()
+            response = scanner_client.post('/api/checkin', json={'code': code, 'scanner': f'door-{seed}'},
+                                           headers=headers)
+            local_timings.append((time.perf_counter() - began) * 1000)
+            result = response.get_json()
+            outcome = 'granted' if result['granted'] else result['reason']
+            local_outcomes[outcome] = local_outcomes.get(outcome, 0) + 1
+        with lock:
+            timings.extend(local_timings)
+            for outcome, count in local_outcomes.items():
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+
+    statements[0] = 0
+    started = time.perf_counter()
+    threads = [threading.Thread(target=scanner, args=(seed,)) for seed in range(scanners)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    scan_statements = statements[0]
+
+    gym.checkin_worker.flush()
+    with app.app_context():
+        written = gym.Attendance.query.filter(gym.Attendance.scanner != 'warmup').count()
+
+    timings.sort()
+    print(f"{len(timings)} scans from {scanners} scanners in {elapsed:.2f}s ({len(timings) / elapsed:.0f} scans/s)")
+    print(f"latency p50 {statistics.median(timings):.2f}ms  p95 {timings[int(len(timings) * 0.95) - 1]:.2f}ms  "
+          f"p99 {timings[int(len(timings) * 0.99) - 1]:.2f}ms  max {timings[-1]:.2f}ms")
+    print(f"outcomes {outcomes}; {scan_statements} SQL statement(s) during scanning (batched attendance writes)")
+    expected = outcomes.get('granted', 0) + outcomes.get('expired', 0)
+    print(f"attendance rows written {written} of {expected} {'ok' if written == expected else 'MISMATCH'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--customers', type=int, default=10000)
+    parser.add_argument('--scanners', type=int, default=4)
+    parser.add_argument('--scans', type=int, default=2000)
+    args = parser.parse_args()
+    run_benchmark(args.customers, args.scanners, args.scans)
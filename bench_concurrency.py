@@ -0,0 +1,190 @@
+"""Measure write throughput with several gunicorn-style workers sharing one database.
+
+For each engine profile (DB_ENGINE_PROFILE=default, then tuned) a fresh
+interpreter seeds a throwaway database, then forks worker processes from the
+booted app as gunicorn does with preload_app. In every worker a few threads
+post payments through /add_fee while one thread keeps loading the customer
+list, for a fixed number of seconds. Reports payments per second, p50/p95/p99
+payment latency, page loads and failed requests ("database is locked") per
+profile.
+
+Runs against a throwaway SQLite database unless BENCH_DATABASE_URL is set;
+every table in it is dropped, so it must be SQLite or a database whose name
+contains 'bench' or 'test'.
+
+    python bench_concurrency.py [--workers 4] [--threads 2] [--seconds 10] [--output bench_concurrency.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from bench_database import throwaway_database_url
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), 'gym_bench_concurrency.db')
+PROFILES = ('default', 'tuned')
+
+
+def worker(gym, seed, threads, seconds, customer_ids):
+    """One forked worker process: writer threads plus one reader thread"""
+    app = gym.app
+    deadline = time.perf_counter() + seconds
+    lock = threading.Lock()
+    result = {'payments': 0, 'reads': 0, 'errors': 0, 'latencies': []}
+
+    def client():
+        test_client = app.test_client()
+        test_client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        return test_client
+
+    def writer(thread_seed):
+        rng = random.Random(thread_seed)
+        test_client, latencies, payments, errors = client(), [], 0, 0
+        while time.perf_counter() < deadline:
+            began = time.perf_counter()
+            response = test_client.post(f'/add_fee/{rng.choice(customer_ids)}',
+                                        data={'amount': '100', 'payment_type': 'monthly'})
+            if response.status_code == 302:
+                latencies.append((time.perf_counter() - began) * 1000)
+                payments += 1
+            else:
+                errors += 1
+        with lock:
+            result['latencies'].extend(latencies)
+            result['payments'] += payments
+            result['errors'] += errors
+
+    def reader():
+        test_client, reads, errors = client(), 0, 0
+        while time.perf_counter() < deadline:
+            if test_client.get('/view_customers?per_page=50').status_code == 200:
+                reads += 1
+            else:
+                errors += 1
+        with lock:
+            result['reads'] += reads
+            result['errors'] += errors
+
+    pool = [threading.Thread(target=writer, args=(seed * 100 + index,)) for index in range(threads)]
+    pool.append(threading.Thread(target=reader))
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return result
+
+
+def run_profile(workers, threads, seconds, customers):
+    """Executed in a fresh interpreter with DB_ENGINE_PROFILE set; prints one JSON object"""
+    import app as gym
+    from sqlalchemy.exc import OperationalError
+    app, db = gym.app, gym.db
+    app.config['WTF_CSRF_ENABLED'] = False
+    gym.create_app()
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(gym.User(username='bench', password='bench', is_admin=True))
+        db.session.commit()
+        gym.seed_synthetic(customers, 1, 1, seed=42)
+        customer_ids = [customer_id for customer_id, in db.session.execute(db.select(gym.Customer.id))]
+        journal_mode = (db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+                        if db.engine.dialect.name == 'sqlite' else None)
+        engine_options = {key: value for key, value in app.config['SQLALCHEMY_ENGINE_OPTIONS'].items()
+                          if key != 'connect_args'}
+        db.engine.dispose()
+
+    children = []
+    for seed in range(workers):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            try:
+                payload = worker(gym, seed, threads, seconds, customer_ids)
+            except OperationalError as e:
+                payload = {'payments': 0, 'reads': 0, 'errors': 1, 'latencies': [], 'failure': str(e)}
+            os.write(write_fd, json.dumps(payload).encode())
+            os._exit(0)
+        os.close(write_fd)
+        children.append((pid, read_fd))
+
+    totals = {'payments': 0, 'reads': 0, 'errors': 0}
+    latencies = []
+    for pid, read_fd in children:
+        with os.fdopen(read_fd) as pipe:
+            payload = json.loads(pipe.read() or '{}')
+        os.waitpid(pid, 0)
+        for key in totals:
+            totals[key] += payload.get(key, 0)
+        latencies.extend(payload.get('latencies', []))
+
+    latencies.sort()
+    percentile = lambda q: round(latencies[max(int(len(latencies) * q) - 1, 0)], 1) if latencies else None
+    print(json.dumps({
+        'journal_mode': journal_mode,
+        'engine_options': engine_options,
+        'payments': totals['payments'],
+        'payments_per_second': round(totals['payments'] / seconds, 1),
+        'reads_per_second': round(totals['reads'] / seconds, 1),
+        'errors': totals['errors'],
+        'p50_ms': round(statistics.median(latencies), 1) if latencies else None,
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+    }))
+
+
+def run_benchmark(workers, threads, seconds, customers):
+    results = {}
+    for profile in PROFILES:
+        database_url = throwaway_database_url(BENCH_DB)
+        env = dict(os.environ, DB_ENGINE_PROFILE=profile, DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers),
+                   SCHEDULER_MODE='off', SMS_DISPATCHER='off', SMS_TRANSPORT='fake', LOG_LEVEL='ERROR')
+        print(f"Profile {profile}: {workers} workers x ({threads} writers + 1 reader) for {seconds}s...")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-profile', '--workers', str(workers),
+             '--threads', str(threads), '--seconds', str(seconds), '--customers', str(customers)],
+            env=env, capture_output=True, text=True, check=True).stdout
+        results[profile] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=4, help='Forked worker processes.')
+    parser.add_argument('--threads', type=int, default=2, help='Payment-posting threads per worker.')
+    parser.add_argument('--seconds', type=float, default=10, help='How long each profile runs.')
+    parser.add_argument('--customers', type=int, default=2000)
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    parser.add_argument('--run-profile', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        run_profile(args.workers, args.threads, args.seconds, args.customers)
+        sys.exit(0)
+
+    results = run_benchmark(args.workers, args.threads, args.seconds, args.customers)
+    print(f"{'profile':<10}{'payments/s':>12}{'reads/s':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for profile, result in results.items():
+        print(f"{profile:<10}{result['payments_per_second']:>12}{result['reads_per_second']:>10}{result['errors']:>8}"
+              f"{result['p50_ms'] or '-':>9}{result['p95_ms'] or '-':>9}{result['p99_ms'] or '-':>9}")
+    baseline, tuned = results['default']['payments_per_second'], results['tuned']['payments_per_second']
+    if baseline:
+        print(f"Tuned profile write throughput: {tuned / baseline:.2f}x the default")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+                                'python': platform.python_version(), 'workers': args.workers,
+                                'threads': args.threads, 'seconds': args.seconds},
+                       'results': results}, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -0,0 +1,28 @@
+"""Database selection shared by the benchmark and stress scripts.
+
+They drop and re-create every table, so they default to a fresh SQLite file
+and only accept a BENCH_DATABASE_URL that is SQLite or names a database meant
+for benchmarks or tests.
+"""
+import os
+import re
+import sys
+
+from sqlalchemy.engine import make_url
+
+THROWAWAY_NAME_RE = re.compile(r'bench|test', re.IGNORECASE)
+
+
+def throwaway_database_url(default_path):
+    """DATABASE_URL for a run that wipes the schema: BENCH_DATABASE_URL if safe, else a fresh default_path"""
+    url = os.getenv('BENCH_DATABASE_URL')
+    if not url:
+        for path in (default_path, default_path + '-wal', default_path + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+        return 'sqlite:///' + default_path
+    parsed = make_url(url)
+    if parsed.get_backend_name() != 'sqlite' and not THROWAWAY_NAME_RE.search(parsed.database or ''):
+        sys.exit(f"Refusing to benchmark against {parsed.render_as_string(hide_password=True)}: "
+                 "BENCH_DATABASE_URL must be SQLite or a database whose name contains 'bench' or 'test'.")
+    return url
@@ -0,0 +1,192 @@
+"""Benchmark the main routes end to end through the Flask test client.
+
+Seeds a throwaway database with synthetic members (see `flask seed-synthetic`)
+and grows it through each size in turn, timing login, listing, search,
+registration, payment and extension requests at every step. SMS delivery is
+stubbed out and the scheduler is off, so only the request path is measured.
+
+Reports p50/p95/p99 latency and SQL statements per request, and writes the
+results as JSON so two runs (say, before and after a change) can be compared.
+Runs against SQLite by default; point BENCH_DATABASE_URL at a PostgreSQL
+database to benchmark that instead. Its tables are dropped, so its name must
+contain 'bench' or 'test'.
+
+    python bench_routes.py [--sizes 1000,10000,100000] [--runs 50] [--output bench_routes.json]
+    python bench_routes.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench_database import throwaway_database_url
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), 'gym_bench_routes.db')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(int(round(fraction * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def summarize(timings, queries):
+    timings, queries = sorted(timings), sorted(queries)
+    return {
+        'runs': len(timings),
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'max_ms': round(timings[-1], 2),
+        'queries_p50': percentile(queries, 0.50),
+        'queries_max': queries[-1],
+    }
+
+
+def run_benchmark(sizes, runs, fees_per_customer, seed):
+    # Configure the app before it is imported: throwaway database, no scheduler, no SMS threads
+    os.environ['DATABASE_URL'] = throwaway_database_url(BENCH_DB)
+    os.environ['SCHEDULER_MODE'] = 'off'
+    os.environ['SMS_DISPATCHER'] = 'off'
+    os.environ['SMS_TRANSPORT'] = 'fake'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import app as gym
+    from sqlalchemy.engine import Engine
+
+    app, db = gym.app, gym.db
+    app.config['WTF_CSRF_ENABLED'] = False
+    gym.send_sms = lambda to_number, message: True
+
+    statements = [0]
+
+    @db.event.listens_for(Engine, 'before_cursor_execute')
+    def count_statement(*args):
+        statements[0] += 1
+
+    rng = random.Random(seed)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        admin = gym.User(username='bench', password='bench', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+        dialect = db.engine.dialect.name
+
+    client = app.test_client()
+    search_terms = ['Karthik', 'Iyer', 'priya nair', 'kumar', 'gmail', '98450', 'zzzz-nomatch']
+
+    def random_customer_id():
+        with app.app_context():
+            return rng.randint(1, db.session.query(db.func.max(gym.Customer.id)).scalar())
+
+    def middle_cursor():
+        with app.app_context():
+            total = gym.Customer.query.count()
+            customer = gym.Customer.query.order_by(gym.Customer.membership_end, gym.Customer.id) \
+                .offset(total // 2).first()
+            return gym.encode_cursor(customer, 'membership_end')
+
+    scenarios = {
+        'login': lambda: client.post('/login', data={'username': 'bench', 'password': 'bench'}),
+        'list_first_page': lambda: client.get('/view_customers'),
+        'list_by_name': lambda: client.get('/view_customers?sort=name&per_page=100'),
+        'list_deep_page': lambda: client.get(f'/view_customers?after={cursor}'),
+        'search': lambda: client.get('/view_customers', query_string={'search': rng.choice(search_terms)}),
+        'view_customer': lambda: client.get(f'/view_customer/{random_customer_id()}'),
+        'register': lambda: client.post('/register_customer', data={
+            'name': f'Bench Member {rng.randint(0, 10 ** 6)}', 'phone': f'9{rng.randint(100000000, 999999999)}',
+            'package_type': rng.choice(list(gym.PACKAGES)), 'duration_months': '1', 'initial_payment': '500'}),
+        'payment': lambda: client.post(f'/add_fee/{random_customer_id()}', data={
+            'amount': '750', 'payment_type': 'monthly', 'description': 'bench'}),
+        'extension': lambda: client.post(f'/extend_membership/{random_customer_id()}', data={
+            'extension_period': '1', 'initial_payment': '0'}),
+    }
+
+    results = {}
+    seeded = 0
+    for size in sizes:
+        with app.app_context():
+            print(f"Seeding to {size} customers...", flush=True)
+            gym.seed_synthetic(size - seeded, fees_per_customer, admin_id, seed=seed + size)
+            seeded = size
+        cursor = middle_cursor()
+        client.post('/login', data={'username': 'bench', 'password': 'bench'})
+        # Warm caches, compiled statements and templates before timing
+        for request in scenarios.values():
+            request()
+
+        results[str(size)] = {}
+        print(f"{'route':<18}{'p50':>10}{'p95':>10}{'p99':>10}{'queries':>9}")
+        for name, request in scenarios.items():
+            timings, queries = [], []
+            for _ in range(runs):
+                statements[0] = 0
+                started = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - started) * 1000)
+                queries.append(statements[0])
+                if response.status_code >= 400:
+                    raise SystemExit(f"{name} returned HTTP {response.status_code}")
+            stats = summarize(timings, queries)
+            results[str(size)][name] = stats
+            print(f"{name:<18}{stats['p50_ms']:>8.2f}ms{stats['p95_ms']:>8.2f}ms{stats['p99_ms']:>8.2f}ms"
+                  f"{stats['queries_p50']:>9}")
+
+    return {
+        'meta': {
+            'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+            'database': dialect,
+            'python': platform.python_version(),
+            'runs': runs,
+            'fees_per_customer': fees_per_customer,
+            'seed': seed,
+        },
+        'results': results,
+    }
+
+
+def compare(before_path, after_path):
+    """Print the p50/p95 change of every route present in both result files"""
+    with open(before_path) as f:
+        before = json.load(f)['results']
+    with open(after_path) as f:
+        after = json.load(f)['results']
+    print(f"{'size':>8} {'route':<18}{'p50 before':>12}{'p50 after':>11}{'p95 before':>12}{'p95 after':>11}"
+          f"{'queries':>12}")
+    for size in sorted(set(before) & set(after), key=int):
+        for name in before[size]:
+            if name not in after[size]:
+                continue
+            old, new = before[size][name], after[size][name]
+            change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+            print(f"{size:>8} {name:<18}{old['p50_ms']:>10.2f}ms{new['p50_ms']:>9.2f}ms"
+                  f"{old['p95_ms']:>10.2f}ms{new['p95_ms']:>9.2f}ms"
+                  f"{old['queries_p50']:>5} -> {new['queries_p50']:<4}{change:+.0f}%")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='Comma-separated member counts.')
+    parser.add_argument('--runs', type=int, default=50, help='Timed requests per route and size.')
+    parser.add_argument('--fees-per-customer', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench_routes.json', help='Where to write the JSON results.')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='Compare two result files.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        sys.exit(0)
+
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+    report = run_benchmark(sizes, args.runs, args.fees_per_customer, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
@@ -0,0 +1,59 @@
+"""Benchmark customer search latency against a synthetic customer table.
+
+Runs against a throwaway SQLite database by default so it never touches the
+real one. Point BENCH_DATABASE_URL at a PostgreSQL database whose name contains
+'bench' or 'test' to benchmark the pg_trgm indexes instead.
+
+    python bench_search.py [customers]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench_database import throwaway_database_url
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), 'gym_bench_search.db')
+os.environ['DATABASE_URL'] = throwaway_database_url(BENCH_DB)
+
+from app import app, db, Customer, customer_search_filter, paginate_customers, seed_synthetic
+
+QUERIES = ['Karthik', 'Iyer', 'priya nair', 'kumar', 'gmail', '98450', '9845012', 'zzzz-nomatch']
+RUNS = 20
+
+
+def legacy_filter(search_query):
+    return db.or_(
+        Customer.name.ilike(f'%{search_query}%'),
+        Customer.email.ilike(f'%{search_query}%'),
+        Customer.phone.ilike(f'%{search_query}%')
+    )
+
+
+def measure(build_filter, search_query):
+    timings = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        paginate_customers(Customer.query.filter(build_filter(search_query)), 'expiry', 50)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.rollback()
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95) - 1]
+
+
+def run_benchmark(count):
+    with app.app_context():
+        db.create_all()
+        print(f"Seeding {count} customers...")
+        seed_synthetic(count, 0, None, seed=42)
+        print(f"{'query':<16}{'legacy p50':>12}{'legacy p95':>12}{'indexed p50':>13}{'indexed p95':>13}")
+        for search_query in QUERIES:
+            legacy = measure(legacy_filter, search_query)
+            indexed = measure(customer_search_filter, search_query)
+            print(f"{search_query:<16}{legacy[0]:>10.2f}ms{legacy[1]:>10.2f}ms"
+                  f"{indexed[0]:>11.2f}ms{indexed[1]:>11.2f}ms")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
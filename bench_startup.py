@@ -0,0 +1,122 @@
+"""Measure application boot time and the memory each web worker costs.
+
+Every run starts a fresh interpreter that imports app.py, calls create_app()
+and serves one request through the test client, timing each step and noting
+whether Twilio and APScheduler got imported. It then forks a worker from the
+booted process, as gunicorn does with preload_app, and compares the memory
+private to that worker with the private memory of a process that booted on
+its own (Linux only: read from /proc/self/smaps_rollup).
+
+Runs against a throwaway SQLite database unless BENCH_DATABASE_URL is set.
+
+    python bench_startup.py [--runs 10] [--output bench_startup.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+BENCH_DB = os.path.join(tempfile.gettempdir(), 'gym_bench_startup.db')
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Executed in a fresh interpreter for every run; prints one JSON object
+BOOT_PROBE = r'''
+import json, os, resource, sys, time
+sys.path.insert(0, HERE)
+
+def private_kb():
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+    except OSError:
+        return None
+    return sum(int(fields[key].split()[0]) for key in ('Private_Clean', 'Private_Dirty') if key in fields)
+
+started = time.perf_counter()
+import app as gym
+imported = time.perf_counter()
+# Trees from before the app factory initialise everything on import
+getattr(gym, 'create_app', lambda: gym.app)()
+created = time.perf_counter()
+client = gym.app.test_client()
+client.get('/login')
+served = time.perf_counter()
+
+result = {
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'boot_ms': (served - started) * 1000,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'private_kb': private_kb(),
+    'twilio_imported': 'twilio' in sys.modules,
+    'apscheduler_imported': 'apscheduler' in sys.modules,
+}
+
+# A worker forked from the booted process, as under gunicorn's preload_app
+read_fd, write_fd = os.pipe()
+pid = os.fork()
+if pid == 0:
+    os.close(read_fd)
+    worker_started = time.perf_counter()
+    gym.app.test_client().get('/login')
+    payload = json.dumps({'forked_first_request_ms': (time.perf_counter() - worker_started) * 1000,
+                          'forked_private_kb': private_kb()})
+    os.write(write_fd, payload.encode())
+    os._exit(0)
+os.close(write_fd)
+with os.fdopen(read_fd) as pipe:
+    result.update(json.loads(pipe.read() or '{}'))
+os.waitpid(pid, 0)
+print(json.dumps(result))
+'''
+
+
+def boot_once():
+    env = dict(os.environ, LOG_LEVEL='WARNING', SCHEDULER_MODE='off', SMS_DISPATCHER='off',
+               DATABASE_URL=os.getenv('BENCH_DATABASE_URL', 'sqlite:///' + BENCH_DB))
+    output = subprocess.run([sys.executable, '-c', f'HERE = {HERE!r}\n' + BOOT_PROBE],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run_benchmark(runs):
+    if not os.getenv('BENCH_DATABASE_URL'):
+        for path in (BENCH_DB, BENCH_DB + '-wal', BENCH_DB + '-shm'):
+            if os.path.exists(path):
+                os.remove(path)
+    # The first boot creates the schema; time only the steady-state boots after it
+    boot_once()
+    samples = [boot_once() for _ in range(runs)]
+
+    summary = {}
+    for key, value in samples[0].items():
+        if isinstance(value, bool) or value is None:
+            summary[key] = value
+        else:
+            summary[key] = round(statistics.median(sample[key] for sample in samples), 1)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10, help='Fresh interpreters to boot.')
+    parser.add_argument('--output', help='Also write the results to this JSON file.')
+    args = parser.parse_args()
+
+    summary = run_benchmark(args.runs)
+    print(f"Median of {args.runs} boots:")
+    for key, value in summary.items():
+        print(f"  {key:<26}{value}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'meta': {'started_at': datetime.utcnow().isoformat(timespec='seconds'),
+                                'python': platform.python_version(), 'runs': args.runs},
+                       'results': summary}, f, indent=2)
+        print(f"Results written to {args.output}")
@@ -1,3 +1,16 @@
-workers = 4
+import os
+
 bind = "0.0.0.0:10000"
-timeout = 120 
\ No newline at end of file
+timeout = 120
+# app.py sizes each worker's database pool from the same setting
+workers = int(os.getenv('WEB_CONCURRENCY', 4))
+
+# Import the app once in the master and fork workers from it: code and
+# templates are shared copy-on-write and workers boot without re-importing.
+# create_app() closes the master's database connections before the fork.
+preload_app = True
+
+def post_worker_init(worker):
+    # Start the embedded scheduler after fork; the job lock keeps runs unique across workers
+    from app import start_scheduler
+    start_scheduler()
@@ -0,0 +1,43 @@
+"""customer payment totals
+
+Revision ID: 2c7e9f4b1d58
+Revises: f1b6d2a8c493
+Create Date: 2026-10-18 21:37:45.108326
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c7e9f4b1d58'
+down_revision = 'f1b6d2a8c493'
+branch_labels = None
+depends_on = None
+
+# Lifetime totals over the hot and archived payments; plain correlated
+# subqueries so the same statement runs on SQLite and PostgreSQL
+BACKFILL = """
+UPDATE customer SET
+    total_paid = coalesce((SELECT sum(amount) FROM fee WHERE fee.customer_id = customer.id), 0)
+               + coalesce((SELECT sum(amount) FROM fee_archive WHERE fee_archive.customer_id = customer.id), 0),
+    last_payment_at = (SELECT max(payment_date) FROM (
+        SELECT payment_date FROM fee WHERE fee.customer_id = customer.id
+        UNION ALL
+        SELECT payment_date FROM fee_archive WHERE fee_archive.customer_id = customer.id
+    ) AS payments)
+"""
+
+
+def upgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_paid', sa.Float(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('last_payment_at', sa.DateTime(), nullable=True))
+
+    op.execute(BACKFILL)
+
+
+def downgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.drop_column('last_payment_at')
+        batch_op.drop_column('total_paid')
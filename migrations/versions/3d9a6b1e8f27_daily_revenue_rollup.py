@@ -0,0 +1,38 @@
+"""daily revenue rollup
+
+Revision ID: 3d9a6b1e8f27
+Revises: 7c41e9d05a62
+Create Date: 2026-10-18 13:48:20.771935
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9a6b1e8f27'
+down_revision = '7c41e9d05a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('daily_revenue',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('payment_type', sa.String(length=20), nullable=False),
+    sa.Column('collected_by', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('payment_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['collected_by'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('day', 'payment_type', 'collected_by')
+    )
+    # Backfill from the existing ledger
+    op.execute(
+        "INSERT INTO daily_revenue (day, payment_type, collected_by, amount, payment_count) "
+        "SELECT date(payment_date), payment_type, collected_by, sum(amount), count(*) "
+        "FROM fee GROUP BY date(payment_date), payment_type, collected_by"
+    )
+
+
+def downgrade():
+    op.drop_table('daily_revenue')
@@ -0,0 +1,35 @@
+"""attendance
+
+Revision ID: 4b8e1f3c7a62
+Revises: 9a7d3f6c2e15
+Create Date: 2026-10-18 16:12:07.318504
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e1f3c7a62'
+down_revision = '9a7d3f6c2e15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('attendance',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('checked_in_at', sa.DateTime(), nullable=False),
+    sa.Column('granted', sa.Boolean(), nullable=False),
+    sa.Column('scanner', sa.String(length=40), nullable=True),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_attendance_customer_id_checked_in_at', 'attendance', ['customer_id', 'checked_in_at'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_attendance_customer_id_checked_in_at', table_name='attendance')
+    op.drop_table('attendance')
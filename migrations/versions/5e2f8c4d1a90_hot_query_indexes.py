@@ -0,0 +1,30 @@
+"""hot query indexes
+
+Revision ID: 5e2f8c4d1a90
+Revises: 3d9a6b1e8f27
+Create Date: 2026-10-18 14:26:03.551879
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5e2f8c4d1a90'
+down_revision = '3d9a6b1e8f27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain op.create_index keeps SQLite from recreating customer, which would
+    # drop the customer_search triggers
+    op.create_index('ix_customer_notification_sent_membership_end', 'customer',
+                    ['notification_sent', 'membership_end'], unique=False)
+    op.create_index('ix_fee_customer_id_payment_date', 'fee', ['customer_id', 'payment_date'], unique=False)
+    op.create_index('ix_user_is_admin', 'user', ['is_admin'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_is_admin', table_name='user')
+    op.drop_index('ix_fee_customer_id_payment_date', table_name='fee')
+    op.drop_index('ix_customer_notification_sent_membership_end', table_name='customer')
@@ -0,0 +1,32 @@
+"""scheduler lock
+
+Revision ID: 7c41e9d05a62
+Revises: 1f0c2d7a9b34
+Create Date: 2026-10-18 13:05:54.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c41e9d05a62'
+down_revision = '1f0c2d7a9b34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('scheduler_lock',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('holder', sa.String(length=100), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=False),
+    sa.Column('last_started_at', sa.DateTime(), nullable=True),
+    sa.Column('last_finished_at', sa.DateTime(), nullable=True),
+    sa.Column('last_status', sa.String(length=20), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('scheduler_lock')
@@ -0,0 +1,127 @@
+"""branches
+
+Revision ID: 8d4f1a6c3e72
+Revises: 2c7e9f4b1d58
+Create Date: 2026-10-18 22:52:06.417395
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4f1a6c3e72'
+down_revision = '2c7e9f4b1d58'
+branch_labels = None
+depends_on = None
+
+# Existing rows all belong to the branch created here, which gets id 1
+BRANCH_TABLES = ('customer', 'fee', 'fee_archive', 'attendance')
+
+# (table, old index, new index, columns of the new index)
+INDEX_SWAPS = [
+    ('customer', 'ix_customer_membership_end_id', 'ix_customer_branch_id_membership_end_id',
+     ['branch_id', 'membership_end', 'id']),
+    ('customer', 'ix_customer_name_id', 'ix_customer_branch_id_name_id', ['branch_id', 'name', 'id']),
+    ('customer', 'ix_customer_notification_sent_membership_end',
+     'ix_customer_branch_id_notification_sent_membership_end', ['branch_id', 'notification_sent', 'membership_end']),
+    ('customer', 'ix_customer_phone_digits', 'ix_customer_branch_id_phone_digits', ['branch_id', 'phone_digits']),
+    ('fee', 'ix_fee_customer_id_payment_date', 'ix_fee_branch_id_customer_id_payment_date',
+     ['branch_id', 'customer_id', 'payment_date']),
+    ('fee_archive', 'ix_fee_archive_customer_id_payment_date', 'ix_fee_archive_branch_id_customer_id_payment_date',
+     ['branch_id', 'customer_id', 'payment_date']),
+    ('attendance', 'ix_attendance_customer_id_checked_in_at', 'ix_attendance_branch_id_customer_id_checked_in_at',
+     ['branch_id', 'customer_id', 'checked_in_at']),
+]
+
+# Columns each old index covered, to restore them on downgrade
+OLD_INDEX_COLUMNS = {
+    'ix_customer_membership_end_id': ['membership_end', 'id'],
+    'ix_customer_name_id': ['name', 'id'],
+    'ix_customer_notification_sent_membership_end': ['notification_sent', 'membership_end'],
+    'ix_customer_phone_digits': ['phone_digits'],
+    'ix_fee_customer_id_payment_date': ['customer_id', 'payment_date'],
+    'ix_fee_archive_customer_id_payment_date': ['customer_id', 'payment_date'],
+    'ix_attendance_customer_id_checked_in_at': ['customer_id', 'checked_in_at'],
+}
+
+# daily_revenue is a rollup of the fee ledger, so it is rebuilt with the new key
+ROLLUP_BACKFILL = """
+INSERT INTO daily_revenue ({branch}day, payment_type, collected_by, amount, payment_count)
+SELECT {branch}date(payment_date), payment_type, collected_by, sum(amount), count(*)
+FROM (SELECT {branch}payment_date, payment_type, collected_by, amount FROM fee
+      UNION ALL
+      SELECT {branch}payment_date, payment_type, collected_by, amount FROM fee_archive) AS ledger
+GROUP BY {branch}date(payment_date), payment_type, collected_by
+"""
+
+
+def create_daily_revenue(with_branch):
+    columns = [
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('payment_type', sa.String(length=20), nullable=False),
+        sa.Column('collected_by', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('payment_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['collected_by'], ['user.id'], ),
+    ]
+    key = ['day', 'payment_type', 'collected_by']
+    if with_branch:
+        columns = [sa.Column('branch_id', sa.Integer(), nullable=False),
+                   sa.ForeignKeyConstraint(['branch_id'], ['branch.id'], )] + columns
+        key = ['branch_id'] + key
+    op.create_table('daily_revenue', *columns, sa.PrimaryKeyConstraint(*key))
+    op.execute(ROLLUP_BACKFILL.format(branch='branch_id, ' if with_branch else ''))
+
+
+def upgrade():
+    op.create_table('branch',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('code', sa.String(length=20), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('code')
+    )
+    op.execute("INSERT INTO branch (code, name, created_at) VALUES ('main', 'Main', CURRENT_TIMESTAMP)")
+
+    # SQLite cannot add a foreign key without rebuilding the table, which would
+    # drop the customer search triggers, and does not enforce them here anyway;
+    # Postgres gets them under the names create_all would give them. There a
+    # column added to the partitioned fee tables reaches every partition.
+    add_foreign_keys = op.get_bind().dialect.name != 'sqlite'
+    op.add_column('user', sa.Column('branch_id', sa.Integer(), nullable=True))
+    for table in BRANCH_TABLES:
+        op.add_column(table, sa.Column('branch_id', sa.Integer(), server_default='1', nullable=False))
+    if add_foreign_keys:
+        for table in ('user',) + BRANCH_TABLES:
+            op.create_foreign_key(f'{table}_branch_id_fkey', table, 'branch', ['branch_id'], ['id'])
+
+    # Existing admins become head office; everyone else works in the main branch
+    user = sa.table('user', sa.column('branch_id', sa.Integer()), sa.column('is_admin', sa.Boolean()))
+    op.execute(user.update().where(sa.or_(user.c.is_admin.is_(None), user.c.is_admin == sa.false()))
+               .values(branch_id=1))
+
+    for table, old_index, new_index, columns in INDEX_SWAPS:
+        op.drop_index(old_index, table_name=table)
+        op.create_index(new_index, table, columns, unique=False)
+
+    op.drop_table('daily_revenue')
+    create_daily_revenue(with_branch=True)
+
+
+def downgrade():
+    op.drop_table('daily_revenue')
+    create_daily_revenue(with_branch=False)
+
+    for table, old_index, new_index, columns in INDEX_SWAPS:
+        op.drop_index(new_index, table_name=table)
+        op.create_index(old_index, table, OLD_INDEX_COLUMNS[old_index], unique=False)
+
+    drop_foreign_keys = op.get_bind().dialect.name != 'sqlite'
+    for table in BRANCH_TABLES + ('user',):
+        if drop_foreign_keys:
+            op.drop_constraint(f'{table}_branch_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'branch_id')
+
+    op.drop_table('branch')
@@ -0,0 +1,28 @@
+"""cache version
+
+Revision ID: 9a7d3f6c2e15
+Revises: 5e2f8c4d1a90
+Create Date: 2026-10-18 14:58:41.092637
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7d3f6c2e15'
+down_revision = '5e2f8c4d1a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cache_version',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_version')
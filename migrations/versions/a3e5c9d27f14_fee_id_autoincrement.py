@@ -0,0 +1,40 @@
+"""fee id autoincrement
+
+Revision ID: a3e5c9d27f14
+Revises: 8d4f1a6c3e72
+Create Date: 2026-10-18 23:34:51.208716
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e5c9d27f14'
+down_revision = '8d4f1a6c3e72'
+branch_labels = None
+depends_on = None
+
+# SQLite reuses the ids of deleted rows unless the table is AUTOINCREMENT, so
+# once archiving empties fee, new payments would get ids already taken in
+# fee_archive. Postgres draws fee ids from a sequence and needs nothing here.
+# The sequence starts past every id used so far, archived or not.
+SEED_SEQUENCE = """
+INSERT INTO sqlite_sequence (name, seq)
+SELECT 'fee', coalesce(max(id), 0) FROM (SELECT id FROM fee UNION ALL SELECT id FROM fee_archive) AS ledger
+"""
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('fee', recreate='always', table_kwargs={'sqlite_autoincrement': True}):
+        pass
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'fee'")
+    op.execute(SEED_SEQUENCE)
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    with op.batch_alter_table('fee', recreate='always', table_kwargs={'sqlite_autoincrement': False}):
+        pass
@@ -0,0 +1,94 @@
+"""customer search indexes
+
+Revision ID: aeb85ba21946
+Revises: b6339ec59e41
+Create Date: 2026-10-18 11:41:09.275514
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'aeb85ba21946'
+down_revision = 'b6339ec59e41'
+branch_labels = None
+depends_on = None
+
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS customer_search USING fts5("
+    "name, email, content='customer', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_ai AFTER INSERT ON customer BEGIN "
+    "INSERT INTO customer_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_ad AFTER DELETE ON customer BEGIN "
+    "INSERT INTO customer_search(customer_search, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS customer_search_au AFTER UPDATE OF name, email ON customer BEGIN "
+    "INSERT INTO customer_search(customer_search, rowid, name, email) "
+    "VALUES ('delete', old.id, old.name, old.email); "
+    "INSERT INTO customer_search(rowid, name, email) VALUES (new.id, new.name, new.email); END",
+    "INSERT INTO customer_search(customer_search) VALUES ('rebuild')",
+]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_customer_name_trgm ON customer USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_email_trgm ON customer USING gin (email gin_trgm_ops)",
+]
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 12 and digits.startswith('91'):
+        digits = digits[2:]
+    return digits
+
+
+def upgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('phone_digits', sa.String(length=20), nullable=True))
+        batch_op.create_index(batch_op.f('ix_customer_phone_digits'), ['phone_digits'], unique=False)
+
+    # Backfill in batches; the normalisation is done in Python so it matches the app exactly
+    conn = op.get_bind()
+    customer = sa.table('customer', sa.column('id', sa.Integer), sa.column('phone', sa.String),
+                        sa.column('phone_digits', sa.String))
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(customer.c.id, customer.c.phone)
+            .where(customer.c.id > last_id).order_by(customer.c.id).limit(5000)
+        ).all()
+        if not rows:
+            break
+        conn.execute(
+            customer.update().where(customer.c.id == sa.bindparam('b_id'))
+            .values(phone_digits=sa.bindparam('b_digits')),
+            [{'b_id': row.id, 'b_digits': normalize_phone(row.phone)} for row in rows]
+        )
+        last_id = rows[-1].id
+
+    if conn.dialect.name == 'sqlite':
+        for statement in SQLITE_DDL:
+            op.execute(statement)
+    elif conn.dialect.name == 'postgresql':
+        for statement in POSTGRES_DDL:
+            op.execute(statement)
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name == 'sqlite':
+        for trigger in ('customer_search_ai', 'customer_search_ad', 'customer_search_au'):
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS customer_search")
+    elif conn.dialect.name == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_customer_email_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_customer_name_trgm")
+
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_customer_phone_digits'))
+        batch_op.drop_column('phone_digits')
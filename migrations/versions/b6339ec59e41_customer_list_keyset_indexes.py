@@ -0,0 +1,27 @@
+"""customer list keyset indexes
+
+Revision ID: b6339ec59e41
+Revises: ec8ef3ea04b8
+Create Date: 2026-10-18 11:02:47.918230
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6339ec59e41'
+down_revision = 'ec8ef3ea04b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.create_index('ix_customer_membership_end_id', ['membership_end', 'id'], unique=False)
+        batch_op.create_index('ix_customer_name_id', ['name', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('customer', schema=None) as batch_op:
+        batch_op.drop_index('ix_customer_name_id')
+        batch_op.drop_index('ix_customer_membership_end_id')
@@ -0,0 +1,35 @@
+"""admin alert digest and idempotency keys
+
+Revision ID: c3d9a4e2b817
+Revises: 4b8e1f3c7a62
+Create Date: 2026-10-18 17:41:52.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3d9a4e2b817'
+down_revision = '4b8e1f3c7a62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('admin_alert',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('body', sa.String(length=500), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('idempotency_key',
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('idempotency_key')
+    op.drop_table('admin_alert')
@@ -0,0 +1,60 @@
+"""package price catalog
+
+Revision ID: e7a2c5d19b40
+Revises: c3d9a4e2b817
+Create Date: 2026-10-18 19:05:33.817260
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a2c5d19b40'
+down_revision = 'c3d9a4e2b817'
+branch_labels = None
+depends_on = None
+
+# Catalog version 1: the prices that were hard-coded in app.py, with the
+# ultimate package renewing at 3000 a month instead of nothing
+CATALOG_V1 = [
+    # kind, code, name, duration_months, fees, discount, admission_fee, monthly_rate
+    ('package', 'basic', 'BASIC PACKAGE', 1, 750, 0, 250, 1500),
+    ('package', 'standard', 'STANDARD PACKAGE', 3, 2500, 300, 0, 2000),
+    ('package', 'premium', 'PREMIUM PACKAGE', 6, 4750, 550, 0, 2500),
+    ('package', 'ultimate', 'ULTIMATE PACKAGE', 12, 9250, 1050, 0, 3000),
+    ('training', 'basic', 'BASIC TRAINING', 1, 4000, 0, 0, 4000),
+    ('training', 'advanced', 'ADVANCED TRAINING', 3, 12000, 2000, 0, 10000),
+    ('addon', 'treadmill', 'TREADMILL ACCESS', 1, 0, 0, 0, 500),
+]
+
+
+def upgrade():
+    package_price = op.create_table('package_price',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('catalog_version', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('code', sa.String(length=20), nullable=False),
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('duration_months', sa.Integer(), nullable=False),
+    sa.Column('fees', sa.Float(), nullable=False),
+    sa.Column('discount', sa.Float(), nullable=False),
+    sa.Column('admission_fee', sa.Float(), nullable=False),
+    sa.Column('monthly_rate', sa.Float(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('catalog_version', 'kind', 'code', name='uq_package_price_version_kind_code')
+    )
+    now = datetime.utcnow()
+    op.bulk_insert(package_price, [
+        {'catalog_version': 1, 'kind': kind, 'code': code, 'name': name, 'duration_months': duration,
+         'fees': fees, 'discount': discount, 'admission_fee': admission_fee, 'monthly_rate': monthly_rate,
+         'created_at': now}
+        for kind, code, name, duration, fees, discount, admission_fee, monthly_rate in CATALOG_V1
+    ])
+
+
+def downgrade():
+    op.drop_table('package_price')
@@ -0,0 +1,68 @@
+"""initial schema
+
+Revision ID: ec8ef3ea04b8
+Revises: 
+Create Date: 2026-10-18 10:55:12.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'ec8ef3ea04b8'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('user',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=80), nullable=False),
+    sa.Column('password', sa.String(length=120), nullable=False),
+    sa.Column('is_admin', sa.Boolean(), nullable=True),
+    sa.Column('join_date', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('customer',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('email', sa.String(length=120), nullable=True),
+    sa.Column('phone', sa.String(length=20), nullable=False),
+    sa.Column('package_type', sa.String(length=20), nullable=False),
+    sa.Column('join_date', sa.DateTime(), nullable=True),
+    sa.Column('membership_end', sa.DateTime(), nullable=False),
+    sa.Column('has_cardio', sa.Boolean(), nullable=True),
+    sa.Column('has_personal_training', sa.Boolean(), nullable=True),
+    sa.Column('personal_training_type', sa.String(length=20), nullable=True),
+    sa.Column('trainer_id', sa.Integer(), nullable=True),
+    sa.Column('admission_fee', sa.Float(), nullable=True),
+    sa.Column('package_fee', sa.Float(), nullable=True),
+    sa.Column('discount', sa.Float(), nullable=True),
+    sa.Column('total_amount', sa.Float(), nullable=True),
+    sa.Column('notification_sent', sa.Boolean(), nullable=True),
+    sa.Column('treadmill_access', sa.Boolean(), nullable=True),
+    sa.Column('pending_amount', sa.Float(), nullable=True),
+    sa.ForeignKeyConstraint(['trainer_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('fee',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('customer_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Float(), nullable=False),
+    sa.Column('payment_type', sa.String(length=20), nullable=False),
+    sa.Column('description', sa.String(length=200), nullable=True),
+    sa.Column('payment_date', sa.DateTime(), nullable=True),
+    sa.Column('collected_by', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['collected_by'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['customer_id'], ['customer.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('fee')
+    op.drop_table('customer')
+    op.drop_table('user')
@@ -0,0 +1,120 @@
+"""fee ledger partitions and archive
+
+Revision ID: f1b6d2a8c493
+Revises: e7a2c5d19b40
+Create Date: 2026-10-18 20:41:12.530918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d2a8c493'
+down_revision = 'e7a2c5d19b40'
+branch_labels = None
+depends_on = None
+
+# Postgres: fee and fee_archive become range-partitioned on payment_date, one
+# partition per month. The partition key has to be part of the primary key,
+# so payment_date becomes NOT NULL. The id sequence is kept, so ids continue.
+FEE_COLUMNS = "id, customer_id, amount, payment_type, description, payment_date, collected_by"
+
+POSTGRES_PARTITIONED_TABLE = """
+CREATE TABLE {table} (
+    id integer NOT NULL DEFAULT nextval('fee_id_seq'),
+    customer_id integer NOT NULL REFERENCES customer (id),
+    amount double precision NOT NULL,
+    payment_type varchar(20) NOT NULL,
+    description varchar(200),
+    payment_date timestamp without time zone NOT NULL,
+    collected_by integer NOT NULL REFERENCES "user" (id),
+    PRIMARY KEY (id, payment_date)
+) PARTITION BY RANGE (payment_date)
+"""
+
+# Monthly partitions from the first payment through three months ahead
+POSTGRES_MONTHLY_PARTITIONS = """
+DO $$
+DECLARE
+    month date;
+BEGIN
+    FOR month IN
+        SELECT generate_series(first_month, last_month, interval '1 month')::date
+        FROM (SELECT date_trunc('month', coalesce(min(payment_date), now())) AS first_month,
+                     date_trunc('month', now() + interval '3 months') AS last_month
+              FROM fee_unpartitioned) AS bounds
+    LOOP
+        EXECUTE format('CREATE TABLE %I PARTITION OF fee FOR VALUES FROM (%L) TO (%L)',
+                       'fee_p' || to_char(month, 'YYYYMM'), month, month + interval '1 month');
+    END LOOP;
+END $$
+"""
+
+
+def upgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        op.create_table('fee_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('customer_id', sa.Integer(), nullable=False),
+        sa.Column('amount', sa.Float(), nullable=False),
+        sa.Column('payment_type', sa.String(length=20), nullable=False),
+        sa.Column('description', sa.String(length=200), nullable=True),
+        sa.Column('payment_date', sa.DateTime(), nullable=True),
+        sa.Column('collected_by', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['collected_by'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['customer_id'], ['customer.id'], ),
+        sa.PrimaryKeyConstraint('id')
+        )
+        op.create_index('ix_fee_archive_customer_id_payment_date', 'fee_archive',
+                        ['customer_id', 'payment_date'], unique=False)
+        return
+
+    op.execute("ALTER TABLE fee RENAME TO fee_unpartitioned")
+    op.execute("ALTER TABLE fee_unpartitioned RENAME CONSTRAINT fee_pkey TO fee_unpartitioned_pkey")
+    op.execute("ALTER INDEX ix_fee_customer_id_payment_date RENAME TO ix_fee_unpartitioned_customer_id_payment_date")
+    op.execute("UPDATE fee_unpartitioned SET payment_date = now() AT TIME ZONE 'UTC' WHERE payment_date IS NULL")
+
+    op.execute(POSTGRES_PARTITIONED_TABLE.format(table='fee'))
+    op.execute(POSTGRES_MONTHLY_PARTITIONS)
+    op.execute("CREATE TABLE fee_pdefault PARTITION OF fee DEFAULT")
+    op.execute(f"INSERT INTO fee ({FEE_COLUMNS}) SELECT {FEE_COLUMNS} FROM fee_unpartitioned")
+    op.execute("ALTER SEQUENCE fee_id_seq OWNED BY fee.id")
+    op.execute("DROP TABLE fee_unpartitioned")
+    op.execute("CREATE INDEX ix_fee_customer_id_payment_date ON fee (customer_id, payment_date)")
+
+    # Archived months are attached here as fee_archive_pYYYYMM by `flask archive-fees`
+    op.execute(POSTGRES_PARTITIONED_TABLE.format(table='fee_archive').replace(
+        "DEFAULT nextval('fee_id_seq')", ""))
+    op.execute("CREATE INDEX ix_fee_archive_customer_id_payment_date ON fee_archive (customer_id, payment_date)")
+
+
+def downgrade():
+    conn = op.get_bind()
+    if conn.dialect.name != 'postgresql':
+        op.execute(f"INSERT INTO fee ({FEE_COLUMNS}) SELECT {FEE_COLUMNS} FROM fee_archive")
+        op.drop_index('ix_fee_archive_customer_id_payment_date', table_name='fee_archive')
+        op.drop_table('fee_archive')
+        return
+
+    # Back to one plain table holding the hot and the archived payments
+    op.execute("""
+        CREATE TABLE fee_plain (
+            id integer NOT NULL DEFAULT nextval('fee_id_seq') PRIMARY KEY,
+            customer_id integer NOT NULL REFERENCES customer (id),
+            amount double precision NOT NULL,
+            payment_type varchar(20) NOT NULL,
+            description varchar(200),
+            payment_date timestamp without time zone,
+            collected_by integer NOT NULL REFERENCES "user" (id)
+        )
+    """)
+    op.execute(f"INSERT INTO fee_plain ({FEE_COLUMNS}) SELECT {FEE_COLUMNS} FROM fee")
+    op.execute(f"INSERT INTO fee_plain ({FEE_COLUMNS}) SELECT {FEE_COLUMNS} FROM fee_archive")
+    op.execute("ALTER SEQUENCE fee_id_seq OWNED BY fee_plain.id")
+    op.execute("DROP TABLE fee_archive CASCADE")
+    op.execute("DROP TABLE fee CASCADE")
+    op.execute("ALTER TABLE fee_plain RENAME TO fee")
+    op.execute("ALTER TABLE fee RENAME CONSTRAINT fee_plain_pkey TO fee_pkey")
+    op.execute("CREATE INDEX ix_fee_customer_id_payment_date ON fee (customer_id, payment_date)")
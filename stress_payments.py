@@ -0,0 +1,176 @@
+"""Post payments and membership extensions concurrently and check no money is lost.
+
+Several threads, each with its own test client (one per front-desk terminal),
+hammer a handful of customers through the real /add_fee and
+/extend_membership routes. Afterwards every customer's balance and expiry
+must match what the fee ledger says happened:
+
+    pending_amount == opening balance + extension charges - sum(fees)
+    membership_end == opening expiry + 30 days * months extended
+
+and the daily revenue rollup must still match the ledger. `--legacy` replays
+the old read-modify-write payment posting next to it, to show the lost updates
+the atomic statement prevents.
+
+Runs against a throwaway SQLite database unless BENCH_DATABASE_URL is set;
+every table in it is dropped, so it must be SQLite or a database whose name
+contains 'bench' or 'test'.
+
+    python stress_payments.py [--threads 8] [--operations 200] [--customers 5] [--legacy]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bench_database import throwaway_database_url
+
+STRESS_DB = os.path.join(tempfile.gettempdir(), 'gym_stress_payments.db')
+OPENING_BALANCE = 1_000_000.0
+EXTENSION_MONTHLY_FEE = 1500  # basic package, no extras
+
+
+def run_stress(threads, operations, customers, legacy):
+    os.environ['DATABASE_URL'] = throwaway_database_url(STRESS_DB)
+    os.environ['SCHEDULER_MODE'] = 'off'
+    os.environ['SMS_DISPATCHER'] = 'off'
+    os.environ['SMS_TRANSPORT'] = 'fake'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ.setdefault('SLOW_QUERY_MS', '10000')  # lock waits are expected here
+
+    import app as gym
+    app, db = gym.app, gym.db
+    app.config['WTF_CSRF_ENABLED'] = False
+
+    opening_end = datetime.utcnow().replace(microsecond=0) + timedelta(days=10)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add(gym.User(username='desk', password='desk', is_admin=True))
+        for index in range(customers):
+            db.session.add(gym.Customer(name=f'Stress Member {index}', phone=f'90000000{index:02d}',
+                                        package_type='basic', membership_end=opening_end,
+                                        pending_amount=OPENING_BALANCE))
+        db.session.commit()
+        customer_ids = [customer.id for customer in gym.Customer.query.all()]
+
+    months_extended = {customer_id: 0 for customer_id in customer_ids}
+    counters = {'payments': 0, 'extensions': 0, 'conflicts': 0, 'errors': 0}
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def terminal(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        client.post('/login', data={'username': 'desk', 'password': 'desk'})
+        start.wait()
+        for _ in range(operations):
+            customer_id = rng.choice(customer_ids)
+            if rng.random() < 0.8:
+                response = client.post(f'/add_fee/{customer_id}', data={
+                    'amount': str(rng.choice([100, 250, 500, 750])), 'payment_type': 'monthly'})
+                outcome = 'payments' if response.status_code == 302 else 'errors'
+                with lock:
+                    counters[outcome] += 1
+                continue
+            months = rng.randint(1, 3)
+            response = client.post(f'/extend_membership/{customer_id}', data={
+                'extension_period': str(months), 'initial_payment': str(rng.choice([0, 500]))})
+            location = response.headers.get('Location', '')
+            with lock:
+                if response.status_code != 302:
+                    counters['errors'] += 1
+                elif '/extend_membership/' in location:
+                    counters['conflicts'] += 1
+                else:
+                    counters['extensions'] += 1
+                    months_extended[customer_id] += months
+
+    started = time.perf_counter()
+    workers = [threading.Thread(target=terminal, args=(seed,)) for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    print(f"{threads} terminals x {operations} operations on {customers} customers in {elapsed:.2f}s: "
+          f"{counters['payments']} payments, {counters['extensions']} extensions, "
+          f"{counters['conflicts']} extension conflicts (retry needed), {counters['errors']} errors")
+
+    failures = counters['errors']
+    with app.app_context():
+        for customer_id in customer_ids:
+            customer = db.session.get(gym.Customer, customer_id)
+            paid = db.session.query(db.func.coalesce(db.func.sum(gym.Fee.amount), 0)) \
+                .filter(gym.Fee.customer_id == customer_id).scalar()
+            months = months_extended[customer_id]
+            expected_pending = OPENING_BALANCE + EXTENSION_MONTHLY_FEE * months - paid
+            expected_end = opening_end + timedelta(days=30 * months)
+            ok = abs(customer.pending_amount - expected_pending) < 0.005 and customer.membership_end == expected_end
+            failures += not ok
+            print(f"  customer {customer_id}: pending {customer.pending_amount:.2f} (expected {expected_pending:.2f}), "
+                  f"+{months} month(s) {'ok' if ok else 'MISMATCH'}")
+
+    result = app.test_cli_runner().invoke(gym.verify_revenue)
+    print(f"  {result.output.strip()}")
+    failures += result.exit_code != 0
+
+    if legacy:
+        lost, posted = run_legacy(gym, threads, operations, customer_ids)
+        print(f"  legacy read-modify-write posting: ₹{lost:.0f} of ₹{posted:.0f} paid never reduced a balance")
+
+    return failures
+
+
+def run_legacy(gym, threads, operations, customer_ids):
+    """Replay the old add_fee balance update (read, subtract in Python, write back)"""
+    app, db = gym.app, gym.db
+    with app.app_context():
+        db.session.execute(db.update(gym.Customer).values(pending_amount=OPENING_BALANCE))
+        db.session.commit()
+    posted = [0.0]
+    lock = threading.Lock()
+    start = threading.Barrier(threads)
+
+    def terminal(seed):
+        rng = random.Random(seed)
+        start.wait()
+        for _ in range(operations):
+            amount = rng.choice([100, 250, 500, 750])
+            with app.app_context():
+                customer = db.session.get(gym.Customer, rng.choice(customer_ids))
+                pending = customer.pending_amount
+                time.sleep(0)  # let another terminal read the same balance
+                customer.pending_amount = pending - amount
+                db.session.commit()
+            with lock:
+                posted[0] += amount
+
+    workers = [threading.Thread(target=terminal, args=(seed,)) for seed in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    with app.app_context():
+        remaining = db.session.query(db.func.sum(gym.Customer.pending_amount)).scalar()
+    # Every lost update leaves money owed that was actually paid
+    return remaining - (OPENING_BALANCE * len(customer_ids) - posted[0]), posted[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, default=8, help='Concurrent terminals.')
+    parser.add_argument('--operations', type=int, default=200, help='Requests per terminal.')
+    parser.add_argument('--customers', type=int, default=5, help='Customers shared by all terminals.')
+    parser.add_argument('--legacy', action='store_true', help='Also run the old read-modify-write posting.')
+    args = parser.parse_args()
+
+    failures = run_stress(args.threads, args.operations, args.customers, args.legacy)
+    print("PASS" if not failures else f"FAIL ({failures} problem(s))")
+    sys.exit(1 if failures else 0)